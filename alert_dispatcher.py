@@ -0,0 +1,106 @@
+# alert_dispatcher.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FanOutReport:
+    """Collects the outcome of one alert fan-out while its downlinks complete."""
+
+    def __init__(self, started, total, skipped):
+        self.started = started
+        self.total = total
+        self.skipped = skipped
+        self.sent = 0
+        self.failed = []  # (node, message)
+        self.first_enqueue_ms = None
+        self.last_enqueue_ms = None
+
+    @property
+    def done(self):
+        return self.sent + len(self.failed) == self.total
+
+    def record(self, node, success, message):
+        if success:
+            elapsed_ms = (time.monotonic() - self.started) * 1000
+            if self.first_enqueue_ms is None:
+                self.first_enqueue_ms = elapsed_ms
+            self.last_enqueue_ms = elapsed_ms
+            self.sent += 1
+        else:
+            self.failed.append((node, message))
+
+    def __str__(self):
+        summary = f"{self.sent} sent, {len(self.failed)} failed, {self.skipped} deduplicated"
+        if self.first_enqueue_ms is not None:
+            summary += f", first enqueue {self.first_enqueue_ms:.0f} ms, last enqueue {self.last_enqueue_ms:.0f} ms"
+        return summary
+
+
+class AlertDispatcher:
+    """Sends the same downlink to many nodes in parallel.
+
+    At most `max_workers` downlinks are enqueued at the same time. A node that
+    already got the same payload within `dedup_seconds` is skipped, so a burst of
+    alerts does not queue the same command many times. A failing device only
+    shows up in the report, the rest of the batch still goes out.
+    """
+
+    def __init__(self, chirpstack_client, max_workers=8, dedup_seconds=30, timeout=10):
+        self.chirpstack_client = chirpstack_client
+        self.dedup_seconds = dedup_seconds
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="alert")
+        self.last_sent = {}  # (dev_eui, data) -> time.monotonic() of the last fan-out
+        self.lock = threading.Lock()
+
+    def _claim(self, dev_eui, data, now):
+        key = (dev_eui, data)
+        with self.lock:
+            last = self.last_sent.get(key)
+            if last is not None and now - last < self.dedup_seconds:
+                return False
+            self.last_sent[key] = now
+            return True
+
+    def dispatch(self, nodes, data, on_sent=None, on_done=None):
+        """Starts the fan-out and returns immediately.
+
+        `on_sent(node, success, message)` is called for every device and
+        `on_done(report)` once the whole batch finished, both from worker threads.
+        """
+        started = time.monotonic()
+        targets = [node for node in nodes if self._claim(node.dev_eui, data, started)]
+        report = FanOutReport(started, len(targets), len(nodes) - len(targets))
+        if not targets:
+            if on_done:
+                on_done(report)
+            return report
+
+        report_lock = threading.Lock()
+
+        def send(node):
+            try:
+                success, message = self.chirpstack_client.enqueue_downlink(node.dev_eui, data, timeout=self.timeout)
+            except Exception as e:
+                success, message = False, f"Failed to enqueue command: {e}"
+            if not success:
+                # Let the next alert retry this node
+                with self.lock:
+                    self.last_sent.pop((node.dev_eui, data), None)
+            with report_lock:
+                report.record(node, success, message)
+                finished = report.done
+            if on_sent:
+                on_sent(node, success, message)
+            if finished and on_done:
+                on_done(report)
+
+        for node in targets:
+            self.executor.submit(send, node)
+        return report
+
+    def shutdown(self, wait=False):
+        """Stops the workers; queued downlinks are dropped, unless `wait` lets them finish first."""
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,208 @@
+# alert_rules.py
+
+import json
+import operator
+import string
+import threading
+import time
+
+ANY = None  # Wildcard key of the dispatch table
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "contains": operator.contains,
+    "in": lambda value, options: value in options,
+}
+
+_MISSING = object()
+
+
+def default_rules(responder_types, response="FF"):
+    """The built-in rules: the message keywords of our firmware, alerts answered by the responders."""
+    return [
+        {"name": "Alert Response", "conditions": [["object.message", "contains", "Alert"]],
+         "alert": "Alert triggered by device {device_name} - {message}",
+         "downlink": {"device_types": list(responder_types), "payload": response}},
+        {"name": "Status", "conditions": [["object.message", "contains", "Status"]],
+         "alert": "Status message from device {device_name} - {message}"},
+        {"name": "Data", "conditions": [["object.message", "contains", "Data"]],
+         "alert": "Data message from device {device_name} - {message}"},
+        {"name": "Reset", "conditions": [["object.message", "contains", "Reset"]],
+         "alert": "Reset message from device {device_name} - {message}"},
+    ]
+
+
+def load_rules(rules):
+    """Returns the rule list of a config value: a list of rules, or the path of a JSON file with one."""
+    if isinstance(rules, str):
+        with open(rules, 'r') as file:
+            return json.load(file)
+    return rules
+
+
+class _Context(dict):
+    def __missing__(self, key):
+        return "N/A"
+
+
+def _compile_path(path):
+    keys = [int(key) if key.isdigit() else key for key in path.split('.')]
+
+    def resolve(data):
+        for key in keys:
+            try:
+                data = data[key]
+            except (KeyError, IndexError, TypeError):
+                return _MISSING
+        return data
+
+    return resolve
+
+
+def _compile_condition(condition):
+    field, op, *value = condition
+    resolve = _compile_path(field)
+    if op == "exists":
+        return lambda data: resolve(data) is not _MISSING
+    if op not in OPERATORS or len(value) != 1:
+        raise ValueError(f"invalid condition {condition}")
+    compare = OPERATORS[op]
+    expected = value[0]
+
+    def check(data):
+        actual = resolve(data)
+        if actual is _MISSING:
+            return False
+        try:
+            return compare(actual, expected)
+        except TypeError:
+            return False  # e.g. a threshold on a field that is not a number
+
+    return check
+
+
+def _check_template(template):
+    # Syntax errors and positional fields are reported when the rule is loaded; a format spec that does not
+    # fit the value of an uplink (e.g. `.1f` on a missing field) can only fail later, see Rule.format_alert
+    if not isinstance(template, str):
+        raise ValueError("alert must be a string")
+    for _, field, _, _ in string.Formatter().parse(template):
+        if field is not None and (field == "" or field.split('.')[0].split('[')[0].isdigit()):
+            raise ValueError(f"alert template {template!r} has a positional field, name it")
+    return template
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return value if isinstance(value, list) else [value]
+
+
+class Rule:
+    """One compiled rule. See RuleSet for the format."""
+
+    def __init__(self, index, spec):
+        self.index = index
+        self.name = spec.get('name', f"rule {index + 1}")
+        try:
+            self.fports = _as_list(spec.get('fport'))
+            self.device_types = _as_list(spec.get('device_types'))
+            dev_euis = _as_list(spec.get('dev_euis'))
+            self.dev_euis = {dev_eui.lower() for dev_eui in dev_euis} if dev_euis else None
+            self.conditions = [_compile_condition(condition) for condition in spec.get('conditions', [])]
+            self.alert = _check_template(spec['alert']) if spec.get('alert') is not None else None
+            downlink = spec.get('downlink')
+            self.downlink_types = downlink.get('device_types', []) if downlink else None
+            self.downlink_payload = bytes.fromhex(downlink.get('payload', "")) if downlink else None
+            self.suppress_seconds = spec.get('suppress_seconds', 0)
+            self.suppress_scope = spec.get('suppress_scope', "device")
+            self.stop = spec.get('stop', True)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid alert rule {self.name}: {e}") from None
+        if self.suppress_scope not in ("device", "application"):
+            raise ValueError(f"Invalid alert rule {self.name}: suppress_scope must be device or application")
+
+    def matches(self, data, dev_eui):
+        if self.dev_euis is not None and (dev_eui or "").lower() not in self.dev_euis:
+            return False
+        for condition in self.conditions:
+            if not condition(data):
+                return False
+        return True
+
+    def format_alert(self, data, device_name, dev_eui):
+        context = _Context(data.get('object') or {})
+        context.update(device_name=device_name, dev_eui=dev_eui, f_port=data.get('fPort'), rule=self.name,
+                       message=(data.get('object') or {}).get('message', 'No message'))
+        try:
+            return self.alert.format_map(context)
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+            # A bad template must not cost the uplink its downlinks, event row and log line
+            print(f"Error formatting the alert of rule {self.name}: {e}")
+            return self.alert
+
+    def responders(self, node_manager):
+        return node_manager.get_nodes_by_type(*self.downlink_types)
+
+
+class RuleSet:
+    """Decides what an uplink means, compiled once from declarative rules.
+
+    A rule is a dict with optional filters `fport`, `device_types` (type of the
+    sending node) and `dev_euis`, plus `conditions`, a list of
+    `[path, op, value]` where `path` is a dotted path into the uplink event
+    (e.g. `object.temperature` or `rxInfo.0.rssi`) and `op` one of
+    `==, !=, <, <=, >, >=, contains, in, exists`. Actions: `alert`, a template
+    for the alert list (`{device_name}`, `{dev_eui}`, `{f_port}`, `{message}`
+    and the decoded fields), `downlink` (`device_types` and hex `payload`) for
+    a fan-out to the application's nodes of those types, and `suppress_seconds`,
+    a window in which the rule does not fire again for the same device (or the
+    whole application with `suppress_scope: "application"`). Rules are checked
+    in order and the first match stops unless it sets `stop: false`.
+
+    The candidate rules per (fPort, device type) are merged once, on the first
+    uplink with that combination, so an uplink only checks the rules that can
+    apply to it.
+    """
+
+    def __init__(self, rules):
+        self.rules = [Rule(index, spec) for index, spec in enumerate(rules)]
+        self.table = {}  # (fport, device_type) -> [Rule], filled lazily
+        self.suppressed_until = {}  # (rule index, dev_eui or None) -> time.monotonic()
+        self.lock = threading.Lock()
+
+    def candidates(self, fport, device_type):
+        key = (fport, device_type)
+        rules = self.table.get(key)
+        if rules is None:
+            rules = [rule for rule in self.rules
+                     if (rule.fports is ANY or fport in rule.fports)
+                     and (rule.device_types is ANY or device_type in rule.device_types)]
+            self.table[key] = rules
+        return rules
+
+    def match(self, data, dev_eui, device_type):
+        """Returns the rules that fire for an uplink event, recording their suppression windows."""
+        fired = []
+        now = None
+        for rule in self.candidates(data.get('fPort'), device_type):
+            if not rule.matches(data, dev_eui):
+                continue
+            if rule.suppress_seconds:
+                now = now or time.monotonic()
+                key = (rule.index, dev_eui if rule.suppress_scope == "device" else None)
+                with self.lock:
+                    if self.suppressed_until.get(key, 0) > now:
+                        if rule.stop:
+                            break
+                        continue
+                    self.suppressed_until[key] = now + rule.suppress_seconds
+            fired.append(rule)
+            if rule.stop:
+                break
+        return fired
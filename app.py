@@ -1,54 +1,201 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-from node_manager import NodeManager
+from tkinter import ttk, messagebox, filedialog
 from chirpstack_client import ChirpStackClient
+from async_chirpstack_client import AsyncChirpStackClient
+from completion_queue import CompletionQueue
+from ui_update_bus import UIUpdateBus
+from virtual_list import VirtualList, FileHistory
+from event_engine import ALERT_MARKER, EventEngine, get_time, load_applications
+from device_snapshot import DeviceSnapshot, SNAPSHOT_FILE
+from bulk_provisioner import BulkProvisioner, load_manifest, validate_manifest
+import channel_manager
+import metrics
+import re
+from collections import Counter
+import time
 from end_node import EndNode  # Importing EndNode class
 import grpc  # Import grpc for handling exceptions
 import threading
 from command_dict import COMMANDS
-import paho.mqtt.client as mqtt
-import json
+from device_types import DEVICE_TYPES
 from datetime import datetime
 
-DEVICE_TYPES = [
-    "LiDAR unit",
-    "LiDAR Simulated Unit",
-    "Sound Unit",
-    "Wearable Alert Unit",
-    "Blank Unit"
-]
+DEVICE_PAGE_WORKERS = 4  # Concurrent page requests once the device count is known
+
+EVENT_TYPES = ["up", "join", "status", "ack", "txack", "log", "downlink"]
 
 class App:
-    def __init__(self, master, devices, chirpstack_client, app_id, tenant_id):
+    def __init__(self, master, devices, chirpstack_client, app_id, tenant_id, config=None):
         self.master = master
-        self.master.title("Main Application")
-        self.node_manager = NodeManager()
-        self.node_manager.load_nodes_from_chirpstack(devices)
         self.selected_node = None
         self.chirpstack_client = chirpstack_client
-        self.app_id = app_id  # Store App ID from configuration
-        self.tenant_id = tenant_id  # Store Tenant ID from configuration
-        self.device_profiles = self.fetch_device_profiles()
+        self.config = config or {}  # Optional settings from config.json
+        # All ChirpStack calls from the UI go through the async client, results come back via the completion queue
+        self.completion_queue = CompletionQueue(self.master)
+        self.async_client = AsyncChirpStackClient(chirpstack_client, self.completion_queue)
+        # MQTT handling, alert fan-out and logging live in the engine, the window is one of its listeners
+        self.engine = EventEngine(chirpstack_client, self.config)
+        # Every configured application is served, the one from the configuration dialog is shown first
+        for settings in load_applications({**self.config, 'app_id': app_id, 'tenant_id': tenant_id}):
+            self.engine.add_application(settings['app_id'], settings['tenant_id'], settings.get('name'),
+                                        settings['alert'], settings['rules'])
+        if app_id not in self.engine.applications:
+            self.engine.add_application(app_id, tenant_id, alert=self.config.get('alert'),
+                                        rules=self.config.get('rules'))
+        # Nodes and profiles start from the last-known snapshot, the server is asked in the background
+        self.device_snapshot = DeviceSnapshot(self.config.get('device_snapshot', SNAPSHOT_FILE),
+                                              chirpstack_client.server)
+        for application in self.engine.applications.values():
+            if application.app_id != app_id and self.device_snapshot.has_devices(application.app_id):
+                application.node_manager.load_nodes_from_chirpstack(self.device_snapshot.devices(application.app_id))
+        self.select_application(self.engine.applications[app_id])
+        self.node_manager.load_nodes_from_chirpstack(devices)
+        self.link_quality = self.engine.link_quality
+        self.event_store = self.engine.event_store
+        self.downlink_tracker = self.engine.downlink_tracker
+        self.broadcast_scheduler = self.engine.broadcast_scheduler
+        self.device_profiles = self.device_snapshot.profiles(app_id)
+        self.fetch_device_profiles()
         self.start_periodic_refresh()  # Refresh every 30 seconds
         self.create_widgets()
-        # Set up MQTT client
-        self.mqtt_client = mqtt.Client()
-        self.mqtt_client.on_connect = self.on_connect
-        self.mqtt_client.on_message = self.on_message
-        self.mqtt_client.connect("192.168.1.131", 1883, 60)
-        self.mqtt_client.loop_start()
-        self.log_file = "events_log.txt"
-        self.start_logging()
+        self.update_title()
+        # Events from the MQTT workers reach the widgets in one batch per frame
+        self.ui_bus = UIUpdateBus(self.master, flush_ms=self.config.get('ui_flush_ms', 75))
+        self.ui_bus.add_channel("events", self.add_events_to_listbox)
+        self.ui_bus.add_channel("alerts", self.add_alerts_to_listbox)
+        self.engine.subscribe(self)
+        self.stream_devices()  # Load the rest of the fleet in the background
+        self.start_device_sync()
+        self.engine.start()
 
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def fetch_device_profiles(self):
-        try:
-            profiles = self.chirpstack_client.get_device_profiles(self.tenant_id)
-            return [(profile.id, profile.name) for profile in profiles]
-        except grpc.RpcError as e:
-            messagebox.showerror("Error", f"Failed to fetch device profiles: {e.details()}")
-            return []
+        application = self.application
+
+        def on_done(profiles):
+            # Ignore profiles that arrive after the user switched to another application
+            profile_list = [(profile.id, profile.name) for profile in profiles]
+            self.device_snapshot.set_profiles(application.app_id, profile_list)
+            self.device_snapshot.save_in_background()
+            if application is self.application:
+                self.device_profiles = profile_list
+
+        def on_error(e):
+            messagebox.showerror("Error", f"Failed to fetch device profiles: {self.rpc_error_details(e)}")
+
+        self.async_client.get_device_profiles(self.tenant_id, max_workers=DEVICE_PAGE_WORKERS,
+                                              on_done=on_done, on_error=on_error)
+
+    def rpc_error_details(self, error):
+        if isinstance(error, grpc.RpcError) and error.details():
+            return error.details()
+        return str(error) or "Unknown error"
+
+    def select_application(self, application):
+        """Switches the window to another application; the engine keeps serving all of them."""
+        self.application = application
+        self.app_id = application.app_id
+        self.tenant_id = application.tenant_id
+        self.node_manager = application.node_manager
+        self.device_sync = application.device_sync
+
+    def on_application_selected(self, event):
+        self.select_application(self.engine.applications[self.application_names[self.application_var.get()]])
+        self.device_var.set('')
+        self.update_selected_node(None)
+        self.update_combobox()
+        self.update_title()
+        self.device_profiles = self.device_snapshot.profiles(self.app_id)
+        self.fetch_device_profiles()  # Profiles belong to the application's tenant
+
+    def stream_devices(self):
+        """Fetches every device page of every application in a background thread and adds each page as it arrives."""
+        def fetch_pages(application):
+            # Nodes from the snapshot stay on screen until the listing is complete, then are replaced at once
+            from_snapshot = self.device_snapshot.has_devices(application.app_id)
+            devices = []
+            try:
+                pages = self.chirpstack_client.iter_devices(application.app_id, max_workers=DEVICE_PAGE_WORKERS,
+                                                            timeout=self.async_client.default_timeout)
+                for index, page in enumerate(pages):
+                    if from_snapshot:
+                        devices.extend(page)
+                    else:
+                        self.completion_queue.put(self.on_device_page, application, index, page)
+                if from_snapshot:
+                    self.completion_queue.put(self.on_device_page, application, 0, devices)
+                self.completion_queue.put(self.save_device_snapshot, application)
+            except grpc.RpcError as e:
+                self.completion_queue.put(self.on_device_listing_error, application, e)
+
+        for application in self.engine.applications.values():
+            threading.Thread(target=fetch_pages, args=(application,), daemon=True).start()
+
+    def on_device_page(self, application, index, page):
+        # The first page replaces whatever the configuration dialog loaded
+        if index == 0:
+            application.node_manager.load_nodes_from_chirpstack(page)
+        else:
+            application.node_manager.add_devices(page)
+        if application is self.application:
+            self.update_combobox()
+
+    def on_device_listing_error(self, application, error):
+        # Also how a wrong token shows up when the window was opened from the snapshot
+        message = f"Failed to list the devices of {application}: {self.rpc_error_details(error)}"
+        if self.device_snapshot.is_stale(application.app_id):
+            message += "\nThe nodes shown are from the last snapshot and may be out of date."
+        messagebox.showerror("Error", message)
+
+    def save_device_snapshot(self, application):
+        self.device_snapshot.set_devices(application.app_id, application.node_manager.get_all_nodes())
+        self.device_snapshot.save_in_background()
+        self.update_title()
+
+    def update_title(self):
+        """Flags the window while its nodes are the snapshot's and no listing has confirmed them."""
+        stale = self.device_snapshot.is_stale(self.app_id)
+        self.master.title("Main Application (nodes from snapshot)" if stale else "Main Application")
+
+    def start_device_sync(self):
+        """Schedules the next background reconciliation with the server's device lists."""
+        interval = self.config.get('sync_interval', 60)
+        if interval:
+            self.sync_timer = self.master.after(int(interval * 1000), self.sync_devices)
+
+    def sync_devices(self):
+        def fetch_changes(timeout=None):
+            return [(application, application.device_sync.fetch_changes(timeout=timeout))
+                    for application in list(self.engine.applications.values())]
+
+        def on_error(e):
+            print(f"Error syncing devices: {self.rpc_error_details(e)}")
+            self.start_device_sync()
+
+        self.async_client.submit(fetch_changes, on_done=self.on_device_changes, on_error=on_error)
+
+    def on_device_changes(self, results):
+        for application, changes in results:
+            application.device_sync.apply(changes)
+            if not (changes.added or changes.removed or changes.modified):
+                continue
+            self.save_device_snapshot(application)
+            timestamp = self.get_time()
+            self.add_event_to_listbox(f"{timestamp} - Device sync {application}: {changes}")
+            if application is not self.application:
+                continue
+            # The combobox is only rebuilt when the shown node list actually changed
+            self.update_combobox()
+            if self.selected_node and self.selected_node.dev_eui in changes.removed:
+                self.device_var.set('')
+                self.update_selected_node(None)
+            elif self.selected_node:
+                node = self.node_manager.get_node(self.selected_node.dev_eui)
+                if node is not self.selected_node:
+                    self.device_var.set(self.node_label(node))
+                    self.update_selected_node(None)
+        self.start_device_sync()
 
     def start_periodic_refresh(self, interval_ms=10000):
         """Starts periodic refresh of device data every `interval_ms` milliseconds."""
@@ -72,11 +219,21 @@ class App:
         tk.Label(self.master, text="Select Node").grid(row=0, column=0, pady=10)
         self.device_var = tk.StringVar()
         self.device_dropdown = ttk.Combobox(self.master, textvariable=self.device_var)
-        self.device_dropdown['values'] = [str(node) for node in self.node_manager.get_all_nodes()]
+        self.update_combobox()
         self.device_dropdown.grid(row=0, column=1, pady=10, columnspan=2, sticky="ew")
 
         self.device_dropdown.bind("<<ComboboxSelected>>", self.update_selected_node)
 
+        # Only shown when config.json lists more than one application
+        if len(self.engine.applications) > 1:
+            self.application_names = {str(application): application.app_id
+                                      for application in self.engine.applications.values()}
+            self.application_var = tk.StringVar(value=str(self.application))
+            application_dropdown = ttk.Combobox(self.master, textvariable=self.application_var, state="readonly")
+            application_dropdown['values'] = list(self.application_names)
+            application_dropdown.grid(row=0, column=3, pady=10, padx=10)
+            application_dropdown.bind("<<ComboboxSelected>>", self.on_application_selected)
+
         # Node Data
         node_data_frame = tk.Frame(self.master)
         node_data_frame.grid(row=1, column=0, padx=10, pady=10, sticky="n")
@@ -104,6 +261,13 @@ class App:
         self.last_seen_label = tk.Label(node_data_frame, text="Last Seen at: ")
         self.last_seen_label.grid(row=7, column=0, sticky="w")
 
+        self.delivery_label = tk.Label(node_data_frame, text="Last Downlink: ")
+        self.delivery_label.grid(row=8, column=0, sticky="w")
+
+        # Per-minute RSSI of the selected node, min/max as bars and the average as a line
+        self.trend_canvas = tk.Canvas(node_data_frame, width=240, height=100, bg="white")
+        self.trend_canvas.grid(row=9, column=0, columnspan=2, pady=5)
+
         # Buttons
         button_frame = tk.Frame(self.master)
         button_frame.grid(row=1, column=1, columnspan=2, padx=10, pady=10, sticky="n")
@@ -124,27 +288,59 @@ class App:
         self.remove_button = ttk.Button(button_frame, text="Remove Node", command=self.remove_selected_node)
         self.remove_button.grid(row=1, column=1, padx=5, pady=5)
 
+        self.search_button = ttk.Button(button_frame, text="Search Events", command=self.open_event_search_dialog)
+        self.search_button.grid(row=1, column=2, padx=5, pady=5)
+
+        self.bulk_button = ttk.Button(button_frame, text="Bulk Provision", command=self.open_bulk_provision_dialog)
+        self.bulk_button.grid(row=2, column=0, padx=5, pady=5)
+
+        self.broadcast_button = ttk.Button(button_frame, text="Broadcast", command=self.open_broadcast_dialog)
+        self.broadcast_button.grid(row=2, column=1, padx=5, pady=5)
+
+        self.diagnostics_button = ttk.Button(button_frame, text="Diagnostics", command=self.open_diagnostics_dialog)
+        self.diagnostics_button.grid(row=2, column=2, padx=5, pady=5)
+
         # Alerts Listbox
         alert_frame = tk.Frame(self.master)
         alert_frame.grid(row=1, column=3, rowspan=4, padx=10, pady=10)
 
         tk.Label(alert_frame, text="Alerts").pack()
-        self.alert_listbox = tk.Listbox(alert_frame, width=30, height=20)
-        self.alert_listbox.pack(expand=True)
+        view_capacity = self.config.get('view_capacity', 5000)
+        # Alerts are logged behind ALERT_MARKER, which is cut off again when older ones are paged in
+        self.alert_view = VirtualList(alert_frame, width=30, height=20, capacity=view_capacity,
+                                      history=FileHistory(self.engine.log_file,
+                                                          lambda line: line.startswith(ALERT_MARKER),
+                                                          self.engine.log_writer.flush,
+                                                          lambda line: line[len(ALERT_MARKER):]))
+        self.alert_view.pack(expand=True)
 
         # Log Listbox
         log_frame = tk.Frame(self.master)
         log_frame.grid(row=2, column=0, columnspan=4, padx=10, pady=10, sticky="ew")
 
         tk.Label(log_frame, text="Log", font=("Arial", 12, "bold")).pack()
-        self.log_listbox = tk.Listbox(log_frame, width=100, height=10)
-        self.log_listbox.pack(fill="both", expand=True)
+        # Event rows start with their timestamp, unlike alerts and the start/close markers
+        self.log_view = VirtualList(log_frame, width=100, height=10, capacity=view_capacity,
+                                    history=FileHistory(self.engine.log_file, lambda line: line[:1].isdigit(),
+                                                        self.engine.log_writer.flush))
+        self.log_view.pack(fill="both", expand=True)
 
         # Disable buttons initially
         self.disable_command_buttons()
 
     def update_combobox(self):
-        self.device_dropdown['values'] = [str(node) for node in self.node_manager.get_all_nodes()]
+        nodes = self.node_manager.get_all_nodes()
+        names = Counter(node.name for node in nodes)
+        # Names can repeat, those entries carry the dev EUI and selecting one picks that exact node
+        self.device_choices = {}  # Combobox entry -> dev_eui
+        for node in nodes:
+            self.device_choices[self.node_label(node, names[node.name] > 1)] = node.dev_eui
+        self.device_dropdown['values'] = list(self.device_choices)
+
+    def node_label(self, node, duplicate=None):
+        if duplicate is None:
+            duplicate = len(self.node_manager.get_nodes_by_name(node.name)) > 1
+        return f"{node.name} ({node.dev_eui})" if duplicate else str(node)
 
     def enable_command_buttons(self):
         self.status_request_button.config(state=tk.NORMAL)
@@ -157,19 +353,20 @@ class App:
         self.data_collection_button.config(state=tk.DISABLED)
 
     def update_selected_node(self, event):
-        selected_device_name = self.device_var.get()
-        self.selected_node = next(
-            (node for node in self.node_manager.get_all_nodes() if str(node) == selected_device_name), None)
+        selected = self.device_var.get()
+        dev_eui = self.device_choices.get(selected)
+        # A name typed into the combobox selects the first node with that name
+        self.selected_node = (self.node_manager.get_node(dev_eui) if dev_eui
+                              else self.node_manager.get_node_by_name(selected))
         if self.selected_node:
             self.name_label.config(text=f"Name: {self.selected_node.name}")
             self.eui_label.config(text=f"Dev EUI: {self.selected_node.dev_eui}")
             self.device_type_label.config(text=f"Unit Type: {self.selected_node.device_type}")
-            status_info = self.chirpstack_client.get_device_status(self.selected_node.dev_eui, self.app_id)
-            # metrics_info = self.chirpstack_client.get_device_link_metrics(self.selected_node.dev_eui)
-            # self.rssi_label.config(text=f"RSSI: {metrics_info.get('rssi', 'N/A')}")
-            # self.snr_label.config(text=f"SNR: {metrics_info.get('snr', 'N/A')}")
-            self.online_label.config(text=f"Online: {status_info.get('is_online', 'N/A')}")
-            self.last_seen_label.config(text=f"Last Seen at: {status_info.get('last_seen', 'N/A')}")
+            self.async_client.get_device_status(self.selected_node.dev_eui, self.app_id,
+                                                on_done=lambda status_info, node=self.selected_node:
+                                                self.show_device_status(node, status_info))
+            self.show_link_quality()
+            self.show_delivery_state()
             self.enable_command_buttons()
         else:
             self.name_label.config(text="Name: ")
@@ -179,8 +376,74 @@ class App:
             self.snr_label.config(text="SNR: ")
             self.online_label.config(text="Online: ")
             self.last_seen_label.config(text="Last Seen at: ")
+            self.delivery_label.config(text="Last Downlink: ")
+            self.trend_canvas.delete("all")
             self.disable_command_buttons()
 
+    def show_link_quality(self):
+        """Shows the newest RSSI/SNR and the trend of the selected node from the link quality history."""
+        if not self.selected_node:
+            return
+        sample = self.link_quality.latest(self.selected_node.dev_eui)
+        self.rssi_label.config(text=f"RSSI: {sample['rssi']:g}" if sample else "RSSI: N/A")
+        self.snr_label.config(text=f"SNR: {sample['snr']:g}" if sample else "SNR: N/A")
+        self.draw_trend(self.link_quality.rollups(self.selected_node.dev_eui, "minute"))
+
+    def draw_trend(self, buckets):
+        canvas = self.trend_canvas
+        canvas.delete("all")
+        width, height = int(canvas['width']), int(canvas['height'])
+        if not buckets:
+            canvas.create_text(width // 2, height // 2, text="No uplinks yet")
+            return
+        low = min(bucket["rssi_min"] for bucket in buckets)
+        high = max(bucket["rssi_max"] for bucket in buckets)
+        span = max(high - low, 1.0)
+        step = width / max(len(buckets), 1)
+
+        def y(value):
+            return height - 10 - (value - low) / span * (height - 20)
+
+        points = []
+        for i, bucket in enumerate(buckets):
+            x = step * i + step / 2
+            canvas.create_line(x, y(bucket["rssi_min"]), x, y(bucket["rssi_max"]), fill="lightblue", width=max(step - 1, 1))
+            points.extend((x, y(bucket["rssi_avg"])))
+        if len(points) >= 4:
+            canvas.create_line(*points, fill="blue")
+        canvas.create_text(2, 2, anchor="nw", text=f"{high:g} dBm", font=("Arial", 7))
+        canvas.create_text(2, height - 2, anchor="sw", text=f"{low:g} dBm", font=("Arial", 7))
+
+    def on_link_quality(self, dev_eui):
+        # Called from the MQTT workers for every uplink with RSSI/SNR
+        selected_node = self.selected_node
+        if selected_node and selected_node.dev_eui == dev_eui:
+            self.ui_bus.set_latest("link_quality", self.show_link_quality)
+
+    def on_downlink_state(self, dev_eui, state):
+        # Called from the MQTT workers and the tracker thread
+        selected_node = self.selected_node
+        if selected_node and selected_node.dev_eui == dev_eui:
+            self.ui_bus.set_latest("delivery", self.show_delivery_state)
+
+    def show_delivery_state(self):
+        if not self.selected_node:
+            return
+        delivery = self.downlink_tracker.get_delivery(self.selected_node.dev_eui)
+        if delivery is None:
+            self.delivery_label.config(text="Last Downlink: N/A")
+            return
+        state, elapsed, changed_at = delivery
+        changed = datetime.fromtimestamp(changed_at).strftime("%H:%M:%S")
+        self.delivery_label.config(text=f"Last Downlink: {state} after {elapsed:.1f} s ({changed})")
+
+    def show_device_status(self, node, status_info):
+        # Ignore answers that arrive after the user already selected another node
+        if node is not self.selected_node:
+            return
+        self.online_label.config(text=f"Online: {status_info.get('is_online', 'N/A')}")
+        self.last_seen_label.config(text=f"Last Seen at: {status_info.get('last_seen', 'N/A')}")
+
     def select_device(self):
         if self.selected_node:
             print(f"Currently selected node: {self.selected_node.name} (EUI: {self.selected_node.dev_eui})")
@@ -192,29 +455,32 @@ class App:
             confirm = messagebox.askyesno("Confirm Removal",
                                           f"Are you sure you want to remove the node {self.selected_node.name}?")
             if confirm:
-                try:
-                    self.chirpstack_client.remove_device(self.selected_node.dev_eui)
-                    self.node_manager.remove_node(self.selected_node.dev_eui)
-                    dev_eui = self.selected_node.dev_eui
-                    name = self.selected_node.name
-                    device_type = self.selected_node.device_type
-                    self.selected_node = None
-                    self.device_var.set('')
-                    self.eui_label.config(text="Device EUI: Not available")
-                    self.device_type_label.config(text="Device Type: Not available")
-                    messagebox.showinfo("Node Removed", "The node has been removed successfully.")
-
-                    # Log the node removal
-                    timestamp = self.get_time()
-                    event_info = f"{timestamp} Node successfully removed, dev eui - {dev_eui}, name - {name}, Node type - {device_type}"
-                    self.update_combobox()
-                    self.add_event_to_listbox(event_info)
-                except grpc.RpcError as e:
-                    error_details = e.details() if e.details() else "Unknown error"
-                    messagebox.showerror("Removal Error", f"Failed to remove node from server: {error_details}")
+                node = self.selected_node
+                self.async_client.remove_device(
+                    node.dev_eui,
+                    on_done=lambda _: self.on_node_removed(node),
+                    on_error=lambda e: messagebox.showerror(
+                        "Removal Error", f"Failed to remove node from server: {self.rpc_error_details(e)}"))
         else:
             messagebox.showwarning("Removal Error", "Please select a valid device to remove.")
 
+    def on_node_removed(self, node):
+        self.node_manager.remove_node(node.dev_eui)
+        self.link_quality.remove(node.dev_eui)
+        if node is self.selected_node:
+            self.selected_node = None
+            self.device_var.set('')
+            self.eui_label.config(text="Device EUI: Not available")
+            self.device_type_label.config(text="Device Type: Not available")
+            self.disable_command_buttons()
+        messagebox.showinfo("Node Removed", "The node has been removed successfully.")
+
+        # Log the node removal
+        timestamp = self.get_time()
+        event_info = f"{timestamp} Node successfully removed, dev eui - {node.dev_eui}, name - {node.name}, Node type - {node.device_type}"
+        self.update_combobox()
+        self.add_event_to_listbox(event_info)
+
     def open_add_node_dialog(self):
         self.add_node_window = tk.Toplevel(self.master)
         self.add_node_window.title("Add Node")
@@ -257,11 +523,9 @@ class App:
             messagebox.showerror("Error", "Device EUI, Name, Device Type, Device Profile ID, and NwkKey are required.")
             return
 
-        try:
-            self.chirpstack_client.add_device(dev_eui, name, device_profile_id, self.app_id, nwk_key, device_type)
+        def on_done(_):
             messagebox.showinfo("Success", "Node added successfully!")
             self.node_manager.add_node(EndNode(dev_eui, name, device_type))
-            self.device_dropdown['values'] = [str(node) for node in self.node_manager.get_all_nodes()]
             self.add_node_window.destroy()
 
             # Log the node addition
@@ -269,9 +533,158 @@ class App:
             timestamp = self.get_time()
             event_info = f"{timestamp} Node successfully added, dev eui - {dev_eui}, name - {name}, Node type - {device_type}"
             self.add_event_to_listbox(event_info)
-        except grpc.RpcError as e:
-            error_details = e.details() if e.details() else "Unknown error"
-            messagebox.showerror("Error", f"Failed to add node: {error_details}")
+
+        self.async_client.add_device(
+            dev_eui, name, device_profile_id, self.app_id, nwk_key, device_type,
+            on_done=on_done,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to add node: {self.rpc_error_details(e)}"))
+
+    def open_bulk_provision_dialog(self):
+        path = filedialog.askopenfilename(title="Select Device Manifest",
+                                          filetypes=[("Manifest", "*.csv *.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            rows = load_manifest(path)
+        except (OSError, ValueError, AttributeError) as e:
+            messagebox.showerror("Manifest Error", f"Failed to read manifest: {e}")
+            return
+        errors = validate_manifest(rows, self.device_profiles)
+        if errors:
+            shown = "\n".join(f"Row {number}: {message}" for number, message in errors[:20])
+            if len(errors) > 20:
+                shown += f"\n... and {len(errors) - 20} more"
+            messagebox.showerror("Manifest Error", f"Nothing was provisioned, the manifest has errors:\n{shown}")
+            return
+        if not messagebox.askyesno("Bulk Provision", f"Provision {len(rows)} devices?"):
+            return
+
+        self.bulk_button.config(state=tk.DISABLED)
+        provisioner = BulkProvisioner(self.chirpstack_client, self.app_id,
+                                      max_workers=self.config.get('provision_workers', 8))
+
+        def on_result(row, success, message):
+            # Called from the provisioning workers
+            timestamp = self.get_time()
+            if success:
+                self.completion_queue.put(self.node_manager.add_node,
+                                          EndNode(row['dev_eui'], row['name'], row['device_type']))
+                event_info = f"{timestamp} Node successfully added, dev eui - {row['dev_eui']}, name - {row['name']}, Node type - {row['device_type']}"
+            else:
+                event_info = f"{timestamp} Failed to add node, dev eui - {row['dev_eui']}, name - {row['name']}: {message}"
+            self.engine.emit_event(event_info)
+
+        def on_done(report):
+            self.bulk_button.config(state=tk.NORMAL)
+            self.update_combobox()
+            timestamp = self.get_time()
+            self.add_event_to_listbox(f"{timestamp} - Bulk provisioning: {report}")
+            messagebox.showinfo("Bulk Provision", str(report))
+
+        def on_error(e):
+            self.bulk_button.config(state=tk.NORMAL)
+            messagebox.showerror("Bulk Provision", f"Bulk provisioning failed: {self.rpc_error_details(e)}")
+
+        self.async_client.submit(provisioner.provision, rows, on_result=on_result, on_done=on_done, on_error=on_error)
+
+    def open_broadcast_dialog(self):
+        broadcast_window = tk.Toplevel(self.master)
+        broadcast_window.title("Broadcast Command")
+
+        tk.Label(broadcast_window, text="Command:").grid(row=0, column=0, pady=5, padx=5, sticky="w")
+        command_var = tk.StringVar(value=next(iter(COMMANDS)))
+        command_dropdown = ttk.Combobox(broadcast_window, textvariable=command_var, state="readonly")
+        command_dropdown['values'] = list(COMMANDS)
+        command_dropdown.grid(row=0, column=1, pady=5, padx=5)
+
+        target_var = tk.StringVar(value="all")
+        ttk.Radiobutton(broadcast_window, text="All nodes", variable=target_var, value="all").grid(
+            row=1, column=0, pady=5, padx=5, sticky="w")
+        ttk.Radiobutton(broadcast_window, text="Device type:", variable=target_var, value="type").grid(
+            row=2, column=0, pady=5, padx=5, sticky="w")
+        type_var = tk.StringVar(value=DEVICE_TYPES[0])
+        type_dropdown = ttk.Combobox(broadcast_window, textvariable=type_var, state="readonly")
+        type_dropdown['values'] = DEVICE_TYPES
+        type_dropdown.grid(row=2, column=1, pady=5, padx=5)
+        ttk.Radiobutton(broadcast_window, text="Tag (key or key=value):", variable=target_var, value="tag").grid(
+            row=3, column=0, pady=5, padx=5, sticky="w")
+        tag_entry = tk.Entry(broadcast_window)
+        tag_entry.grid(row=3, column=1, pady=5, padx=5)
+
+        jobs_listbox = tk.Listbox(broadcast_window, width=80, height=8)
+        jobs_listbox.grid(row=5, column=0, columnspan=2, padx=5, pady=5)
+
+        def start():
+            target = target_var.get()
+            if target == "type":
+                nodes = self.node_manager.get_nodes_by_type(type_var.get())
+            elif target == "tag":
+                key, _, value = tag_entry.get().strip().partition("=")
+                nodes = self.node_manager.get_nodes_by_tag(key.strip(), value.strip() or None)
+            else:
+                nodes = self.node_manager.get_all_nodes()
+            if not nodes:
+                messagebox.showwarning("Broadcast", "No nodes match the selected target.", parent=broadcast_window)
+                return
+            job = self.broadcast_scheduler.submit(command_var.get(), nodes)
+            timestamp = self.get_time()
+            self.add_event_to_listbox(f"{timestamp} - Broadcast {job.id} {job.command} queued for {len(nodes)} nodes")
+
+        def refresh_jobs():
+            if not broadcast_window.winfo_exists():
+                return
+            jobs_listbox.delete(0, tk.END)
+            jobs_listbox.insert(tk.END, *[str(job) for job in self.broadcast_scheduler.get_jobs()])
+            broadcast_window.after(1000, refresh_jobs)
+
+        ttk.Button(broadcast_window, text="Start Broadcast", command=start).grid(row=4, column=0, columnspan=2,
+                                                                                 pady=10)
+        refresh_jobs()
+
+    def open_diagnostics_dialog(self):
+        diagnostics_window = tk.Toplevel(self.master)
+        diagnostics_window.title("Diagnostics")
+
+        tk.Label(diagnostics_window, text="Metrics (times in ms: count / avg / p50 / p99)").grid(
+            row=0, column=0, pady=5, padx=5, sticky="w")
+        metrics_listbox = tk.Listbox(diagnostics_window, width=100, height=20, font=("Courier", 9))
+        metrics_listbox.grid(row=1, column=0, padx=5, pady=5)
+
+        profiler = self.engine.profiler
+        profiler_var = tk.BooleanVar(value=profiler.running)
+
+        def toggle_profiler():
+            if profiler_var.get():
+                profiler.reset()
+                profiler.start()
+            else:
+                profiler.stop()
+
+        ttk.Checkbutton(diagnostics_window, text="Sampling profiler", variable=profiler_var,
+                        command=toggle_profiler).grid(row=2, column=0, pady=5, padx=5, sticky="w")
+        profile_listbox = tk.Listbox(diagnostics_window, width=100, height=15, font=("Courier", 9))
+        profile_listbox.grid(row=3, column=0, padx=5, pady=5)
+
+        def format_value(name, value):
+            if not isinstance(value, dict):
+                return f"{name:<70} {value}"
+            if not value['count']:
+                return f"{name:<70} 0"
+            return (f"{name:<70} {value['count']} / {value['avg'] * 1000:.2f} / "
+                    f"{value['p50'] * 1000:.2f} / {value['p99'] * 1000:.2f}")
+
+        def refresh():
+            if not diagnostics_window.winfo_exists():
+                return
+            metrics_listbox.delete(0, tk.END)
+            metrics_listbox.insert(tk.END, *[format_value(name, value)
+                                             for name, value in metrics.REGISTRY.snapshot().items()])
+            profile_listbox.delete(0, tk.END)
+            profile_listbox.insert(tk.END, *[f"{share:6.1%} {hits:8} {location}"
+                                             for location, hits, share in profiler.top(15)])
+            diagnostics_window.after(1000, refresh)
+
+        refresh()
 
     # def display_device_status(self, device):
     #     self.device_list.delete(0, tk.END)
@@ -324,175 +737,139 @@ class App:
     #     # Start the refresh loop
     #     refresh()
 
-    def get_time(self):
-        return datetime.now().strftime("%Y-%m-%d, %H:%M:%S")
-
-    def start_logging(self):
-        with open(self.log_file, "a") as f:
-            start_time = self.get_time()
-            f.write(f"Application started at: {start_time}\n")
+    def open_event_search_dialog(self):
+        search_window = tk.Toplevel(self.master)
+        search_window.title("Search Events")
+
+        tk.Label(search_window, text="Device EUI or Name:").grid(row=0, column=0, pady=5, padx=5, sticky="w")
+        device_entry = tk.Entry(search_window)
+        device_entry.grid(row=0, column=1, pady=5, padx=5)
+
+        tk.Label(search_window, text="Event Type:").grid(row=1, column=0, pady=5, padx=5, sticky="w")
+        event_type_var = tk.StringVar()
+        event_type_dropdown = ttk.Combobox(search_window, textvariable=event_type_var, state="readonly")
+        event_type_dropdown['values'] = [""] + EVENT_TYPES
+        event_type_dropdown.grid(row=1, column=1, pady=5, padx=5)
+
+        tk.Label(search_window, text="Last Minutes:").grid(row=2, column=0, pady=5, padx=5, sticky="w")
+        minutes_entry = tk.Entry(search_window)
+        minutes_entry.insert(0, "60")
+        minutes_entry.grid(row=2, column=1, pady=5, padx=5)
+
+        tk.Label(search_window, text="Contains:").grid(row=3, column=0, pady=5, padx=5, sticky="w")
+        text_entry = tk.Entry(search_window)
+        text_entry.grid(row=3, column=1, pady=5, padx=5)
+
+        result_label = tk.Label(search_window, text="")
+        result_label.grid(row=5, column=0, columnspan=2)
+        result_listbox = tk.Listbox(search_window, width=100, height=20)
+        result_listbox.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
+
+        def search():
+            device = device_entry.get().strip()
+            minutes = minutes_entry.get().strip()
+            try:
+                since = time.time() - float(minutes) * 60 if minutes else None
+            except ValueError:
+                messagebox.showerror("Error", "Last Minutes must be a number.", parent=search_window)
+                return
+            # A 16 digit hex value is a dev EUI, anything else a device name
+            is_dev_eui = re.fullmatch(r"[0-9a-fA-F]{16}", device) is not None
+            filters = {
+                "dev_eui": device.lower() if is_dev_eui else None,
+                "device_name": device if device and not is_dev_eui else None,
+                "event_type": event_type_var.get() or None,
+                "since": since,
+                "text": text_entry.get().strip() or None,
+            }
+
+            # Waiting for the writer and querying can take a while, neither runs on the Tk thread
+            def run_query(timeout=None):
+                self.event_store.flush(timeout)
+                started = time.perf_counter()
+                events = self.event_store.query(**filters)
+                return events, (time.perf_counter() - started) * 1000
+
+            def on_done(result):
+                events, elapsed_ms = result
+                if not search_window.winfo_exists():
+                    return
+                result_listbox.delete(0, tk.END)
+                result_listbox.insert(tk.END, *[event["summary"] for event in events])
+                result_label.config(text=f"{len(events)} events in {elapsed_ms:.1f} ms")
+
+            def on_error(e):
+                if search_window.winfo_exists():
+                    result_label.config(text=f"Search failed: {e}")
+
+            result_label.config(text="Searching...")
+            self.async_client.submit(run_query, on_done=on_done, on_error=on_error)
+
+        ttk.Button(search_window, text="Search", command=search).grid(row=4, column=0, columnspan=2, pady=10)
 
-    def log_event(self, event_info):
-        with open(self.log_file, "a") as f:
-            f.write(event_info + "\n")
+    def get_time(self):
+        return get_time()
 
     def on_closing(self):
-        with open(self.log_file, "a") as f:
-            close_time = self.get_time()
-            f.write(f"Application closed at: {close_time}\n")
-            # f.write("Listbox content:\n")
-            # for event in self.device_list.get(0, tk.END):
-            #     f.write(event + "\n")
+        self.engine.stop()
+        self.async_client.shutdown()
+        self.completion_queue.stop()
+        self.ui_bus.stop()
+        channel_manager.close_all()
         self.master.destroy()
 
-    def on_connect(self, client, userdata, flags, rc):
-        print(f"Connected with result code {rc}")
-        client.subscribe("application/+/device/+/event/up")
-        client.subscribe("application/+/device/+/event/join")
-        client.subscribe("application/+/device/+/event/status")
-        client.subscribe("application/+/device/+/event/ack")
-        client.subscribe("application/+/device/+/event/txack")
-        client.subscribe("application/+/device/+/event/log")
-
-    def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        data = json.loads(payload)
-        event_type = topic.split('/')[-1]
-
-        if event_type == "up":
-            self.handle_uplink(data)
-        elif event_type == "join":
-            self.handle_join(data)
-        elif event_type == "status":
-            self.handle_status(data)
-        elif event_type == "ack":
-            self.handle_ack(data)
-        elif event_type == "txack":
-            self.handle_txack(data)
-        elif event_type == "log":
-            self.handle_log(data)
-
-    def handle_uplink(self, data):
-        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
-        message = data.get('object', {}).get('message', 'No message')
-        rssi = data['rxInfo'][0]['rssi'] if 'rxInfo' in data and len(data['rxInfo']) > 0 else 'N/A'
-        snr = data['rxInfo'][0]['snr'] if 'rxInfo' in data and len(data['rxInfo']) > 0 else 'N/A'
-        self.rssi_label.config(text=f"RSSI: {rssi}")
-        self.snr_label.config(text=f"SNR: {snr}")
-
-        if "Alert" in message:
-            alert_info = f"Alert triggered by device {device_name} - {message}"
-            self.master.after(0, lambda: self.add_alert_to_listbox(alert_info))
-
-            # Send 0xFF to Sound Unit and Wearable Alert Unit devices
-            for node in self.node_manager.get_all_nodes():
-                if node.device_type in ["Sound Unit", "Wearable Alert Unit", "LiDAR unit"]:
-                    self.chirpstack_client.enqueue_downlink(node.dev_eui, bytes([0xFF]))
-                    timestamp = self.get_time()
-                    event_info = f"{timestamp} - Downlink sent to device {node.name} - {node.dev_eui}, [0xFF] - Alert Response"
-                    self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
-        elif "Status" in message:
-            status_info = f"Status message from device {device_name} - {message}"
-            self.master.after(0, lambda: self.add_alert_to_listbox(status_info))
-        elif "Data" in message:
-            data_info = f"Data message from device {device_name} - {message}"
-            self.master.after(0, lambda: self.add_alert_to_listbox(data_info))
-        elif "Reset" in message:
-            reset_info = f"Reset message from device {device_name} - {message}"
-            self.master.after(0, lambda: self.add_alert_to_listbox(reset_info))
-
-        timestamp = self.get_time()
-        event_info = f"{timestamp} - Uplink - Device: {device_name}, RSSI: {rssi}, SNR: {snr}, Message: {message}"
-        self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
-    def handle_join(self, data):
-        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
-        dev_eui = data['deviceInfo'].get('devEui', 'Unknown DevEUI')
-
-        timestamp = self.get_time()
-        event_info = f"{timestamp} - Join - Device: {device_name}, DevEUI: {dev_eui}"
-        self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
-    def handle_status(self, data):
-        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
-        margin = data.get('margin', 'N/A')
-        battery = data.get('batteryLevel', 'N/A')
-        external_power = data.get('externalPowerSource', False)
-        last_seen = data.get('lastSeenAt', 'N/A')
-
-        timestamp = self.get_time()
-        event_info = f"{timestamp} - Status - Device: {device_name}, Margin: {margin}, Battery: {battery}, External Power: {external_power}, Last Seen: {last_seen}"
-        self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
-    def handle_ack(self, data):
-        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
-        acknowledged = data.get('acknowledged', False)
-
-        timestamp = self.get_time()
-        event_info = f"{timestamp} - ACK - Device: {device_name}, Acknowledged: {acknowledged}"
-        self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
-    def handle_txack(self, data):
-        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
-
-        timestamp = self.get_time()
-        event_info = f"{timestamp} - TXACK - Device: {device_name}"
-        self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
-    def handle_log(self, data):
-        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
-        log_message = data.get('message', 'No message')
-        level = data.get('level', 'Unknown level')
-
-        timestamp = self.get_time()
-        event_info = f"{timestamp} - Log - Device: {device_name}, Level: {level}, Message: {log_message}"
-        self.master.after(0, lambda: self.add_event_to_listbox(event_info))
-
     def send_status_request(self):
-        if not self.selected_node:
-            messagebox.showwarning("No Device Selected", "Please select a device first.")
-            return
-        data = COMMANDS["STATUS_REQUEST"]  # Status Request
-        success, message = self.chirpstack_client.enqueue_downlink(self.selected_node.dev_eui, data)
-        if success:
-            self.log_and_display_downlink(self.selected_node.name, self.selected_node.dev_eui, data, "Status Request")
-        messagebox.showinfo("Downlink Status", message)
+        self.send_command("STATUS_REQUEST", "Status Request")
 
     def send_reset_request(self):
-        if not self.selected_node:
-            messagebox.showwarning("No Device Selected", "Please select a device first.")
-            return
-        data = COMMANDS["RESET_REQUEST"]  # Reset Request
-        success, message = self.chirpstack_client.enqueue_downlink(self.selected_node.dev_eui, data)
-        if success:
-            self.log_and_display_downlink(self.selected_node.name, self.selected_node.dev_eui, data, "Reset Request")
-        messagebox.showinfo("Downlink Status", message)
+        self.send_command("RESET_REQUEST", "Reset Request")
 
     def send_data_collection_request(self):
+        self.send_command("DATA_COLLECTION_REQUEST", "Data Collection Request")  # Data Collection Trigger (LIDAR Reading)
+
+    def send_command(self, command_key, command):
         if not self.selected_node:
             messagebox.showwarning("No Device Selected", "Please select a device first.")
             return
-        data = COMMANDS["DATA_COLLECTION_REQUEST"]  # Data Collection Trigger (LIDAR Reading)
-        success, message = self.chirpstack_client.enqueue_downlink(self.selected_node.dev_eui, data)
-        if success:
-            self.log_and_display_downlink(self.selected_node.name, self.selected_node.dev_eui, data,
-                                          "Data Collection Request")
-        messagebox.showinfo("Downlink Status", message)
+        node = self.selected_node
+        data = COMMANDS[command_key]
+
+        def on_done(result):
+            success, message = result
+            if success:
+                self.log_and_display_downlink(node.name, node.dev_eui, data, command)
+            messagebox.showinfo("Downlink Status", message)
+
+        self.async_client.enqueue_downlink(
+            node.dev_eui, data,
+            on_done=on_done,
+            on_error=lambda e: messagebox.showerror("Downlink Status", f"Failed to enqueue command: {e}"))
 
     def log_and_display_downlink(self, device_name, dev_eui, bytes_data, command):
         timestamp = self.get_time()
         event_info = f"{timestamp} - Downlink sent to device {device_name} - {dev_eui}, {bytes_data} - {command}"
+        self.event_store.add("downlink", dev_eui, device_name, self.app_id, event_info,
+                             {"command": command, "data": bytes_data.hex()})
         self.add_event_to_listbox(event_info)
 
+    def on_event(self, event_info):
+        self.ui_bus.post("events", event_info)
+
+    def on_alert(self, alert_info):
+        self.ui_bus.post("alerts", alert_info)
+
     def add_event_to_listbox(self, event_info):
-        self.log_listbox.insert(tk.END, event_info)
-        self.log_event(event_info)
+        # The engine logs the row and hands it back through on_event
+        self.engine.emit_event(event_info)
+
+    def add_events_to_listbox(self, events):
+        self.log_view.append(events)
 
     def add_alert_to_listbox(self, alert):
-        self.alert_listbox.insert(tk.END, alert)
-        self.log_event(alert)
+        self.engine.emit_alert(alert)
+
+    def add_alerts_to_listbox(self, alerts):
+        self.alert_view.append(alerts)
 
     def show_alert(self, title, message):
         self.master.after(0, lambda: messagebox.showwarning(title, message))
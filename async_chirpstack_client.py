@@ -0,0 +1,60 @@
+# async_chirpstack_client.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TIMEOUT = 10  # Seconds before a single RPC gives up with DEADLINE_EXCEEDED
+
+
+class AsyncChirpStackClient:
+    """Non-blocking facade over ChirpStackClient.
+
+    Every call runs on a bounded thread pool with a deadline and returns a
+    concurrent.futures.Future. If `on_done`/`on_error` are given, they are called
+    with the result or the exception on the Tk main thread via the completion queue.
+    """
+
+    def __init__(self, client, completion_queue, max_workers=4, default_timeout=DEFAULT_TIMEOUT):
+        self.client = client
+        self.completion_queue = completion_queue
+        self.default_timeout = default_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chirpstack")
+
+    def submit(self, method, *args, on_done=None, on_error=None, timeout=None, **kwargs):
+        kwargs['timeout'] = timeout if timeout is not None else self.default_timeout
+        future = self.executor.submit(method, *args, **kwargs)
+        if on_done or on_error:
+            future.add_done_callback(
+                lambda f: self.completion_queue.put(self._complete, f, on_done, on_error))
+        return future
+
+    def _complete(self, future, on_done, on_error):
+        error = future.exception()
+        if error is None:
+            if on_done:
+                on_done(future.result())
+        elif on_error:
+            on_error(error)
+        else:
+            print(f"Unhandled ChirpStack error: {error}")
+
+    def list_devices(self, application_id, **kwargs):
+        return self.submit(self.client.list_devices, application_id, **kwargs)
+
+    def get_device_profiles(self, tenant_id, **kwargs):
+        return self.submit(self.client.get_device_profiles, tenant_id, **kwargs)
+
+    def get_device_status(self, dev_eui, application_id, **kwargs):
+        return self.submit(self.client.get_device_status, dev_eui, application_id, **kwargs)
+
+    def add_device(self, dev_eui, name, device_profile_id, application_id, nwk_key, device_type, **kwargs):
+        return self.submit(self.client.add_device, dev_eui, name, device_profile_id, application_id, nwk_key,
+                           device_type, **kwargs)
+
+    def remove_device(self, dev_eui, **kwargs):
+        return self.submit(self.client.remove_device, dev_eui, **kwargs)
+
+    def enqueue_downlink(self, dev_eui, data, **kwargs):
+        return self.submit(self.client.enqueue_downlink, dev_eui, data, **kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,317 @@
+# benchmark.py
+
+import argparse
+import base64
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+from chirpstack_api import api
+from google.protobuf.timestamp_pb2 import Timestamp
+
+import channel_manager
+from alert_dispatcher import AlertDispatcher
+from chirpstack_client import ChirpStackClient
+from device_types import DEVICE_TYPES
+from event_engine import ALERT_RESPONDER_TYPES, EventEngine
+from log_writer import LogWriter
+from metrics import summarize
+
+APP_ID = "00000000-0000-0000-0000-00000000a001"
+TENANT_ID = "00000000-0000-0000-0000-00000000b001"
+REGRESSION_THRESHOLD = 0.2  # Relative change that counts as a regression
+
+
+class FakeChirpStack:
+    """In-process ChirpStack DeviceService and DeviceProfileService with a generated fleet.
+
+    Every call sleeps `latency` seconds and fails with INTERNAL with
+    probability `error_rate`, so the client is measured against a server that
+    behaves like a slow or flaky one.
+    """
+
+    def __init__(self, fleet_size=1000, latency=0.002, error_rate=0.0, workers=32):
+        self.latency = latency
+        self.error_rate = error_rate
+        now = int(time.time())
+        self.devices = [
+            api.DeviceListItem(dev_eui=f"{i:016x}", name=f"node-{i}", description=DEVICE_TYPES[i % len(DEVICE_TYPES)],
+                               updated_at=Timestamp(seconds=now - 86400), last_seen_at=Timestamp(seconds=now - i % 3600))
+            for i in range(fleet_size)
+        ]
+        self.profiles = [api.DeviceProfileListItem(id=str(uuid.UUID(int=i)), name=f"Profile {i}") for i in range(20)]
+        self.calls = 0
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+        api.add_DeviceServiceServicer_to_server(_DeviceService(self), self.server)
+        api.add_DeviceProfileServiceServicer_to_server(_DeviceProfileService(self), self.server)
+        self.port = self.server.add_insecure_port("127.0.0.1:0")
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.port}"
+
+    def start(self):
+        self.server.start()
+
+    def stop(self):
+        self.server.stop(grace=None)
+
+    def simulate(self, context):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            context.abort(grpc.StatusCode.INTERNAL, "Injected error")
+
+
+class _DeviceService(api.DeviceServiceServicer):
+    def __init__(self, fake):
+        self.fake = fake
+
+    def List(self, request, context):
+        self.fake.simulate(context)
+        page = self.fake.devices[request.offset:request.offset + (request.limit or 10)]
+        return api.ListDevicesResponse(total_count=len(self.fake.devices), result=page)
+
+    def Enqueue(self, request, context):
+        self.fake.simulate(context)
+        return api.EnqueueDeviceQueueItemResponse(id=uuid.uuid4().hex)
+
+
+class _DeviceProfileService(api.DeviceProfileServiceServicer):
+    def __init__(self, fake):
+        self.fake = fake
+
+    def List(self, request, context):
+        self.fake.simulate(context)
+        page = self.fake.profiles[request.offset:request.offset + (request.limit or 10)]
+        return api.ListDeviceProfilesResponse(total_count=len(self.fake.profiles), result=page)
+
+
+class SyntheticMessage:
+    """Stands in for paho's MQTTMessage."""
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def generate_uplinks(devices, count, app_id=APP_ID, alert_ratio=0.0, gateways=2, seed=1):
+    """Yields `count` synthetic MQTT uplink messages in ChirpStack's JSON encoding."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        device = rng.choice(devices)
+        message = "Alert: button pressed" if rng.random() < alert_ratio else "Status OK"
+        event = {
+            "deduplicationId": str(uuid.uuid4()),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "deviceInfo": {"tenantId": TENANT_ID, "applicationId": app_id, "deviceName": device.name,
+                           "devEui": device.dev_eui, "tags": {}},
+            "fCnt": rng.randrange(65536),
+            "fPort": 10,
+            "data": base64.b64encode(rng.randbytes(24)).decode('ascii'),
+            "object": {"message": message, "battery": round(rng.uniform(3.0, 4.2), 2)},
+            "rxInfo": [{"gatewayId": f"00800000a000{i:04x}", "rssi": rng.randrange(-120, -40),
+                        "snr": round(rng.uniform(-10, 12), 1)} for i in range(gateways)],
+        }
+        yield SyntheticMessage(f"application/{app_id}/device/{device.dev_eui}/event/up",
+                               json.dumps(event).encode('utf-8'))
+
+
+def bench_device_listing(client, iterations, max_workers):
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        try:
+            sum(len(page) for page in client.iter_devices(APP_ID, max_workers=max_workers, timeout=30))
+        except grpc.RpcError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_status_lookup(client, devices, iterations):
+    rng = random.Random(2)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        dev_eui = rng.choice(devices).dev_eui
+        call_started = time.perf_counter()
+        client.get_device_status(dev_eui, APP_ID, timeout=10)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_uplink_handling(engine, application, messages):
+    """Runs the core handlers directly, one uplink at a time."""
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for message in messages:
+        call_started = time.perf_counter()
+        try:
+            engine.process_message(application, "up", message.payload)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_mqtt_ingestion(engine, messages):
+    """Pushes uplinks through on_message and the ingestion workers, as paho's network thread would."""
+    before = engine.ingestion.stats()
+    latencies = []
+    started = time.perf_counter()
+    for message in messages:
+        call_started = time.perf_counter()
+        engine.on_message(None, None, message)
+        latencies.append(time.perf_counter() - call_started)
+    expected = before["handled"] + before["errors"] + before["dropped"] + len(messages)
+    while True:
+        stats = engine.ingestion.stats()
+        if stats["handled"] + stats["errors"] + stats["dropped"] >= expected:
+            break
+        time.sleep(0.001)
+    result = summarize(latencies, time.perf_counter() - started, stats["errors"] - before["errors"])
+    result["dropped"] = stats["dropped"] - before["dropped"]
+    return result
+
+
+def bench_alert_fan_out(client, responders, iterations):
+    dispatcher = AlertDispatcher(client, dedup_seconds=0)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        done = threading.Event()
+        reports = []
+        call_started = time.perf_counter()
+        dispatcher.dispatch(responders, bytes([0xFF]), on_done=lambda report: (reports.append(report), done.set()))
+        done.wait()
+        latencies.append(time.perf_counter() - call_started)
+        errors += len(reports[0].failed)
+    elapsed = time.perf_counter() - started
+    dispatcher.shutdown()
+    # Throughput counts downlinks, latency is per complete fan-out
+    return summarize(latencies, elapsed, errors, operations=iterations * len(responders))
+
+
+def bench_log_writes(path, count):
+    writer = LogWriter(path)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        call_started = time.perf_counter()
+        writer.write(f"2024-01-01, 00:00:00 - Uplink - Device: node-{i}, RSSI: -80, SNR: 7.5, Message: Status OK")
+        latencies.append(time.perf_counter() - call_started)
+    writer.flush(timeout=60)
+    elapsed = time.perf_counter() - started
+    writer.close()
+    return summarize(latencies, elapsed)
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns a list of regression messages of `results` against a saved baseline."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        if previous["throughput"] and result["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {result['throughput']:.0f}/s, was {previous['throughput']:.0f}/s")
+        for key in ("p50_ms", "p99_ms"):
+            if previous.get(key) and result.get(key) and result[key] > previous[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {result[key]:.3f}, was {previous[key]:.3f}")
+    return regressions
+
+
+def run(settings):
+    fake = FakeChirpStack(settings["fleet_size"], settings["latency"], settings["error_rate"])
+    fake.start()
+    workdir = tempfile.TemporaryDirectory(prefix="chirpstack-bench-")
+    client = ChirpStackClient(fake.address, "benchmark-token")
+    results = {}
+    try:
+        results["device_listing"] = bench_device_listing(client, settings["listings"], settings["page_workers"])
+        results["status_lookup"] = bench_status_lookup(client, fake.devices, settings["status_lookups"])
+
+        engine = EventEngine(client, {
+            "event_log": {"path": os.path.join(workdir.name, "events_log.txt")},
+            "event_store": os.path.join(workdir.name, "events.db"),
+            "broadcast": {"path": os.path.join(workdir.name, "broadcast_jobs.json")},
+        })
+        application = engine.add_application(APP_ID, TENANT_ID)
+        application.node_manager.add_devices(fake.devices)
+        messages = list(generate_uplinks(fake.devices, settings["uplinks"]))
+        results["uplink_handling"] = bench_uplink_handling(engine, application, messages)
+        results["mqtt_ingestion"] = bench_mqtt_ingestion(engine, messages)
+        engine.stop()
+
+        responders = application.node_manager.get_nodes_by_type(*ALERT_RESPONDER_TYPES)
+        results["alert_fan_out"] = bench_alert_fan_out(client, responders, settings["fan_outs"])
+        results["log_writes"] = bench_log_writes(os.path.join(workdir.name, "bench_log.txt"), settings["log_writes"])
+    finally:
+        channel_manager.close_all()
+        fake.stop()
+        workdir.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client, handlers and logging against a local "
+                                                 "fake ChirpStack server and synthetic MQTT events.")
+    parser.add_argument("--fleet-size", type=int, default=1000, help="Devices on the fake server (default: 1000)")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds every RPC takes (default: 0.002)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of RPCs that fail (default: 0)")
+    parser.add_argument("--listings", type=int, default=20, help="Full device listings (default: 20)")
+    parser.add_argument("--page-workers", type=int, default=4, help="Concurrent page requests (default: 4)")
+    parser.add_argument("--status-lookups", type=int, default=2000, help="Status lookups (default: 2000)")
+    parser.add_argument("--uplinks", type=int, default=5000, help="Synthetic uplinks (default: 5000)")
+    parser.add_argument("--fan-outs", type=int, default=10, help="Alert fan-outs to all responders (default: 10)")
+    parser.add_argument("--log-writes", type=int, default=50000, help="Log lines written (default: 50000)")
+    parser.add_argument("--baseline", default="benchmark_baseline.json",
+                        help="Baseline to compare against (default: benchmark_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative change reported as a regression (default: 0.2)")
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in ("fleet_size", "latency", "error_rate", "listings", "page_workers",
+                                                    "status_lookups", "uplinks", "fan_outs", "log_writes")}
+    results = run(settings)
+
+    print(f"{'scenario':<16} {'count':>7} {'errors':>6} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        p50 = f"{result['p50_ms']:.3f}" if result['p50_ms'] is not None else "-"
+        p99 = f"{result['p99_ms']:.3f}" if result['p99_ms'] is not None else "-"
+        print(f"{name:<16} {result['count']:>7} {result['errors']:>6} {result['throughput']:>10.0f} {p50:>9} {p99:>9}")
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline.get("settings") != settings:
+            print(f"Baseline {args.baseline} was recorded with other settings, not comparing.")
+        else:
+            regressions = compare(results, baseline, args.threshold)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if not regressions:
+                print(f"No regressions against {args.baseline}.")
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({"settings": settings, "recorded": time.time(), "results": results}, file, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
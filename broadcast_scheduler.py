@@ -0,0 +1,220 @@
+# broadcast_scheduler.py
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from command_dict import COMMANDS
+
+# Target states; a target moves pending -> enqueued -> txack -> acked, or ends in failed/timeout
+PENDING = "pending"
+ENQUEUED = "enqueued"
+TXACK = "txack"
+ACKED = "acked"
+FAILED = "failed"
+TIMEOUT = "timeout"
+FINISHED_STATES = (ACKED, FAILED, TIMEOUT)
+
+
+class BroadcastJob:
+    def __init__(self, command, targets, job_id=None, created=None, states=None, enqueued_at=None,
+                 queue_item_ids=None):
+        self.id = job_id or uuid.uuid4().hex[:8]
+        self.command = command  # Key of command_dict.COMMANDS
+        self.targets = targets  # [(dev_eui, name)]
+        self.created = created or time.time()
+        self.states = states or {dev_eui: PENDING for dev_eui, _ in targets}
+        self.enqueued_at = enqueued_at or {}  # dev_eui -> time.time() of the enqueue
+        self.queue_item_ids = queue_item_ids or {}  # dev_eui -> queue item id of this job's downlink
+
+    @property
+    def finished(self):
+        return all(state in FINISHED_STATES for state in self.states.values())
+
+    def counts(self):
+        counts = {}
+        for state in self.states.values():
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def __str__(self):
+        counts = ", ".join(f"{count} {state}" for state, count in sorted(self.counts().items()))
+        return f"Broadcast {self.id} {self.command} to {len(self.targets)} nodes: {counts}"
+
+    def to_dict(self):
+        # Copies, so the dict can be serialized while the MQTT threads update the job
+        return {"id": self.id, "command": self.command, "targets": self.targets, "created": self.created,
+                "states": dict(self.states), "enqueued_at": dict(self.enqueued_at),
+                "queue_item_ids": dict(self.queue_item_ids)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["command"], [tuple(target) for target in data["targets"]], data["id"], data["created"],
+                   data["states"], data["enqueued_at"], data["queue_item_ids"])
+
+
+class BroadcastScheduler:
+    """Sends a command to many nodes, paced to respect the gateways' duty cycle.
+
+    One scheduler thread enqueues at most one downlink every `interval` seconds,
+    across all jobs, oldest job first. A change only marks the jobs dirty; the
+    scheduler thread saves them to `path` on its next tick, outside the lock,
+    so pending targets are picked up again after a restart. Delivery is
+    tracked from the txack/ack MQTT events, matched by the queue item id of the
+    job's downlink, so acks of other downlinks to the same node do not count. A
+    target that gets no ack within `ack_timeout` seconds of its enqueue ends as
+    timed out.
+    """
+
+    def __init__(self, chirpstack_client, path="broadcast_jobs.json", interval=1.0, ack_timeout=3600,
+                 on_progress=None):
+        self.chirpstack_client = chirpstack_client
+        self.path = path
+        self.interval = interval
+        self.ack_timeout = ack_timeout
+        self.on_progress = on_progress  # on_progress(job), called from the scheduler or MQTT threads
+        self.jobs = []
+        self.dirty = False  # Jobs changed since the last save
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # One writer of the file at a time
+        self.wakeup = threading.Event()
+        self.running = True
+        self.load()
+        self.thread = threading.Thread(target=self._run, name="broadcast", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                self.jobs = [BroadcastJob.from_dict(job) for job in json.load(file)]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading broadcast jobs from {self.path}: {e}")
+
+    def save(self):
+        """Writes the unfinished jobs atomically if they changed. Call without the lock held."""
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                self.dirty = False
+                jobs = [job.to_dict() for job in self.jobs]
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, 'w') as file:
+                    json.dump(jobs, file)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Error saving broadcast jobs to {self.path}: {e}")
+                with self.lock:
+                    self.dirty = True  # Tried again on the next tick
+
+    def submit(self, command, nodes):
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command: {command}")
+        job = BroadcastJob(command, [(node.dev_eui, node.name) for node in nodes])
+        with self.lock:
+            self.jobs.append(job)
+            self.dirty = True
+        self.wakeup.set()
+        return job
+
+    def cancel(self, job_id):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job.id != job_id]
+            self.dirty = True
+        self.wakeup.set()
+
+    def get_jobs(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def on_txack(self, dev_eui, queue_item_id):
+        self._advance(dev_eui, queue_item_id, (ENQUEUED,), TXACK)
+
+    def on_ack(self, dev_eui, queue_item_id, acknowledged):
+        self._advance(dev_eui, queue_item_id, (ENQUEUED, TXACK), ACKED if acknowledged else FAILED)
+
+    def _advance(self, dev_eui, queue_item_id, from_states, to_state):
+        if not queue_item_id:
+            return
+        with self.lock:
+            job = next((job for job in self.jobs if job.queue_item_ids.get(dev_eui) == queue_item_id
+                        and job.states.get(dev_eui) in from_states), None)
+            if job is None:
+                return
+            job.states[dev_eui] = to_state
+            self._finish(job)
+            self.dirty = True
+        self._report(job)
+
+    def _finish(self, job):
+        if job.finished:
+            self.jobs.remove(job)
+
+    def _report(self, job):
+        if self.on_progress:
+            try:
+                self.on_progress(job)
+            except Exception as e:
+                print(f"Error reporting broadcast progress: {e}")
+
+    def _next_target(self):
+        with self.lock:
+            for job in self.jobs:
+                for dev_eui, _ in job.targets:
+                    if job.states[dev_eui] == PENDING:
+                        return job, dev_eui
+        return None, None
+
+    def _expire(self):
+        now = time.time()
+        expired = []
+        with self.lock:
+            for job in list(self.jobs):
+                changed = False
+                for dev_eui, state in job.states.items():
+                    if state in (ENQUEUED, TXACK) and now - job.enqueued_at.get(dev_eui, now) > self.ack_timeout:
+                        job.states[dev_eui] = TIMEOUT
+                        changed = True
+                if changed:
+                    self._finish(job)
+                    expired.append(job)
+            if expired:
+                self.dirty = True
+        for job in expired:
+            self._report(job)
+
+    def _run(self):
+        while self.running:
+            self._expire()
+            self.save()
+            job, dev_eui = self._next_target()
+            if job is None:
+                self.wakeup.wait(self.interval)
+                self.wakeup.clear()
+                continue
+
+            success, message, queue_item_id = self.chirpstack_client.enqueue_downlink_item(
+                dev_eui, COMMANDS[job.command], timeout=10)
+            with self.lock:
+                if job in self.jobs:
+                    job.states[dev_eui] = ENQUEUED if success else FAILED
+                    job.enqueued_at[dev_eui] = time.time()
+                    if queue_item_id:
+                        job.queue_item_ids[dev_eui] = queue_item_id
+                    self._finish(job)
+                    self.dirty = True
+            if not success:
+                print(f"Broadcast {job.id} to {dev_eui} failed: {message}")
+            self._report(job)
+            time.sleep(self.interval)  # Pacing between downlinks
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        self.thread.join(self.interval + 1)
+        self.save()
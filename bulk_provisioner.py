@@ -0,0 +1,182 @@
+# bulk_provisioner.py
+
+import argparse
+import csv
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+from device_types import DEVICE_TYPES
+
+MANIFEST_FIELDS = ["dev_eui", "name", "device_type", "device_profile", "nwk_key"]
+# Errors worth another attempt; anything else (e.g. ALREADY_EXISTS) fails the row right away
+RETRYABLE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED,
+                   grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.ABORTED)
+# Errors after which the server may have created the device anyway, so a retry accepts ALREADY_EXISTS
+AMBIGUOUS_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.ABORTED)
+
+
+def load_manifest(path):
+    """Reads a CSV (with a header row) or JSON (list of objects) manifest into a list of dicts."""
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.lower().endswith('.json'):
+            rows = json.load(file)
+        else:
+            rows = list(csv.DictReader(file))
+    return [{field: str(row.get(field) or '').strip() for field in MANIFEST_FIELDS} for row in rows]
+
+
+def validate_manifest(rows, device_profiles):
+    """Checks every row before anything is sent to the server.
+
+    `device_profiles` is a list of (id, name); a row may name its profile by either.
+    Returns a list of (row number, message) and resolves `device_profile_id` on valid rows.
+    """
+    errors = []
+    profile_ids = {profile_id for profile_id, _ in device_profiles}
+    profiles_by_name = {name: profile_id for profile_id, name in device_profiles}
+    seen_euis = set()  # Only dev EUIs must be unique, ChirpStack allows devices with the same name
+    for number, row in enumerate(rows, start=1):
+        dev_eui = row['dev_eui'].lower()
+        row['dev_eui'] = dev_eui
+        if not re.fullmatch(r"[0-9a-f]{16}", dev_eui):
+            errors.append((number, f"Invalid dev_eui '{row['dev_eui']}', expected 16 hex digits"))
+        elif dev_eui in seen_euis:
+            errors.append((number, f"Duplicate dev_eui {dev_eui}"))
+        seen_euis.add(dev_eui)
+        if not row['name']:
+            errors.append((number, "Missing name"))
+        if row['device_type'] not in DEVICE_TYPES:
+            errors.append((number, f"Unknown device type '{row['device_type']}'"))
+        if not re.fullmatch(r"[0-9a-fA-F]{32}", row['nwk_key']):
+            errors.append((number, "Invalid nwk_key, expected 32 hex digits"))
+        profile = row['device_profile']
+        if profile in profile_ids:
+            row['device_profile_id'] = profile
+        elif profile in profiles_by_name:
+            row['device_profile_id'] = profiles_by_name[profile]
+        else:
+            errors.append((number, f"Unknown device profile '{profile}'"))
+    return errors
+
+
+class ProvisionReport:
+    def __init__(self, total):
+        self.total = total
+        self.results = [None] * total  # (success, message) per row, in manifest order
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def succeeded(self):
+        return sum(1 for result in self.results if result and result[0])
+
+    @property
+    def failed(self):
+        return sum(1 for result in self.results if result and not result[0])
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def __str__(self):
+        rate = self.total / self.elapsed if self.elapsed else 0.0
+        return (f"{self.succeeded} of {self.total} devices provisioned, {self.failed} failed, "
+                f"{self.elapsed:.1f} s, {rate:.1f} devices/s")
+
+
+class BulkProvisioner:
+    """Creates many devices concurrently with a bounded worker pool.
+
+    Each row is one ChirpStackClient.add_device call (Create, then CreateKeys,
+    rolled back if CreateKeys fails), retried with exponential backoff on
+    transient gRPC errors. After a timeout or a dropped connection the first
+    attempt may have reached the server, so the retries accept a device that
+    already exists and go on to create its keys.
+    """
+
+    def __init__(self, chirpstack_client, application_id, max_workers=8, retries=3, backoff=0.5):
+        self.chirpstack_client = chirpstack_client
+        self.application_id = application_id
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+
+    def provision(self, rows, on_result=None, timeout=None):
+        """Provisions validated rows and returns a ProvisionReport.
+
+        `on_result(row, success, message)` is called from worker threads after every row.
+        """
+        report = ProvisionReport(len(rows))
+        lock = threading.Lock()
+
+        def provision_row(index):
+            row = rows[index]
+            success, message = self._add(row, timeout)
+            with lock:
+                report.results[index] = (success, message)
+            if on_result:
+                on_result(row, success, message)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="provision") as pool:
+            list(pool.map(provision_row, range(len(rows))))
+        report.finished = time.monotonic()
+        return report
+
+    def _add(self, row, timeout):
+        maybe_created = False
+        for attempt in range(self.retries + 1):
+            try:
+                self.chirpstack_client.add_device(row['dev_eui'], row['name'], row['device_profile_id'],
+                                                  self.application_id, row['nwk_key'], row['device_type'],
+                                                  timeout=timeout, exists_ok=maybe_created)
+                return True, "Provisioned"
+            except grpc.RpcError as e:
+                if e.code() not in RETRYABLE_CODES or attempt == self.retries:
+                    return False, e.details() or str(e.code())
+                maybe_created = maybe_created or e.code() in AMBIGUOUS_CODES
+                time.sleep(self.backoff * 2 ** attempt)
+        return False, "Retries exhausted"
+
+
+def main():
+    from chirpstack_client import ChirpStackClient
+
+    parser = argparse.ArgumentParser(description="Provision devices from a CSV or JSON manifest.")
+    parser.add_argument("manifest", help=f"CSV or JSON file with the fields {', '.join(MANIFEST_FIELDS)}")
+    parser.add_argument("--config", default="config.json", help="Configuration file (default: config.json)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent device creations (default: 8)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per device on transient errors")
+    parser.add_argument("--dry-run", action="store_true", help="Only validate the manifest")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    client = ChirpStackClient(f"{config['server_address']}:{config['server_port']}", config['api_token'])
+    profiles = [(profile.id, profile.name) for profile in client.get_device_profiles(config.get('tenant_id', ''))]
+
+    rows = load_manifest(args.manifest)
+    errors = validate_manifest(rows, profiles)
+    for number, message in errors:
+        print(f"Row {number}: {message}")
+    if errors:
+        raise SystemExit(f"Manifest has {len(errors)} errors, nothing was provisioned.")
+    if args.dry_run:
+        print(f"Manifest is valid, {len(rows)} devices.")
+        return
+
+    provisioner = BulkProvisioner(client, config['app_id'], max_workers=args.workers, retries=args.retries)
+    report = provisioner.provision(
+        rows, on_result=lambda row, success, message: print(f"{row['dev_eui']} {row['name']}: {message}"),
+        timeout=10)
+    print(report)
+    if report.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# channel_manager.py
+
+import json
+import threading
+import time
+
+import grpc
+
+import metrics
+
+# Keep idle connections alive through NAT/firewalls and notice dead ones quickly
+KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+# Transient UNAVAILABLE errors are retried inside gRPC with exponential backoff
+RETRY_POLICY = {
+    "maxAttempts": 4,
+    "initialBackoff": "0.1s",
+    "maxBackoff": "2s",
+    "backoffMultiplier": 2,
+    "retryableStatusCodes": ["UNAVAILABLE"],
+}
+
+# Reads that are safe to send twice; only these are retried, a mutating call that timed out may have been applied
+READ_METHODS = {
+    "api.DeviceService": ["Get", "GetKeys", "GetActivation", "GetMetrics", "GetLinkMetrics", "GetQueue"],
+    "api.DeviceProfileService": ["Get", "ListAdrAlgorithms"],
+    "api.ApplicationService": ["Get", "List"],
+}
+
+# Default deadlines, used whenever a call does not pass its own timeout
+SERVICE_CONFIG = {
+    "methodConfig": [
+        {
+            "name": [
+                {"service": "api.DeviceService", "method": "List"},
+                {"service": "api.DeviceProfileService", "method": "List"},
+            ],
+            "timeout": "30s",
+            "retryPolicy": RETRY_POLICY,
+        },
+        {
+            "name": [{"service": service, "method": method}
+                     for service, methods in READ_METHODS.items() for method in methods],
+            "timeout": "10s",
+            "retryPolicy": RETRY_POLICY,
+        },
+        {
+            # Create, CreateKeys, Enqueue, Delete...: a deadline only, the caller decides whether to retry
+            "name": [
+                {"service": "api.DeviceService"},
+                {"service": "api.DeviceProfileService"},
+                {"service": "api.ApplicationService"},
+            ],
+            "timeout": "10s",
+        },
+    ]
+}
+
+
+class RpcMetricsInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """Times every unary call on a channel and counts its failures, per method."""
+
+    def __init__(self, registry=metrics.REGISTRY):
+        self.registry = registry
+        self.histograms = {}  # method -> Histogram, looked up in the registry once per method
+        self.errors = {}  # (method, code) -> Counter
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        if not self.registry.enabled:
+            return continuation(client_call_details, request)
+        started = time.perf_counter()
+        outcome = continuation(client_call_details, request)
+        method = client_call_details.method
+        histogram = self.histograms.get(method)
+        if histogram is None:
+            histogram = self.histograms[method] = self.registry.histogram(
+                "chirpstack_rpc_seconds", "Duration of ChirpStack API calls", method=method)
+        histogram.observe(time.perf_counter() - started)
+        code = outcome.code()
+        if code != grpc.StatusCode.OK:
+            counter = self.errors.get((method, code))
+            if counter is None:
+                counter = self.errors[(method, code)] = self.registry.counter(
+                    "chirpstack_rpc_errors_total", "Failed ChirpStack API calls", method=method, code=code.name)
+            counter.inc()
+        return outcome
+
+
+_channels = {}  # server address -> grpc.Channel
+_lock = threading.Lock()
+
+
+def get_channel(server):
+    """Returns the shared channel to `server`, creating it on first use."""
+    with _lock:
+        channel = _channels.get(server)
+        if channel is None:
+            options = KEEPALIVE_OPTIONS + [
+                ("grpc.enable_retries", 1),
+                ("grpc.service_config", json.dumps(SERVICE_CONFIG)),
+            ]
+            channel = _channels[server] = grpc.intercept_channel(grpc.insecure_channel(server, options=options),
+                                                                 RpcMetricsInterceptor())
+        return channel
+
+
+def close_all():
+    with _lock:
+        for channel in _channels.values():
+            channel.close()
+        _channels.clear()
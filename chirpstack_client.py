@@ -1,42 +1,99 @@
 import grpc
 from chirpstack_api import api
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from google.protobuf.timestamp_pb2 import Timestamp
+from device_status_cache import DeviceStatusCache
+import channel_manager
+import metrics
 
+PAGE_SIZE = 100
 
 
 class ChirpStackClient:
-    def __init__(self, server, api_token):
+    def __init__(self, server, api_token, status_ttl=30, online_window_minutes=10):
         self.server = server
         self.api_token = api_token
-        self.channel = grpc.insecure_channel(self.server)
+        self.status_cache = DeviceStatusCache(ttl_seconds=status_ttl,
+                                              online_window=timedelta(minutes=online_window_minutes))
+        # Looked up once here, the enqueue path only increments them
+        self.enqueued_metric = metrics.counter("downlinks_enqueued_total", "Downlink enqueue attempts", result="ok")
+        self.enqueue_failed_metric = metrics.counter("downlinks_enqueued_total", "Downlink enqueue attempts",
+                                                     result="failed")
+        status_cache = self.status_cache
+        metrics.counter("device_status_cache_hits_total", "Device status lookups answered from the cache",
+                        function=lambda: status_cache.hits)
+        metrics.counter("device_status_cache_misses_total", "Device status lookups that needed the server",
+                        function=lambda: status_cache.misses)
+        metrics.gauge("device_status_cache_devices", "Devices in the status cache",
+                      function=lambda: len(status_cache.last_seen))
+        self.metadata = (("authorization", f"Bearer {self.api_token}"),)  # Built once, sent with every call
+        self.channel = channel_manager.get_channel(self.server)  # Shared with every other client of this server
         self.device_service = api.DeviceServiceStub(self.channel)
         self.device_profile_service = api.DeviceProfileServiceStub(self.channel)
         self.application_service = api.ApplicationServiceStub(self.channel)
+        self.downlink_tracker = None  # Optional DownlinkTracker that is told about every enqueued downlink
 
     def _get_metadata(self):
-        return [("authorization", f"Bearer {self.api_token}")]
+        return self.metadata
 
-    def list_devices(self, application_id):
-        client = self.device_service
+    def _iter_pages(self, list_call, make_request, page_size, max_workers, timeout=None):
+        """Walks offset/total_count and yields the result of every page.
+
+        The first page is always fetched on its own so the caller gets it as soon
+        as possible. Once total_count is known, the remaining pages are fetched
+        with up to `max_workers` concurrent requests, but still yielded in order.
+        `timeout` is the deadline in seconds of every single page request.
+        """
         auth_token = self._get_metadata()
-        req = api.ListDevicesRequest(application_id=application_id, limit=100)
+        resp = list_call(make_request(0, page_size), metadata=auth_token, timeout=timeout)
+        yield list(resp.result)
+
+        offsets = range(page_size, resp.total_count, page_size)
+        if max_workers > 1 and len(offsets) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(offsets))) as pool:
+                pages = pool.map(lambda offset: list_call(make_request(offset, page_size), metadata=auth_token,
+                                                          timeout=timeout),
+                                 offsets)
+                for page in pages:
+                    yield list(page.result)
+        else:
+            for offset in offsets:
+                page = list_call(make_request(offset, page_size), metadata=auth_token, timeout=timeout)
+                yield list(page.result)
+
+    def iter_devices(self, application_id, page_size=PAGE_SIZE, max_workers=1, timeout=None):
+        """Yields the devices of an application one page at a time."""
+        return self._iter_pages(
+            self.device_service.List,
+            lambda offset, limit: api.ListDevicesRequest(application_id=application_id, limit=limit, offset=offset),
+            page_size,
+            max_workers,
+            timeout
+        )
 
+    def list_devices(self, application_id, page_size=PAGE_SIZE, max_workers=1, timeout=None):
         try:
-            resp = client.List(req, metadata=auth_token)
-            # Assuming resp.result contains DeviceListItem objects directly
-            return resp.result
+            pages = self.iter_devices(application_id, page_size, max_workers, timeout)
+            return [device for page in pages for device in page]
         except grpc.RpcError as e:
             print(f"Error fetching devices: {e.details()}")
             return []
 
-    def remove_device(self, dev_eui):
+    def remove_device(self, dev_eui, timeout=None):
         client = self.device_service
         auth_token = self._get_metadata()
         req = api.DeleteDeviceRequest(dev_eui=dev_eui)
-        client.Delete(req, metadata=auth_token)
+        client.Delete(req, metadata=auth_token, timeout=timeout)
+        self.status_cache.remove(dev_eui)
+
+    def add_device(self, dev_eui, name, device_profile_id, application_id, nwk_key, device_type, timeout=None,
+                   exists_ok=False):
+        """Creates a device and its keys.
 
-    def add_device(self, dev_eui, name, device_profile_id, application_id, nwk_key, device_type):
+        With `exists_ok`, a device or keys that already exist (left by an earlier attempt that reached the
+        server but timed out on the client) count as created, so a retry completes the missing step.
+        """
         device = api.Device(
             dev_eui=dev_eui,
             name=name,
@@ -45,7 +102,11 @@ class ChirpStackClient:
             device_profile_id=device_profile_id
         )
         req = api.CreateDeviceRequest(device=device)
-        self.device_service.Create(req, metadata=self._get_metadata())
+        try:
+            self.device_service.Create(req, metadata=self._get_metadata(), timeout=timeout)
+        except grpc.RpcError as e:
+            if not (exists_ok and e.code() == grpc.StatusCode.ALREADY_EXISTS):
+                raise
 
         keys_req = api.CreateDeviceKeysRequest(
             device_keys=api.DeviceKeys(
@@ -53,36 +114,54 @@ class ChirpStackClient:
                 nwk_key=nwk_key
             )
         )
-        self.device_service.CreateKeys(keys_req, metadata=self._get_metadata())
-
-    def get_device_profiles(self, tenant_id):
-        req = api.ListDeviceProfilesRequest(
-            limit=100,  # Set the limit as needed
-            tenant_id=tenant_id  # Specify the tenant ID if applicable
+        try:
+            self.device_service.CreateKeys(keys_req, metadata=self._get_metadata(), timeout=timeout)
+        except grpc.RpcError as e:
+            if exists_ok and e.code() == grpc.StatusCode.ALREADY_EXISTS:
+                self.status_cache.set_last_seen(dev_eui, None, application_id)
+                return
+            # Do not leave a device without keys behind, it could never join
+            try:
+                self.device_service.Delete(api.DeleteDeviceRequest(dev_eui=dev_eui), metadata=self._get_metadata(),
+                                           timeout=timeout)
+            except grpc.RpcError as e:
+                print(f"Error rolling back device {dev_eui}: {e.details()}")
+            raise
+        self.status_cache.set_last_seen(dev_eui, None, application_id)
+
+    def iter_device_profiles(self, tenant_id, page_size=PAGE_SIZE, max_workers=1, timeout=None):
+        """Yields the device profiles of a tenant one page at a time."""
+        return self._iter_pages(
+            self.device_profile_service.List,
+            lambda offset, limit: api.ListDeviceProfilesRequest(tenant_id=tenant_id, limit=limit, offset=offset),
+            page_size,
+            max_workers,
+            timeout
         )
-        auth_token = self._get_metadata()
-        resp = self.device_profile_service.List(req, metadata=auth_token)
-        return resp.result
 
-    def get_device_status(self, dev_eui, application_id):
+    def get_device_profiles(self, tenant_id, page_size=PAGE_SIZE, max_workers=1, timeout=None):
+        pages = self.iter_device_profiles(tenant_id, page_size, max_workers, timeout)
+        return [profile for page in pages for profile in page]
+
+    def refresh_device_statuses(self, application_id, max_workers=1, timeout=None):
+        """Refreshes the status cache of every device of the application with one bulk listing."""
+        pages = self.iter_devices(application_id, max_workers=max_workers, timeout=timeout)
+        devices = [device for page in pages for device in page]
+        self.status_cache.update(devices, application_id)
+
+    def get_device_status(self, dev_eui, application_id, timeout=None):
+        status = self.status_cache.get(dev_eui)
+        if status is not None:
+            return status
+
         try:
-            devices = self.list_devices(application_id)
-            device = next((d for d in devices if d.dev_eui == dev_eui), None)
-
-            if device:
-                print(f"Device object: {device}")
-                last_seen = device.last_seen_at
-                if last_seen:
-                    last_seen_dt = datetime.fromtimestamp(last_seen.seconds)
-                    is_online = datetime.now() - last_seen_dt < timedelta(minutes=10)
-                else:
-                    last_seen_dt = "Unknown"
-                    is_online = False
-
-                return {"last_seen": last_seen_dt, "is_online": is_online}
-            else:
+            if self.status_cache.is_stale(application_id):
+                self.refresh_device_statuses(application_id, timeout=timeout)
+                status = self.status_cache.get(dev_eui)
+            if status is None:
                 print(f"No device found with dev_eui: {dev_eui}")
                 return {"last_seen": "Unknown", "is_online": False}
+            return status
         except grpc.RpcError as e:
             print(f"Error getting device status for {dev_eui}: {e.details()}")
             return {"last_seen": "Unknown", "is_online": False}
@@ -103,8 +182,13 @@ class ChirpStackClient:
     #         print(f"Error fetching device link metrics for {dev_eui}: {e.details()}")
     #         return {}
 
-    def enqueue_downlink(self, dev_eui, data, confirmed=True, f_port=10):
+    def enqueue_downlink(self, dev_eui, data, confirmed=True, f_port=10, timeout=None):
         """Enqueue a downlink message to a device."""
+        success, message, _ = self.enqueue_downlink_item(dev_eui, data, confirmed, f_port, timeout)
+        return success, message
+
+    def enqueue_downlink_item(self, dev_eui, data, confirmed=True, f_port=10, timeout=None):
+        """Like enqueue_downlink, and also returns the queue item id that the txack/ack events will carry."""
         req = api.EnqueueDeviceQueueItemRequest()
         req.queue_item.confirmed = confirmed
         req.queue_item.data = data
@@ -112,7 +196,11 @@ class ChirpStackClient:
         req.queue_item.f_port = f_port
 
         try:
-            self.device_service.Enqueue(req, metadata=self._get_metadata())
-            return True, "Command enqueued successfully."
+            resp = self.device_service.Enqueue(req, metadata=self._get_metadata(), timeout=timeout)
+            if self.downlink_tracker:
+                self.downlink_tracker.track(dev_eui, resp.id, data, confirmed)
+            self.enqueued_metric.inc()
+            return True, "Command enqueued successfully.", resp.id
         except grpc.RpcError as e:
-            return False, f"Failed to enqueue command: {e.details()}"
\ No newline at end of file
+            self.enqueue_failed_metric.inc()
+            return False, f"Failed to enqueue command: {e.details()}", None
\ No newline at end of file
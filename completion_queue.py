@@ -0,0 +1,35 @@
+# completion_queue.py
+
+import queue
+
+
+class CompletionQueue:
+    """Runs callbacks posted from any thread on the Tk main thread.
+
+    Worker threads `put` callbacks, and one `after` timer drains them all every
+    `poll_ms` milliseconds, so Tk widgets are only ever touched from the main loop.
+    """
+
+    def __init__(self, master, poll_ms=50):
+        self.master = master
+        self.poll_ms = poll_ms
+        self.queue = queue.SimpleQueue()
+        self.timer = self.master.after(self.poll_ms, self.poll)
+
+    def put(self, callback, *args):
+        self.queue.put((callback, args))
+
+    def poll(self):
+        while True:
+            try:
+                callback, args = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in completion callback {callback}: {e}")
+        self.timer = self.master.after(self.poll_ms, self.poll)
+
+    def stop(self):
+        self.master.after_cancel(self.timer)
@@ -2,8 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import json
 import os
-from chirpstack_client import ChirpStackClient
-import grpc
+from device_snapshot import DeviceSnapshot, SNAPSHOT_FILE
 
 CONFIG_FILE = 'config.json'
 
@@ -20,6 +19,8 @@ class ConfigDialog:
         self.tenant_id = tk.StringVar()
         self.config_complete = False
         self.devices = []
+        self.snapshot = None  # DeviceSnapshot of the server, set on connect
+        self.config = {}  # Everything in config.json, including settings without a field in the dialog
         self.load_configuration()
         self.create_widgets()
 
@@ -45,6 +46,7 @@ class ConfigDialog:
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as file:
                 config = json.load(file)
+                self.config = config
                 self.server_address.set(config.get('server_address', ''))
                 self.server_port.set(config.get('server_port', ''))
                 self.api_token.set(config.get('api_token', ''))
@@ -64,14 +66,29 @@ class ConfigDialog:
             messagebox.showerror("Error", "Please enter a valid port number (0-65535).")
             return
 
+        self.snapshot = DeviceSnapshot(self.config.get('device_snapshot', SNAPSHOT_FILE),
+                                       f"{self.server_address.get()}:{self.server_port.get()}")
+        if self.snapshot.has_devices(self.app_id.get()):
+            # The last-known nodes are shown right away, the main window syncs with the server in the background
+            self.devices = self.snapshot.devices(self.app_id.get())
+            self.config_complete = True
+            self.save_configuration()
+            self.master.destroy()
+            return
+
         self.sync_devices()
 
     def sync_devices(self):
+        # Imported here, the gRPC stack is only needed when there is no snapshot to start from
+        import grpc
+        from chirpstack_client import ChirpStackClient
+
         client = ChirpStackClient(f"{self.server_address.get()}:{self.server_port.get()}", self.api_token.get())
         try:
-            devices = client.list_devices(self.app_id.get())
+            # Only the first page is needed here, the main window streams in the rest
+            devices = next(client.iter_devices(self.app_id.get()), [])
             self.devices = devices
-            messagebox.showinfo("Success", f"Successfully synchronized {len(devices)} devices.")
+            messagebox.showinfo("Success", f"Successfully connected, loaded the first {len(devices)} devices.")
             self.config_complete = True
             self.save_configuration()
             self.master.destroy()
@@ -82,15 +99,15 @@ class ConfigDialog:
             self.config_complete = False
 
     def save_configuration(self):
-        config = {
+        self.config.update({
             'server_address': self.server_address.get(),
             'server_port': self.server_port.get(),
             'api_token': self.api_token.get(),
             'app_id': self.app_id.get(),
             'tenant_id': self.tenant_id.get(),
-        }
+        })
         with open(CONFIG_FILE, 'w') as file:
-            json.dump(config, file)
+            json.dump(self.config, file)
 
     def on_close(self):
         if not self.config_complete:
@@ -0,0 +1,43 @@
+# daemon.py
+
+import signal
+import threading
+
+import channel_manager
+from chirpstack_client import ChirpStackClient
+from event_engine import EventEngine, load_applications
+
+
+def run(config):
+    """Runs the event engine without a GUI until SIGINT or SIGTERM."""
+    chirpstack_client = ChirpStackClient(
+        f"{config['server_address']}:{config['server_port']}",
+        config['api_token'],
+        status_ttl=config.get('status_cache_ttl', 30),
+        online_window_minutes=config.get('online_window_minutes', 10)
+    )
+    engine = EventEngine(chirpstack_client, config)
+    for settings in load_applications(config):
+        engine.add_application(settings['app_id'], settings['tenant_id'], settings.get('name'), settings['alert'],
+                               settings['rules'])
+    # Connect to MQTT right away, the node lists arrive with the first sync
+    engine.start()
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+    def sync_loop():
+        interval = config.get('sync_interval', 60)
+        while True:
+            engine.sync_devices(timeout=30)
+            if not interval or stopping.wait(interval):
+                return
+
+    threading.Thread(target=sync_loop, name="device-sync", daemon=True).start()
+    print(f"Serving {len(engine.applications)} application(s), stop with Ctrl+C")
+    while not stopping.wait(1.0):
+        pass
+
+    engine.stop()
+    channel_manager.close_all()
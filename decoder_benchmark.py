@@ -0,0 +1,62 @@
+# decoder_benchmark.py
+
+import argparse
+import json
+import timeit
+
+from chirpstack_api import integration
+from google.protobuf import json_format
+
+from event_decoder import JsonDecoder, ProtobufDecoder, orjson
+
+
+def sample_events(gateways=3):
+    """Returns typical uplink and txack events as protobuf messages."""
+    device_info = integration.DeviceInfo(
+        tenant_id="52f14cd4-c6f1-4fbd-8f87-4025e1d49242", tenant_name="Site",
+        application_id="43e5b26a-86f9-4fe4-88bf-d18e27f95112", application_name="Alerts",
+        device_profile_id="0b6e8a2c-3f3a-4a55-9d2f-6d4bb1a1c7e0", device_profile_name="Class A",
+        device_name="Sound Unit 17", dev_eui="70b3d57ed0051234", tags={"floor": "2"})
+    uplink = integration.UplinkEvent(
+        deduplication_id="5a4e1e0c-0d1c-4a7c-8b29-9c0e7c5a9f11", device_info=device_info,
+        dev_addr="01a2b3c4", adr=True, dr=5, f_cnt=1234, f_port=10, confirmed=False,
+        data=bytes(range(48)))
+    uplink.object.update({"message": "Status OK", "battery": 3.61, "temperature": 21.5})
+    for i in range(gateways):
+        rx = uplink.rx_info.add(gateway_id=f"00800000a000{i:04x}", uplink_id=1000 + i, rssi=-70 - i, snr=7.5 - i,
+                                channel=i, rf_chain=i % 2, context=b"\x01\x02\x03\x04")
+        rx.metadata["region_config_id"] = "eu868"
+    uplink.tx_info.frequency = 868100000
+    txack = integration.TxAckEvent(downlink_id=42, device_info=device_info, queue_item_id="9d2f",
+                                   f_cnt_down=55, gateway_id="00800000a0000000")
+    return {"up": uplink, "txack": txack}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the MQTT event decoding paths.")
+    parser.add_argument("--number", type=int, default=20000, help="Decodes per measurement (default: 20000)")
+    parser.add_argument("--gateways", type=int, default=3, help="rxInfo entries of the uplink (default: 3)")
+    args = parser.parse_args()
+
+    json_decoder = JsonDecoder()
+    protobuf_decoder = ProtobufDecoder()
+    for event_type, event in sample_events(args.gateways).items():
+        json_payload = json.dumps(json_format.MessageToDict(event)).encode('utf-8')
+        protobuf_payload = event.SerializeToString()
+        paths = [
+            ("json, decode + json.loads", lambda: json.loads(json_payload.decode('utf-8'))),
+            ("json, json.loads on bytes", lambda: json.loads(json_payload)),
+        ]
+        if orjson:
+            paths.append(("json, orjson", lambda: orjson.loads(json_payload)))
+        paths.append((f"decoder {json_decoder.name}", lambda: json_decoder.decode(event_type, json_payload)))
+        paths.append(("decoder protobuf", lambda: protobuf_decoder.decode(event_type, protobuf_payload)))
+
+        print(f"{event_type}: {len(json_payload)} bytes as JSON, {len(protobuf_payload)} bytes as protobuf")
+        for name, decode in paths:
+            seconds = min(timeit.repeat(decode, number=args.number, repeat=3))
+            print(f"  {name:<32} {seconds / args.number * 1e6:8.2f} us/event")
+
+
+if __name__ == "__main__":
+    main()
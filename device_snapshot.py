@@ -0,0 +1,98 @@
+# device_snapshot.py
+
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_FILE = "device_snapshot.json"
+
+
+class SnapshotDevice:
+    """Stands in for a ChirpStack device list item when the nodes come from the snapshot."""
+
+    __slots__ = ("dev_eui", "name", "description", "tags")
+
+    def __init__(self, dev_eui, name, description, tags=None):
+        self.dev_eui = dev_eui
+        self.name = name
+        self.description = description  # The device type, as NodeManager.get_device_type reads it
+        self.tags = tags or {}
+
+
+class DeviceSnapshot:
+    """Last-known devices and device profiles of every application, kept in a local JSON file.
+
+    Entries are keyed by server and application. At launch the nodes are
+    loaded from here, so the window is usable before the server has answered;
+    they count as stale until a full device listing of this session replaces
+    them. With `server` None, the entries of any server are read.
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE, server=None):
+        self.path = path
+        self.server = server
+        self.servers = {}  # server -> app_id -> {"devices": [...], "profiles": [...], "saved_at": ...}
+        self.refreshed = set()  # app_ids whose devices were listed since the snapshot was loaded
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error reading device snapshot {self.path}: {e}")
+            return
+        self.servers = data.get('servers', {})
+
+    def _entry(self, app_id):
+        if self.server is not None:
+            return self.servers.get(self.server, {}).get(app_id, {})
+        for applications in self.servers.values():
+            if app_id in applications:
+                return applications[app_id]
+        return {}
+
+    def has_devices(self, app_id):
+        return 'devices' in self._entry(app_id)
+
+    def is_stale(self, app_id):
+        """True while the nodes of `app_id` come from the file and no listing has confirmed them yet."""
+        return app_id not in self.refreshed and self.has_devices(app_id)
+
+    def devices(self, app_id):
+        return [SnapshotDevice(**device) for device in self._entry(app_id).get('devices', [])]
+
+    def profiles(self, app_id):
+        return [tuple(profile) for profile in self._entry(app_id).get('profiles', [])]
+
+    def _set(self, app_id, **values):
+        with self.lock:
+            self.servers.setdefault(self.server or "", {}).setdefault(app_id, {}).update(values)
+
+    def set_devices(self, app_id, nodes):
+        devices = [{"dev_eui": node.dev_eui, "name": node.name, "description": node.device_type, "tags": node.tags}
+                   for node in nodes]
+        self._set(app_id, devices=devices, saved_at=time.time())
+        self.refreshed.add(app_id)
+
+    def set_profiles(self, app_id, profiles):
+        self._set(app_id, profiles=[list(profile) for profile in profiles])
+
+    def save(self):
+        """Writes the snapshot atomically, a crash mid-write leaves the previous one in place."""
+        with self.lock:
+            data = json.dumps({"servers": self.servers})
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, 'w') as file:
+                    file.write(data)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Error writing device snapshot {self.path}: {e}")
+
+    def save_in_background(self):
+        threading.Thread(target=self.save, name="device-snapshot", daemon=True).start()
@@ -0,0 +1,91 @@
+# device_status_cache.py
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class DeviceStatusCache:
+    """Keeps the last known status of every device, keyed by dev_eui.
+
+    The devices of an application are refilled by one bulk device listing and
+    are considered stale `ttl_seconds` after that refresh; each application
+    has its own refresh time, so refreshing one never drops another. A device
+    counts as online if it was seen within `online_window`.
+    """
+
+    def __init__(self, ttl_seconds=30, online_window=timedelta(minutes=10)):
+        self.ttl_seconds = ttl_seconds
+        self.online_window = online_window
+        self.last_seen = {}  # dev_eui -> datetime or None
+        self.application_of = {}  # dev_eui -> application_id of the listing it came from
+        self.refreshed_at = {}  # application_id -> time.monotonic() of its last full listing
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def is_stale(self, application_id=None):
+        refreshed_at = self.refreshed_at.get(application_id)
+        return refreshed_at is None or time.monotonic() - refreshed_at > self.ttl_seconds
+
+    def update(self, devices, application_id=None):
+        """Replaces the cached devices of the application with the given DeviceListItem objects."""
+        last_seen = {device.dev_eui: self.last_seen_from_device(device) for device in devices}
+        with self.lock:
+            for dev_eui, owner in list(self.application_of.items()):
+                if owner == application_id and dev_eui not in last_seen:
+                    del self.application_of[dev_eui]
+                    self.last_seen.pop(dev_eui, None)
+            self.last_seen.update(last_seen)
+            self.application_of.update(dict.fromkeys(last_seen, application_id))
+            self.refreshed_at[application_id] = time.monotonic()
+
+    def apply_changes(self, last_seen, removed, application_id=None):
+        """Applies only the entries a device sync found changed, after a full listing of the application."""
+        with self.lock:
+            self.last_seen.update(last_seen)
+            self.application_of.update(dict.fromkeys(last_seen, application_id))
+            for dev_eui in removed:
+                self.last_seen.pop(dev_eui, None)
+                self.application_of.pop(dev_eui, None)
+            self.refreshed_at[application_id] = time.monotonic()
+
+    def last_seen_from_device(self, device):
+        if device.HasField('last_seen_at'):
+            return datetime.fromtimestamp(device.last_seen_at.seconds)
+        return None
+
+    def set_last_seen(self, dev_eui, last_seen_dt, application_id=None):
+        """Updates a single device, e.g. from an uplink, without a server round trip.
+
+        With `application_id`, a device the listings have not seen yet (e.g. one just
+        added) is answered from the cache while that application's listing is fresh.
+        """
+        with self.lock:
+            self.last_seen[dev_eui] = last_seen_dt
+            if application_id is not None:
+                self.application_of[dev_eui] = application_id
+
+    def remove(self, dev_eui):
+        with self.lock:
+            self.last_seen.pop(dev_eui, None)
+            self.application_of.pop(dev_eui, None)
+
+    def invalidate(self):
+        with self.lock:
+            self.refreshed_at = {}
+
+    def get(self, dev_eui):
+        """Returns the status dict of a device, or None if the cache cannot answer."""
+        with self.lock:
+            if dev_eui not in self.last_seen or self.is_stale(self.application_of.get(dev_eui)):
+                self.misses += 1
+                return None
+            self.hits += 1
+            last_seen_dt = self.last_seen[dev_eui]
+        return self.status_from_last_seen(last_seen_dt)
+
+    def status_from_last_seen(self, last_seen_dt):
+        if last_seen_dt is None:
+            return {"last_seen": "Unknown", "is_online": False}
+        return {"last_seen": last_seen_dt, "is_online": datetime.now() - last_seen_dt < self.online_window}
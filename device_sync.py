@@ -0,0 +1,78 @@
+# device_sync.py
+
+from end_node import EndNode
+
+
+class DeviceChanges:
+    """What changed in the application's device list since the previous sync."""
+
+    def __init__(self):
+        self.added = []  # EndNode
+        self.removed = []  # dev_eui
+        self.modified = []  # EndNode with the new name, type or tags
+        self.last_seen = {}  # dev_eui -> datetime or None, only for devices whose last_seen_at changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified or self.last_seen)
+
+    def __str__(self):
+        return (f"{len(self.added)} added, {len(self.removed)} removed, {len(self.modified)} modified, "
+                f"{len(self.last_seen)} seen")
+
+
+class DeviceSync:
+    """Reconciles the NodeManager with the device list on the server.
+
+    Every sync still has to list the devices (ChirpStack cannot filter by
+    updated_at), but each device is only compared field by field when its
+    updated_at changed, and only the resulting diff is handed to the UI and
+    the status cache.
+    """
+
+    def __init__(self, chirpstack_client, node_manager, application_id, max_workers=4):
+        self.chirpstack_client = chirpstack_client
+        self.node_manager = node_manager
+        self.application_id = application_id
+        self.max_workers = max_workers
+        self.versions = {}  # dev_eui -> (updated_at seconds, last_seen_at seconds or None)
+
+    def fetch_changes(self, timeout=None):
+        """Lists the devices and returns a DeviceChanges. Runs off the Tk thread, raises grpc.RpcError."""
+        pages = self.chirpstack_client.iter_devices(self.application_id, max_workers=self.max_workers,
+                                                    timeout=timeout)
+        devices = [device for page in pages for device in page]
+        return self.diff(devices)
+
+    def diff(self, devices):
+        changes = DeviceChanges()
+        known = {node.dev_eui: node for node in self.node_manager.get_all_nodes()}
+        versions = {}
+        for device in devices:
+            updated_at = device.updated_at.seconds if device.HasField('updated_at') else 0
+            last_seen_at = device.last_seen_at.seconds if device.HasField('last_seen_at') else None
+            versions[device.dev_eui] = (updated_at, last_seen_at)
+            previous = self.versions.get(device.dev_eui)
+
+            node = known.pop(device.dev_eui, None)
+            if node is None:
+                changes.added.append(self._to_node(device))
+            elif previous is None or previous[0] != updated_at:
+                new_node = self._to_node(device)
+                if (new_node.name, new_node.device_type, new_node.tags) != (node.name, node.device_type, node.tags):
+                    changes.modified.append(new_node)
+
+            if previous is None or previous[1] != last_seen_at:
+                changes.last_seen[device.dev_eui] = self.chirpstack_client.status_cache.last_seen_from_device(device)
+        changes.removed = list(known)
+        self.versions = versions
+        return changes
+
+    def _to_node(self, device):
+        return EndNode(dev_eui=device.dev_eui, name=device.name, device_type=self.node_manager.get_device_type(device),
+                       tags=dict(device.tags))
+
+    def apply(self, changes):
+        """Applies a diff to the NodeManager and the status cache. In the GUI, call on the Tk thread."""
+        self.node_manager.apply_changes(changes.added, changes.removed, changes.modified)
+        self.chirpstack_client.status_cache.apply_changes(changes.last_seen, changes.removed,
+                                                           self.application_id)
@@ -0,0 +1,7 @@
+DEVICE_TYPES = [
+    "LiDAR unit",
+    "LiDAR Simulated Unit",
+    "Sound Unit",
+    "Wearable Alert Unit",
+    "Blank Unit"
+]
\ No newline at end of file
@@ -0,0 +1,191 @@
+# downlink_tracker.py
+
+import itertools
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket is open ended
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800]
+
+ENQUEUED = "enqueued"
+TXACK = "txack"
+ACKED = "acked"
+NACKED = "nacked"
+TIMEOUT = "timeout"
+
+
+class PendingDownlink:
+    __slots__ = ("queue_item_id", "dev_eui", "data", "confirmed", "enqueued_at", "txack_at", "slot", "rounds")
+
+    def __init__(self, queue_item_id, dev_eui, data, confirmed, enqueued_at):
+        self.queue_item_id = queue_item_id
+        self.dev_eui = dev_eui
+        self.data = data
+        self.confirmed = confirmed
+        self.enqueued_at = enqueued_at
+        self.txack_at = None
+        self.slot = None
+        self.rounds = 0
+
+
+class DownlinkTracker:
+    """Links enqueued downlinks to their txack/ack events and measures the delivery latency.
+
+    Pending downlinks are keyed by ChirpStack's queue item id, with a per-device
+    FIFO as fallback for events without one; a downlink enqueued without an id
+    gets a local key and is only matched through that FIFO. The latencies go to
+    the metrics registry. Timeouts use a timer wheel of
+    `wheel_size` slots advanced every `tick` seconds by a single thread, so
+    expiring thousands of downlinks costs no thread or timer per item.
+    """
+
+    def __init__(self, timeout=3600, tick=1.0, wheel_size=512, on_change=None):
+        self.timeout = timeout
+        self.tick = tick
+        self.on_change = on_change  # on_change(dev_eui, state), called from MQTT or the tracker thread
+        self.pending = {}  # queue item id -> PendingDownlink
+        self.pending_by_device = {}  # dev_eui -> deque of queue item ids, oldest first
+        self.delivery = {}  # dev_eui -> (state, seconds since enqueue, time.time())
+        self.wheel = [set() for _ in range(wheel_size)]
+        self.position = 0
+        self.enqueue_to_txack = metrics.histogram("downlink_latency_seconds", "Downlink delivery latency",
+                                                  LATENCY_BUCKETS, stage="enqueue_to_txack")
+        self.txack_to_ack = metrics.histogram("downlink_latency_seconds", "Downlink delivery latency",
+                                              LATENCY_BUCKETS, stage="txack_to_ack")
+        self.enqueue_to_ack = metrics.histogram("downlink_latency_seconds", "Downlink delivery latency",
+                                                LATENCY_BUCKETS, stage="enqueue_to_ack")
+        self.local_ids = itertools.count(1)
+        self.counts = {ENQUEUED: 0, TXACK: 0, ACKED: 0, NACKED: 0, TIMEOUT: 0}
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="downlink-tracker", daemon=True)
+        self.thread.start()
+
+    def track(self, dev_eui, queue_item_id, data, confirmed=True):
+        now = time.monotonic()
+        ticks = max(1, int(self.timeout / self.tick))
+        with self.lock:
+            if not queue_item_id:
+                queue_item_id = f"local-{next(self.local_ids)}"
+            previous = self.pending.get(queue_item_id)
+            if previous is not None:
+                # The same id enqueued again, the newer downlink replaces it
+                self._unlink(previous)
+            item = PendingDownlink(queue_item_id, dev_eui, data, confirmed, now)
+            item.slot = (self.position + ticks) % len(self.wheel)
+            item.rounds = (ticks - 1) // len(self.wheel)
+            self.wheel[item.slot].add(queue_item_id)
+            self.pending[queue_item_id] = item
+            self.pending_by_device.setdefault(dev_eui, deque()).append(queue_item_id)
+            self.counts[ENQUEUED] += 1
+            self.delivery[dev_eui] = (ENQUEUED, 0.0, time.time())
+        self._notify(dev_eui, ENQUEUED)
+
+    def _find(self, dev_eui, queue_item_id):
+        # An id that is not pending (a duplicate, or a downlink of another instance or from before a
+        # restart) matches nothing; only events without an id fall back to the device's oldest downlink
+        if queue_item_id:
+            return self.pending.get(queue_item_id)
+        queued = self.pending_by_device.get(dev_eui)
+        return self.pending[queued[0]] if queued else None
+
+    def _complete(self, item, state, now):
+        self._unlink(item)
+        self.counts[state] += 1
+        self.delivery[item.dev_eui] = (state, now - item.enqueued_at, time.time())
+
+    def _unlink(self, item):
+        self.pending.pop(item.queue_item_id, None)
+        self.wheel[item.slot].discard(item.queue_item_id)
+        queued = self.pending_by_device.get(item.dev_eui)
+        if queued is not None:
+            try:
+                queued.remove(item.queue_item_id)
+            except ValueError:
+                pass
+            if not queued:
+                del self.pending_by_device[item.dev_eui]
+
+    def on_txack(self, dev_eui, queue_item_id=None):
+        now = time.monotonic()
+        with self.lock:
+            item = self._find(dev_eui, queue_item_id)
+            if item is None or item.txack_at is not None:
+                return
+            item.txack_at = now
+            self.counts[TXACK] += 1
+            self.enqueue_to_txack.observe(now - item.enqueued_at)
+            if item.confirmed:
+                self.delivery[dev_eui] = (TXACK, now - item.enqueued_at, time.time())
+                state = TXACK
+            else:
+                # Unconfirmed downlinks never get an ack, transmission is as far as we can follow them
+                self._complete(item, ACKED, now)
+                state = ACKED
+        self._notify(dev_eui, state)
+
+    def on_ack(self, dev_eui, queue_item_id=None, acknowledged=True):
+        now = time.monotonic()
+        with self.lock:
+            item = self._find(dev_eui, queue_item_id)
+            if item is None:
+                return
+            if item.txack_at is not None:
+                self.txack_to_ack.observe(now - item.txack_at)
+            state = ACKED if acknowledged else NACKED
+            if acknowledged:
+                self.enqueue_to_ack.observe(now - item.enqueued_at)
+            self._complete(item, state, now)
+        self._notify(dev_eui, state)
+
+    def advance(self):
+        """Moves the wheel one slot and times out what is due there."""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            self.position = (self.position + 1) % len(self.wheel)
+            for queue_item_id in list(self.wheel[self.position]):
+                item = self.pending.get(queue_item_id)
+                if item is None:
+                    self.wheel[self.position].discard(queue_item_id)
+                    continue
+                if item.rounds:
+                    item.rounds -= 1
+                    continue
+                self._complete(item, TIMEOUT, now)
+                expired.append(item.dev_eui)
+        for dev_eui in expired:
+            self._notify(dev_eui, TIMEOUT)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.tick)
+            self.advance()
+
+    def _notify(self, dev_eui, state):
+        if self.on_change:
+            try:
+                self.on_change(dev_eui, state)
+            except Exception as e:
+                print(f"Error reporting downlink state: {e}")
+
+    def get_delivery(self, dev_eui):
+        """Returns (state, seconds since enqueue, wall clock time of the change) of the node's latest downlink."""
+        with self.lock:
+            return self.delivery.get(dev_eui)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "pending": len(self.pending),
+                "counts": dict(self.counts),
+                "enqueue_to_txack": self.enqueue_to_txack.get(),
+                "txack_to_ack": self.txack_to_ack.get(),
+                "enqueue_to_ack": self.enqueue_to_ack.get(),
+            }
+
+    def stop(self):
+        self.running = False
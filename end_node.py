@@ -1,8 +1,11 @@
 class EndNode:
-    def __init__(self, dev_eui, name, device_type):
+    __slots__ = ("dev_eui", "name", "device_type", "tags")
+
+    def __init__(self, dev_eui, name, device_type, tags=None):
         self.dev_eui = dev_eui
         self.name = name
         self.device_type = device_type
+        self.tags = tags or {}  # ChirpStack device tags
 
     def __str__(self):
         return self.name
\ No newline at end of file
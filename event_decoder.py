@@ -0,0 +1,140 @@
+# event_decoder.py
+
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional, the standard library parser is used without it
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+
+def json_loads(payload):
+    """Parses a JSON payload straight from the bytes, with orjson when it is installed."""
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+class JsonDecoder:
+    """Decodes ChirpStack's JSON MQTT encoding (the default of the MQTT integration).
+
+    `event_type` is not used: neither parser can skip fields, so every event is
+    parsed in full. Only the up events carry the large rxInfo and data fields,
+    and their handler reads rxInfo; the other event types are a few hundred
+    bytes. Laziness by topic suffix therefore happens before decoding, in
+    on_message, which drops the event types without a handler undecoded.
+    """
+
+    name = f"json ({JSON_BACKEND})"
+
+    def decode(self, event_type, payload):
+        return json_loads(payload)
+
+
+class ProtobufDecoder:
+    """Decodes ChirpStack's protobuf MQTT encoding (`json=false` in the MQTT integration).
+
+    Each event type is parsed into its chirpstack_api.integration message, and
+    only the fields the handlers and alert rules use are converted, in the same
+    camelCase layout as the JSON events. The raw `data` of uplinks and the
+    tx info are never converted.
+    """
+
+    name = "protobuf"
+
+    def __init__(self):
+        # Imported here so the JSON path never loads the integration messages
+        from chirpstack_api import integration
+
+        self.integration = integration
+        self.parsers = {
+            "up": (integration.UplinkEvent, self._uplink),
+            "join": (integration.JoinEvent, self._join),
+            "status": (integration.StatusEvent, self._status),
+            "ack": (integration.AckEvent, self._ack),
+            "txack": (integration.TxAckEvent, self._txack),
+            "log": (integration.LogEvent, self._log),
+        }
+
+    def decode(self, event_type, payload):
+        message_class, convert = self.parsers[event_type]
+        event = message_class()
+        event.ParseFromString(payload)
+        return convert(event)
+
+    def _struct(self, struct):
+        # Walks the Value kinds directly, which is faster than json_format.MessageToDict
+        return {key: self._value(value) for key, value in struct.fields.items()}
+
+    def _value(self, value):
+        kind = value.WhichOneof('kind')
+        if kind == 'struct_value':
+            return self._struct(value.struct_value)
+        if kind == 'list_value':
+            return [self._value(item) for item in value.list_value.values]
+        if kind == 'null_value' or kind is None:
+            return None
+        return getattr(value, kind)
+
+    def _device_info(self, info):
+        return {
+            "tenantId": info.tenant_id,
+            "applicationId": info.application_id,
+            "deviceProfileName": info.device_profile_name,
+            "deviceName": info.device_name,
+            "devEui": info.dev_eui,
+            "tags": dict(info.tags),
+        }
+
+    def _uplink(self, event):
+        return {
+            "deviceInfo": self._device_info(event.device_info),
+            "fCnt": event.f_cnt,
+            "fPort": event.f_port,
+            "dr": event.dr,
+            "object": self._struct(event.object) if event.HasField('object') else {},
+            "rxInfo": [{"gatewayId": rx.gateway_id, "rssi": rx.rssi, "snr": rx.snr} for rx in event.rx_info],
+        }
+
+    def _join(self, event):
+        return {"deviceInfo": self._device_info(event.device_info), "devAddr": event.dev_addr}
+
+    def _status(self, event):
+        status = {
+            "deviceInfo": self._device_info(event.device_info),
+            "margin": event.margin,
+            "externalPowerSource": event.external_power_source,
+        }
+        if not event.battery_level_unavailable:
+            status["batteryLevel"] = event.battery_level
+        return status
+
+    def _ack(self, event):
+        return {"deviceInfo": self._device_info(event.device_info), "queueItemId": event.queue_item_id,
+                "acknowledged": event.acknowledged, "fCntDown": event.f_cnt_down}
+
+    def _txack(self, event):
+        return {"deviceInfo": self._device_info(event.device_info), "queueItemId": event.queue_item_id,
+                "gatewayId": event.gateway_id, "fCntDown": event.f_cnt_down}
+
+    def _log(self, event):
+        return {
+            "deviceInfo": self._device_info(event.device_info),
+            "level": self.integration.LogLevel.Name(event.level),
+            "code": self.integration.LogCode.Name(event.code),
+            "description": event.description,
+            "context": dict(event.context),
+        }
+
+
+DECODERS = {"json": JsonDecoder, "protobuf": ProtobufDecoder}
+
+
+def get_decoder(encoding="json"):
+    """Returns the decoder of an MQTT encoding; further encodings can be added to DECODERS."""
+    try:
+        return DECODERS[encoding]()
+    except KeyError:
+        raise ValueError(f"Unknown MQTT encoding: {encoding}") from None
@@ -0,0 +1,375 @@
+# event_engine.py
+
+import time
+from datetime import datetime
+
+import grpc
+
+import metrics
+from alert_dispatcher import AlertDispatcher
+from alert_rules import RuleSet, default_rules, load_rules
+from broadcast_scheduler import BroadcastScheduler
+from device_sync import DeviceSync
+from downlink_tracker import DownlinkTracker
+from event_decoder import get_decoder
+from event_store import EventStore
+from ingestion_pipeline import IngestionPipeline
+from link_quality import LinkQualityStore
+from log_writer import LogWriter
+from mqtt_capture import CaptureWriter
+from mqtt_connection import MqttConnection
+from node_manager import NodeManager
+
+LOG_FILE = "events_log.txt"
+ALERT_MARKER = "ALERT: "  # Starts every alert line of the event log, whatever the rule's template says
+
+ALERT_RESPONDER_TYPES = ["Sound Unit", "Wearable Alert Unit", "LiDAR unit"]
+ALERT_RESPONSE = "FF"
+
+
+def get_time():
+    return datetime.now().strftime("%Y-%m-%d, %H:%M:%S")
+
+
+def load_applications(config):
+    """Returns the application settings of config.json: the `applications` list, else the single `app_id`.
+
+    Entries inherit `tenant_id`, `alert` and `rules` from the top level when they do not set their own.
+    """
+    defaults = {"tenant_id": config.get('tenant_id'), "alert": config.get('alert', {}), "rules": config.get('rules')}
+    entries = config.get('applications') or [{"app_id": config['app_id']}]
+    return [{**defaults, **entry} for entry in entries]
+
+
+class Application:
+    """One served ChirpStack application: its nodes, device sync and alert rules.
+
+    `rules` is a list of alert rules (see alert_rules.RuleSet) or the path of a
+    JSON file with them. Without rules, the built-in ones are used, with the
+    responders and payload from `alert`: `responder_types` and hex `response`.
+    """
+
+    def __init__(self, app_id, tenant_id, name, node_manager, device_sync, alert=None, rules=None):
+        alert = alert or {}
+        self.app_id = app_id
+        self.tenant_id = tenant_id
+        self.name = name or app_id
+        self.node_manager = node_manager
+        self.device_sync = device_sync
+        self.rules = RuleSet(load_rules(rules) if rules else
+                             default_rules(alert.get('responder_types', ALERT_RESPONDER_TYPES),
+                                           alert.get('response', ALERT_RESPONSE)))
+
+    def __str__(self):
+        return self.name
+
+
+class EventEngine:
+    """MQTT ingestion, event handlers, alert fan-out and logging, without any GUI.
+
+    Every application served is a separate partition with its own NodeManager
+    and alert rules, so events of one application never reach the nodes of
+    another. Front ends register with `subscribe(listener)`; a listener may
+    implement any of `on_event(text)`, `on_alert(text)`, `on_link_quality(dev_eui)`,
+    `on_downlink_state(dev_eui, state)`, `on_broadcast_progress(job)` and
+    `on_mqtt_state(connected, reason)`. Listeners
+    are called from the MQTT workers and other background threads, a GUI has to
+    hand the update to its own thread.
+    """
+
+    def __init__(self, chirpstack_client, config=None):
+        self.chirpstack_client = chirpstack_client
+        self.config = config or {}
+        self.listeners = []
+        self.applications = {}  # app_id -> Application
+        self.mqtt = MqttConnection(self.config.get('mqtt', {}), on_message=self.on_message,
+                                   on_state=self.on_mqtt_state)
+        self.capture = None  # CaptureWriter that records the raw MQTT traffic, see mqtt_capture.py
+
+        log_config = self.config.get('event_log', {})
+        self.log_file = log_config.get('path', LOG_FILE)
+        self.log_writer = LogWriter(
+            self.log_file,
+            fsync_interval=log_config.get('fsync_interval', 5.0),
+            max_bytes=log_config.get('max_bytes', 0),
+            rotate_interval=log_config.get('rotate_interval', 0),
+            compress=log_config.get('compress', False)
+        )
+        self.event_store = EventStore(self.config.get('event_store', 'events.db'))
+        self.link_quality = LinkQualityStore()
+        self.downlink_tracker = DownlinkTracker(timeout=self.config.get('downlink_timeout', 3600),
+                                                on_change=self.on_downlink_state)
+        chirpstack_client.downlink_tracker = self.downlink_tracker
+        self.alert_dispatcher = AlertDispatcher(chirpstack_client)
+        broadcast_config = self.config.get('broadcast', {})
+        self.broadcast_scheduler = BroadcastScheduler(
+            chirpstack_client,
+            path=broadcast_config.get('path', 'broadcast_jobs.json'),
+            interval=broadcast_config.get('interval', 1.0),
+            ack_timeout=broadcast_config.get('ack_timeout', 3600),
+            on_progress=self.on_broadcast_progress
+        )
+        # MQTT messages are handed from the network thread to a worker pool
+        ingestion_config = self.config.get('ingestion', {})
+        self.ingestion = IngestionPipeline(
+            self.process_message,
+            workers=ingestion_config.get('workers', 4),
+            max_queue=ingestion_config.get('max_queue', 10000),
+            policy=ingestion_config.get('policy', 'drop_oldest')
+        )
+        # Payloads are parsed by the worker that handles them, in the broker's encoding
+        self.decoder = get_decoder(self.config.get('mqtt', {}).get('encoding', 'json'))
+        self.handlers = {
+            "up": self.handle_uplink,
+            "join": self.handle_join,
+            "status": self.handle_status,
+            "ack": self.handle_ack,
+            "txack": self.handle_txack,
+            "log": self.handle_log,
+        }
+
+        # Metrics are looked up once here, the message path only observes them
+        metrics_config = self.config.get('metrics', {})
+        metrics.REGISTRY.enabled = metrics_config.get('enabled', True)
+        self.received_metrics = {event_type: metrics.counter("mqtt_messages_total", "MQTT events received",
+                                                             event=event_type) for event_type in self.handlers}
+        self.handle_metrics = {event_type: metrics.histogram("mqtt_handle_seconds", "Decode and handle time",
+                                                             event=event_type) for event_type in self.handlers}
+        metrics.gauge("ingestion_queue_depth", "MQTT events waiting for a worker", function=self.ingestion.depth)
+        metrics.counter("ingestion_dropped_total", "MQTT events dropped by the ingestion policy",
+                        function=lambda: self.ingestion.dropped)
+        metrics.counter("ingestion_errors_total", "MQTT events whose handler failed",
+                        function=lambda: self.ingestion.errors)
+        self.profiler = metrics.SamplingProfiler(metrics_config.get('profiler_interval', 0.01))
+        self.metrics_server = None
+        self.snapshot_writer = None
+
+    def add_application(self, app_id, tenant_id=None, name=None, alert=None, rules=None, node_manager=None):
+        """Serves the events of one more application and returns its Application."""
+        node_manager = node_manager or NodeManager()
+        application = Application(app_id, tenant_id, name, node_manager,
+                                  DeviceSync(self.chirpstack_client, node_manager, app_id), alert, rules)
+        self.applications[app_id] = application
+        return application
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, name, *args):
+        for listener in self.listeners:
+            callback = getattr(listener, name, None)
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error notifying {name}: {e}")
+
+    def emit_event(self, event_info):
+        self.log_writer.write(event_info)
+        self._notify("on_event", event_info)
+
+    def emit_alert(self, alert_info):
+        self.log_writer.write(ALERT_MARKER + alert_info)
+        self._notify("on_alert", alert_info)
+
+    def start(self):
+        """Starts logging and connects to the broker without waiting for the connection."""
+        self.log_writer.write(f"Application started at: {get_time()}")
+        self.start_metrics()
+        if self.config.get('capture'):
+            self.capture = CaptureWriter(self.config['capture'])
+        self.mqtt.start(self.mqtt.subscriptions(self.applications, self.handlers))
+
+    def start_metrics(self):
+        """Starts what config.json's `metrics` asks for: the HTTP endpoint, the snapshot file, the profiler."""
+        metrics_config = self.config.get('metrics', {})
+        if not metrics.REGISTRY.enabled:
+            return
+        if metrics_config.get('profiler'):
+            self.profiler.start()
+        if metrics_config.get('port'):
+            try:
+                self.metrics_server = metrics.MetricsServer(port=metrics_config['port'],
+                                                            host=metrics_config.get('host', "127.0.0.1"),
+                                                            profiler=self.profiler)
+            except OSError as e:
+                print(f"Error starting the metrics endpoint: {e}")
+        if metrics_config.get('snapshot_path'):
+            self.snapshot_writer = metrics.SnapshotWriter(metrics_config['snapshot_path'],
+                                                          interval=metrics_config.get('snapshot_interval', 60),
+                                                          profiler=self.profiler)
+
+    def sync_devices(self, timeout=None):
+        """Reconciles every application's nodes with the server. Blocks, call off the GUI thread."""
+        for application in list(self.applications.values()):
+            try:
+                changes = application.device_sync.fetch_changes(timeout=timeout)
+            except grpc.RpcError as e:
+                print(f"Error syncing devices of {application}: {e.details()}")
+                continue
+            application.device_sync.apply(changes)
+            if changes.added or changes.removed or changes.modified:
+                self.emit_event(f"{get_time()} - Device sync {application}: {changes}")
+
+    def stop(self):
+        self.mqtt.stop()
+        if self.capture:
+            self.capture.close()
+        self.ingestion.stop()
+        print(f"MQTT ingestion stats: {self.ingestion.stats()}")
+        self.alert_dispatcher.shutdown()
+        self.broadcast_scheduler.stop()
+        self.downlink_tracker.stop()
+        self.log_writer.write(f"Application closed at: {get_time()}")
+        self.log_writer.close()
+        self.event_store.close()
+        self.profiler.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.snapshot_writer:
+            self.snapshot_writer.stop()
+
+    def on_mqtt_state(self, connected, reason):
+        if connected:
+            self.emit_event(f"{get_time()} - MQTT connected to {self.mqtt.host}:{self.mqtt.port}, {reason}")
+        else:
+            self.emit_event(f"{get_time()} - MQTT connection to {self.mqtt.host}:{self.mqtt.port} lost ({reason}), "
+                            f"reconnecting")
+        self._notify("on_mqtt_state", connected, reason)
+
+    def on_message(self, client, userdata, msg):
+        # Only queue the message here, paho's network loop must never wait on a handler.
+        # Topics look like application/<app_id>/device/<dev_eui>/event/<type> and are split
+        # once, here. Events of other applications are dropped before they take a queue
+        # slot; sharding on the dev_eui keeps the events of one device in order.
+        if self.capture:
+            self.capture.write(msg.topic, msg.payload)
+        topic_parts = msg.topic.split('/')
+        if len(topic_parts) != 6:
+            return
+        application = self.applications.get(topic_parts[1])
+        if application is None or topic_parts[5] not in self.handlers:
+            return
+        self.received_metrics[topic_parts[5]].inc()
+        self.ingestion.submit(topic_parts[3], application, topic_parts[5], msg.payload)
+
+    def process_message(self, application, event_type, payload):
+        started = time.perf_counter()
+        try:
+            self.handlers[event_type](self.decoder.decode(event_type, payload), application)
+        finally:
+            self.handle_metrics[event_type].observe(time.perf_counter() - started)
+
+    def handle_uplink(self, data, application):
+        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
+        dev_eui = data['deviceInfo'].get('devEui')
+        if dev_eui:
+            # An uplink means the device is online right now, no need to ask the server
+            self.chirpstack_client.status_cache.set_last_seen(dev_eui, datetime.now(), application.app_id)
+        message = data.get('object', {}).get('message', 'No message')
+        rssi = data['rxInfo'][0]['rssi'] if 'rxInfo' in data and len(data['rxInfo']) > 0 else 'N/A'
+        snr = data['rxInfo'][0]['snr'] if 'rxInfo' in data and len(data['rxInfo']) > 0 else 'N/A'
+        if dev_eui and rssi != 'N/A' and snr != 'N/A':
+            gateway_id = data['rxInfo'][0].get('gatewayId', '')
+            self.link_quality.add(dev_eui, time.time(), rssi, snr, gateway_id)
+            self._notify("on_link_quality", dev_eui)
+
+        sender = application.node_manager.get_node(dev_eui) if dev_eui else None
+        for rule in application.rules.match(data, dev_eui, sender.device_type if sender else None):
+            if rule.alert:
+                self.emit_alert(rule.format_alert(data, device_name, dev_eui))
+            if rule.downlink_payload is not None:
+                # Fan out to the responders of the same application, off the MQTT thread
+                self.alert_dispatcher.dispatch(
+                    rule.responders(application.node_manager), rule.downlink_payload,
+                    on_sent=lambda node, success, result, rule=rule: self.on_alert_downlink_sent(
+                        application, rule, node, success, result),
+                    on_done=lambda report, rule=rule: self.on_alert_fan_out_done(rule, report))
+
+        timestamp = get_time()
+        event_info = f"{timestamp} - Uplink - Device: {device_name}, RSSI: {rssi}, SNR: {snr}, Message: {message}"
+        self.event_store.add_from_data("up", data, event_info,
+                                       {"rssi": rssi, "snr": snr, "message": message, "fPort": data.get('fPort')})
+        self.emit_event(event_info)
+
+    def on_alert_downlink_sent(self, application, rule, node, success, message):
+        timestamp = get_time()
+        payload = ", ".join(f"0x{byte:02X}" for byte in rule.downlink_payload)
+        if success:
+            event_info = f"{timestamp} - Downlink sent to device {node.name} - {node.dev_eui}, [{payload}] - {rule.name}"
+        else:
+            event_info = f"{timestamp} - Downlink to device {node.name} - {node.dev_eui} failed, [{payload}] - {rule.name}: {message}"
+        self.event_store.add("downlink", node.dev_eui, node.name, application.app_id, event_info,
+                             {"command": rule.name, "success": success})
+        self.emit_event(event_info)
+
+    def on_alert_fan_out_done(self, rule, report):
+        timestamp = get_time()
+        self.emit_event(f"{timestamp} - {rule.name} fan-out: {report}")
+
+    def handle_join(self, data, application):
+        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
+        dev_eui = data['deviceInfo'].get('devEui', 'Unknown DevEUI')
+
+        timestamp = get_time()
+        event_info = f"{timestamp} - Join - Device: {device_name}, DevEUI: {dev_eui}"
+        self.event_store.add_from_data("join", data, event_info)
+        self.emit_event(event_info)
+
+    def handle_status(self, data, application):
+        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
+        margin = data.get('margin', 'N/A')
+        battery = data.get('batteryLevel', 'N/A')
+        external_power = data.get('externalPowerSource', False)
+        last_seen = data.get('lastSeenAt', 'N/A')
+
+        timestamp = get_time()
+        event_info = f"{timestamp} - Status - Device: {device_name}, Margin: {margin}, Battery: {battery}, External Power: {external_power}, Last Seen: {last_seen}"
+        self.event_store.add_from_data("status", data, event_info,
+                                       {"margin": margin, "battery": battery, "external_power": external_power})
+        self.emit_event(event_info)
+
+    def handle_ack(self, data, application):
+        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
+        acknowledged = data.get('acknowledged', False)
+        dev_eui = data['deviceInfo'].get('devEui')
+        if dev_eui:
+            self.broadcast_scheduler.on_ack(dev_eui, data.get('queueItemId'), acknowledged)
+            self.downlink_tracker.on_ack(dev_eui, data.get('queueItemId'), acknowledged)
+
+        timestamp = get_time()
+        event_info = f"{timestamp} - ACK - Device: {device_name}, Acknowledged: {acknowledged}"
+        self.event_store.add_from_data("ack", data, event_info, {"acknowledged": acknowledged})
+        self.emit_event(event_info)
+
+    def handle_txack(self, data, application):
+        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
+        dev_eui = data['deviceInfo'].get('devEui')
+        if dev_eui:
+            self.broadcast_scheduler.on_txack(dev_eui, data.get('queueItemId'))
+            self.downlink_tracker.on_txack(dev_eui, data.get('queueItemId'))
+
+        timestamp = get_time()
+        event_info = f"{timestamp} - TXACK - Device: {device_name}"
+        self.event_store.add_from_data("txack", data, event_info)
+        self.emit_event(event_info)
+
+    def handle_log(self, data, application):
+        device_name = data['deviceInfo'].get('deviceName', 'Unknown device')
+        log_message = data.get('message', data.get('description', 'No message'))
+        level = data.get('level', 'Unknown level')
+
+        timestamp = get_time()
+        event_info = f"{timestamp} - Log - Device: {device_name}, Level: {level}, Message: {log_message}"
+        self.event_store.add_from_data("log", data, event_info, {"level": level, "message": log_message})
+        self.emit_event(event_info)
+
+    def on_downlink_state(self, dev_eui, state):
+        self._notify("on_downlink_state", dev_eui, state)
+
+    def on_broadcast_progress(self, job):
+        # Only finished jobs go to the log, running ones are shown by the front ends
+        if job.finished:
+            self.emit_event(f"{get_time()} - {job} - finished")
+        self._notify("on_broadcast_progress", job)
@@ -0,0 +1,192 @@
+# event_store.py
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+MAX_BATCH = 1000  # Events inserted with a single transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    event_type TEXT NOT NULL,
+    dev_eui TEXT,
+    device_name TEXT,
+    application_id TEXT,
+    summary TEXT,
+    fields TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_dev_eui_ts ON events (dev_eui, ts);
+CREATE INDEX IF NOT EXISTS events_type_ts ON events (event_type, ts);
+CREATE INDEX IF NOT EXISTS events_device_name_ts ON events (device_name, ts);
+"""
+
+# Full-text index of the summaries; trigrams keep "contains" matching without a scan of the whole table
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    summary, content='events', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+    INSERT INTO events_fts (rowid, summary) VALUES (new.id, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+    INSERT INTO events_fts (events_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+END;
+"""
+MIN_FTS_TEXT = 3  # Trigrams cannot match shorter text, that is searched with LIKE
+
+
+class EventStore:
+    """Structured event history in SQLite (WAL mode), indexed by time, dev_eui, device name and event type.
+
+    `add` only queues the event; a writer thread inserts everything queued so far
+    in one transaction. Queries use their own connection, which WAL lets read
+    while the writer is inserting. Summaries are searched through an FTS5
+    trigram index when the SQLite build has FTS5.
+    """
+
+    def __init__(self, path="events.db"):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.read_lock = threading.Lock()
+        self.read_connection = self._connect()
+        self.read_connection.executescript(SCHEMA)
+        self.full_text = self._create_full_text_index()
+        self.thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _create_full_text_index(self):
+        connection = self.read_connection
+        existed = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_fts'").fetchone() is not None
+        try:
+            connection.executescript(FTS_SCHEMA)
+            if not existed:
+                # Indexes the events stored before the index existed
+                with connection:
+                    connection.execute("INSERT INTO events_fts (events_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable, searching event summaries with LIKE: {e}")
+            return False
+        return True
+
+    def add(self, event_type, dev_eui=None, device_name=None, application_id=None, summary=None, fields=None,
+            ts=None):
+        self.queue.put((
+            ts if ts is not None else time.time(),
+            event_type,
+            dev_eui,
+            device_name,
+            application_id,
+            summary,
+            json.dumps(fields) if fields else None
+        ))
+
+    def add_from_data(self, event_type, data, summary=None, fields=None):
+        """Adds a ChirpStack integration event, taking the device fields from its deviceInfo."""
+        device_info = data.get('deviceInfo', {})
+        self.add(event_type, device_info.get('devEui'), device_info.get('deviceName'),
+                 device_info.get('applicationId'), summary, fields)
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything queued before this call is committed."""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        self.queue.put(None)
+        self.thread.join(timeout)
+        with self.read_lock:
+            self.read_connection.close()
+
+    def _run(self):
+        connection = self._connect()
+        running = True
+        while running:
+            items = [self.queue.get()]
+            while len(items) < MAX_BATCH:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = []
+            waiters = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    rows.append(item)
+            if rows:
+                try:
+                    with connection:
+                        connection.executemany(
+                            "INSERT INTO events (ts, event_type, dev_eui, device_name, application_id, summary, fields)"
+                            " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                except sqlite3.Error as e:
+                    print(f"Error storing {len(rows)} events: {e}")
+            for waiter in waiters:
+                waiter.set()
+        connection.close()
+
+    def query(self, dev_eui=None, device_name=None, event_type=None, since=None, until=None, text=None, limit=500):
+        """Returns matching events as dicts, newest first.
+
+        `since`/`until` are Unix timestamps, `text` matches a substring of the summary.
+        """
+        clauses = []
+        params = []
+        if dev_eui:
+            clauses.append("dev_eui = ?")
+            params.append(dev_eui)
+        if device_name:
+            clauses.append("device_name = ?")
+            params.append(device_name)
+        if event_type:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if text and self.full_text and len(text) >= MIN_FTS_TEXT:
+            clauses.append("id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)")
+            params.append('"' + text.replace('"', '""') + '"')
+        elif text:
+            clauses.append("summary LIKE ?")
+            params.append(f"%{text}%")
+        sql = "SELECT ts, event_type, dev_eui, device_name, application_id, summary, fields FROM events"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+
+        with self.read_lock:
+            rows = self.read_connection.execute(sql, params).fetchall()
+        return [
+            {
+                "ts": ts,
+                "event_type": event_type,
+                "dev_eui": dev_eui,
+                "device_name": device_name,
+                "application_id": application_id,
+                "summary": summary,
+                "fields": json.loads(fields) if fields else {},
+            }
+            for ts, event_type, dev_eui, device_name, application_id, summary, fields in rows
+        ]
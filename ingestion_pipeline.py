@@ -0,0 +1,117 @@
+# ingestion_pipeline.py
+
+import queue
+import threading
+import time
+
+DROP_OLDEST = "drop_oldest"  # Make room by discarding the oldest queued message
+DROP_NEWEST = "drop_newest"  # Discard the incoming message
+BLOCK = "block"  # Wait up to `block_timeout` seconds for room, then discard the incoming message
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class IngestionPipeline:
+    """Bounded hand-off between the MQTT network thread and the event handlers.
+
+    Messages are sharded over `workers` threads by key (the dev_eui), so the
+    events of one device are always handled in arrival order while different
+    devices are handled in parallel. Each shard holds at most
+    `max_queue // workers` messages; what happens when it is full is set by `policy`.
+    """
+
+    def __init__(self, handler, workers=4, max_queue=10000, policy=DROP_OLDEST, block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown ingestion policy: {policy}")
+        self.handler = handler
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.queues = [queue.Queue(maxsize=max(1, max_queue // workers)) for _ in range(workers)]
+        self.lock = threading.Lock()
+        self.received = 0
+        self.dropped = 0
+        self.handled = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.threads = [threading.Thread(target=self._work, args=(q,), name=f"ingestion-{i}", daemon=True)
+                        for i, q in enumerate(self.queues)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, key, *args):
+        """Queues `handler(*args)` on the shard of `key`. Returns False if the message was dropped."""
+        shard = self.queues[hash(key) % len(self.queues)]
+        with self.lock:
+            self.received += 1
+        try:
+            if self.policy == BLOCK:
+                shard.put(args, timeout=self.block_timeout)
+            elif self.policy == DROP_NEWEST:
+                shard.put_nowait(args)
+            else:
+                while True:
+                    try:
+                        shard.put_nowait(args)
+                        break
+                    except queue.Full:
+                        try:
+                            shard.get_nowait()
+                            shard.task_done()
+                            self._count_drop()
+                        except queue.Empty:
+                            pass
+            return True
+        except queue.Full:
+            self._count_drop()
+            return False
+
+    def _count_drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def _work(self, shard):
+        while True:
+            args = shard.get()
+            if args is None:
+                shard.task_done()
+                break
+            started = time.perf_counter()
+            failed = False
+            try:
+                self.handler(*args)
+            except Exception as e:
+                failed = True
+                print(f"Error handling message: {e}")
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.handled += 1
+                self.errors += failed
+                self.latency_total += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+            shard.task_done()
+
+    def depth(self):
+        return sum(shard.qsize() for shard in self.queues)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.depth(),
+                "received": self.received,
+                "dropped": self.dropped,
+                "handled": self.handled,
+                "errors": self.errors,
+                "avg_latency_ms": self.latency_total / self.handled * 1000 if self.handled else 0.0,
+                "max_latency_ms": self.latency_max * 1000,
+            }
+
+    def stop(self, timeout=2.0):
+        """Lets the workers finish what is already queued, waiting at most `timeout` seconds."""
+        for shard in self.queues:
+            try:
+                shard.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,161 @@
+# link_quality.py
+
+import threading
+from array import array
+
+SAMPLE_CAPACITY = 128  # Raw samples kept per device
+MINUTE_BUCKETS = 60  # One hour of per-minute rollups
+HOUR_BUCKETS = 48  # Two days of per-hour rollups
+
+
+class Rollup:
+    """Fixed number of time buckets with min/avg/max RSSI and SNR, oldest overwritten first."""
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.bucket = array('i', [-1]) * capacity  # Bucket number (timestamp // bucket_seconds) of each slot
+        self.count = array('I', [0]) * capacity
+        self.rssi_min = array('f', [0.0]) * capacity
+        self.rssi_max = array('f', [0.0]) * capacity
+        self.rssi_sum = array('f', [0.0]) * capacity
+        self.snr_min = array('f', [0.0]) * capacity
+        self.snr_max = array('f', [0.0]) * capacity
+        self.snr_sum = array('f', [0.0]) * capacity
+        self.latest = -1
+
+    def add(self, ts, rssi, snr):
+        bucket = int(ts // self.bucket_seconds)
+        if bucket < self.latest - self.capacity + 1:
+            return  # Older than anything we keep
+        slot = bucket % self.capacity
+        if self.bucket[slot] != bucket:
+            self.bucket[slot] = bucket
+            self.count[slot] = 0
+            self.rssi_sum[slot] = 0.0
+            self.snr_sum[slot] = 0.0
+        if self.count[slot] == 0:
+            self.rssi_min[slot] = self.rssi_max[slot] = rssi
+            self.snr_min[slot] = self.snr_max[slot] = snr
+        else:
+            self.rssi_min[slot] = min(self.rssi_min[slot], rssi)
+            self.rssi_max[slot] = max(self.rssi_max[slot], rssi)
+            self.snr_min[slot] = min(self.snr_min[slot], snr)
+            self.snr_max[slot] = max(self.snr_max[slot], snr)
+        self.count[slot] += 1
+        self.rssi_sum[slot] += rssi
+        self.snr_sum[slot] += snr
+        self.latest = max(self.latest, bucket)
+
+    def buckets(self):
+        """Returns the filled buckets, oldest first, as dicts with start timestamp and min/avg/max values."""
+        result = []
+        for bucket in range(self.latest - self.capacity + 1, self.latest + 1):
+            slot = bucket % self.capacity
+            if bucket < 0 or self.bucket[slot] != bucket or not self.count[slot]:
+                continue
+            count = self.count[slot]
+            result.append({
+                "start": bucket * self.bucket_seconds,
+                "count": count,
+                "rssi_min": self.rssi_min[slot],
+                "rssi_avg": self.rssi_sum[slot] / count,
+                "rssi_max": self.rssi_max[slot],
+                "snr_min": self.snr_min[slot],
+                "snr_avg": self.snr_sum[slot] / count,
+                "snr_max": self.snr_max[slot],
+            })
+        return result
+
+
+class LinkHistory:
+    """Ring buffer of (timestamp, rssi, snr, gateway) samples of one device plus its rollups.
+
+    Everything is preallocated in typed arrays, so a device costs the same
+    memory after a minute as after a month.
+    """
+
+    def __init__(self, capacity=SAMPLE_CAPACITY):
+        self.capacity = capacity
+        self.ts = array('d', [0.0]) * capacity
+        self.rssi = array('f', [0.0]) * capacity
+        self.snr = array('f', [0.0]) * capacity
+        self.gateway = array('I', [0]) * capacity  # Index into LinkQualityStore.gateways, 32-bit so any fleet fits
+        self.next = 0
+        self.size = 0
+        self.minutes = Rollup(60, MINUTE_BUCKETS)
+        self.hours = Rollup(3600, HOUR_BUCKETS)
+
+    def add(self, ts, rssi, snr, gateway):
+        self.ts[self.next] = ts
+        self.rssi[self.next] = rssi
+        self.snr[self.next] = snr
+        self.gateway[self.next] = gateway
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.minutes.add(ts, rssi, snr)
+        self.hours.add(ts, rssi, snr)
+
+    def samples(self):
+        """Returns the raw samples, oldest first, as (ts, rssi, snr, gateway index) tuples."""
+        start = (self.next - self.size) % self.capacity
+        return [(self.ts[i], self.rssi[i], self.snr[i], self.gateway[i])
+                for i in ((start + n) % self.capacity for n in range(self.size))]
+
+    def latest(self):
+        if not self.size:
+            return None
+        i = (self.next - 1) % self.capacity
+        return self.ts[i], self.rssi[i], self.snr[i], self.gateway[i]
+
+
+class LinkQualityStore:
+    """Per dev_eui link quality history, fed by uplinks."""
+
+    def __init__(self, capacity=SAMPLE_CAPACITY):
+        self.capacity = capacity
+        self.histories = {}  # dev_eui -> LinkHistory
+        self.gateways = []  # Gateway ids, referenced by index from the sample arrays
+        self.gateway_index = {}
+        self.lock = threading.Lock()
+
+    def add(self, dev_eui, ts, rssi, snr, gateway_id=""):
+        with self.lock:
+            gateway = self.gateway_index.get(gateway_id)
+            if gateway is None:
+                gateway = self.gateway_index[gateway_id] = len(self.gateways)
+                self.gateways.append(gateway_id)
+            history = self.histories.get(dev_eui)
+            if history is None:
+                history = self.histories[dev_eui] = LinkHistory(self.capacity)
+            history.add(ts, rssi, snr, gateway)
+
+    def remove(self, dev_eui):
+        with self.lock:
+            self.histories.pop(dev_eui, None)
+
+    def latest(self, dev_eui):
+        """Returns the newest sample of a device as a dict, or None."""
+        with self.lock:
+            history = self.histories.get(dev_eui)
+            sample = history.latest() if history else None
+            if sample is None:
+                return None
+            ts, rssi, snr, gateway = sample
+            return {"ts": ts, "rssi": rssi, "snr": snr, "gateway_id": self.gateways[gateway]}
+
+    def samples(self, dev_eui):
+        with self.lock:
+            history = self.histories.get(dev_eui)
+            if not history:
+                return []
+            return [{"ts": ts, "rssi": rssi, "snr": snr, "gateway_id": self.gateways[gateway]}
+                    for ts, rssi, snr, gateway in history.samples()]
+
+    def rollups(self, dev_eui, resolution="minute"):
+        """Returns the per-minute or per-hour min/avg/max buckets of a device, oldest first."""
+        with self.lock:
+            history = self.histories.get(dev_eui)
+            if not history:
+                return []
+            return (history.minutes if resolution == "minute" else history.hours).buckets()
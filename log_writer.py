@@ -0,0 +1,135 @@
+# log_writer.py
+
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+MAX_BATCH = 1000  # Lines written with a single write call
+
+
+class LogWriter:
+    """Appends lines to a log file from a dedicated thread.
+
+    `write` only queues the line. The writer thread takes everything queued so
+    far and writes it with one call, then fsyncs once `fsync_bytes` are unsynced
+    or `fsync_interval` seconds have passed (0 syncs every batch). The file is rotated when it grows
+    past `max_bytes` or is older than `rotate_interval` seconds (0 disables
+    either); rotated files get a timestamp suffix and are gzipped if `compress`.
+    """
+
+    def __init__(self, path, fsync_interval=5.0, fsync_bytes=1024 * 1024, max_bytes=0, rotate_interval=0,
+                 compress=False):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.queue = queue.SimpleQueue()
+        self.lines_metric = metrics.counter("log_lines_total", "Lines queued for the event log")
+        self.write_metric = metrics.histogram("log_write_seconds", "Time to write (and fsync) one batch of log lines")
+        metrics.gauge("log_queue_depth", "Log lines waiting for the writer thread", function=self.queue.qsize)
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        self.queue.put(line)
+        self.lines_metric.inc()
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything queued before this call is written to the file."""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _open(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.opened_at = time.monotonic()
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def _needs_rotation(self):
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self.opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        self._sync()
+        self.file.close()
+        rotated = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(f"{rotated}.gz"):
+            rotated = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            threading.Thread(target=self._compress, args=(rotated,), daemon=True).start()
+        self._open()
+
+    def _compress(self, path):
+        try:
+            with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+        except OSError as e:
+            print(f"Error compressing rotated log {path}: {e}")
+
+    def _run(self):
+        self._open()
+        running = True
+        while running:
+            try:
+                # With fsync_interval 0 every batch is synced, there is nothing to wake up for
+                items = [self.queue.get(timeout=self.fsync_interval or None)]
+            except queue.Empty:
+                items = []
+            while len(items) < MAX_BATCH:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiters = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(item + "\n")
+            started = time.perf_counter()
+            try:
+                if lines:
+                    data = "".join(lines)
+                    self.file.write(data)
+                    self.file.flush()
+                    self.unsynced += len(data)
+                if self.unsynced and (not running or self.unsynced >= self.fsync_bytes
+                                      or time.monotonic() - self.synced_at >= self.fsync_interval):
+                    self._sync()
+                if running and self._needs_rotation():
+                    self._rotate()
+            except OSError as e:
+                print(f"Error writing to {self.path}: {e}")
+            if lines:
+                self.write_metric.observe(time.perf_counter() - started)
+            for waiter in waiters:
+                waiter.set()
+        self.file.close()
@@ -1,25 +1,47 @@
-import tkinter as tk
-from config_dialog import ConfigDialog
-from app import App
-from chirpstack_client import ChirpStackClient
+import argparse
+import importlib
+import json
+import threading
+
+# Imported in the background while the configuration dialog is open, so the main window does not wait for them
+HEAVY_MODULES = ("grpc", "chirpstack_client", "paho.mqtt.client", "app")
+
+
+def preload_modules():
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Error preloading {name}: {e}")
+
 
 def main():
+    import tkinter as tk
+    from config_dialog import ConfigDialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window initially
 
     # Show the configuration dialog
     config_dialog_window = tk.Toplevel(root)
     config_dialog = ConfigDialog(config_dialog_window)
+    threading.Thread(target=preload_modules, name="preload", daemon=True).start()
 
     # Wait until the config dialog is closed
     root.wait_window(config_dialog_window)
 
     # Check if configuration was completed successfully
     if config_dialog.config_complete:
+        # Already loaded by the preload thread, or waits for it to finish
+        from app import App
+        from chirpstack_client import ChirpStackClient
+
         # Create an instance of ChirpStackClient with the configuration
         chirpstack_client = ChirpStackClient(
             f"{config_dialog.server_address.get()}:{config_dialog.server_port.get()}",
-            config_dialog.api_token.get()
+            config_dialog.api_token.get(),
+            status_ttl=config_dialog.config.get('status_cache_ttl', 30),
+            online_window_minutes=config_dialog.config.get('online_window_minutes', 10)
         )
 
         root.deiconify()  # Show the main window
@@ -28,11 +50,31 @@ def main():
             config_dialog.devices,
             chirpstack_client,
             config_dialog.app_id.get(),  # Pass the App ID to the App class
-            config_dialog.tenant_id.get()  # Pass the Tenant ID to the App class
+            config_dialog.tenant_id.get(),  # Pass the Tenant ID to the App class
+            config_dialog.config
         )
         root.mainloop()  # Start the Tkinter event loop
     else:
         root.quit()  # Exit the application if not continuing
 
+
+def main_headless(config_path):
+    # No Tk imports on this path, a server without a display never loads them
+    import daemon
+
+    with open(config_path, 'r') as file:
+        config = json.load(file)
+    daemon.run(config)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ChirpStack node management.")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run the event and alert engine without a GUI, configured from config.json")
+    parser.add_argument("--config", default="config.json",
+                        help="Configuration file of --headless (default: config.json)")
+    args = parser.parse_args()
+    if args.headless:
+        main_headless(args.config)
+    else:
+        main()
@@ -0,0 +1,334 @@
+# metrics.py
+
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket is open ended
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Frames of threads that are waiting rather than working, left out of profiles
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "socket.py", "ssl.py", "socketserver.py")
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, function=None):
+        self.registry = registry
+        self.function = function  # Reads the value from elsewhere, e.g. an existing stats dict
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        if self.registry.enabled:
+            self.value = value
+
+
+class Histogram:
+    """Counts observations into fixed buckets; percentiles are the upper bound of the matching bucket."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, fraction):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return None
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= fraction * total:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def get(self):
+        with self.lock:
+            count, total = self.count, self.sum
+        if not count:
+            return {"count": 0}
+        return {"count": count, "avg": total / count, "p50": self.percentile(0.5), "p99": self.percentile(0.99)}
+
+
+class MetricsRegistry:
+    """Named metrics with optional labels, created on first use and shared by name.
+
+    With `enabled` off, every update returns right away, so instrumented code
+    pays one attribute check.
+    """
+
+    def __init__(self):
+        self.metrics = {}  # (name, ((label, value), ...)) -> metric
+        self.help = {}  # name -> help text
+        self.enabled = True
+        self.lock = threading.Lock()
+
+    def _get(self, name, help, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = factory()
+                    self.help.setdefault(name, help)
+        return metric
+
+    def counter(self, name, help="", function=None, **labels):
+        metric = self._get(name, help, labels, lambda: Counter(self, function))
+        if function:
+            metric.function = function  # The latest owner wins, e.g. a restarted engine
+        return metric
+
+    def gauge(self, name, help="", function=None, **labels):
+        metric = self._get(name, help, labels, lambda: Gauge(self, function))
+        if function:
+            metric.function = function
+        return metric
+
+    def histogram(self, name, help="", buckets=LATENCY_BUCKETS, **labels):
+        return self._get(name, help, labels, lambda: Histogram(self, buckets))
+
+    def _items(self):
+        with self.lock:
+            return sorted(self.metrics.items(), key=lambda item: item[0])
+
+    def snapshot(self):
+        """Returns {"name{label=value}": value or histogram summary}."""
+        result = {}
+        for (name, labels), metric in self._items():
+            try:
+                result[name + _format_labels(labels)] = metric.get()
+            except Exception as e:
+                print(f"Error reading metric {name}: {e}")
+        return result
+
+    def render_prometheus(self):
+        lines = []
+        described = set()
+        for (name, labels), metric in self._items():
+            if name not in described:
+                described.add(name)
+                if self.help.get(name):
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+            try:
+                if metric.kind == "histogram":
+                    with metric.lock:
+                        counts, count, total = list(metric.counts), metric.count, metric.sum
+                    cumulative = 0
+                    for bound, bucket_count in zip(metric.buckets + ["+Inf"], counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {metric.get()}")
+            except Exception as e:
+                print(f"Error reading metric {name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies, elapsed, errors=0, operations=None):
+    """Returns count, errors, throughput (operations per second) and p50/p99 latency in milliseconds."""
+    latencies = sorted(latencies)
+    operations = len(latencies) if operations is None else operations
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": operations / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every `interval` seconds while running.
+
+    Each sample is attributed to the innermost frame inside this package, so the
+    report shows which of our functions the time goes to. Threads waiting in
+    queues, locks or sockets are skipped. Stopped, it costs nothing.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = {}  # "file:line function" -> count
+        self.total = 0
+        self.lock = threading.Lock()  # Guards samples and total, read by the HTTP and UI threads
+        self.thread = None
+        self.stopping = None  # Event of the running sampler thread
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self.stopping,), name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops sampling and waits for the sampler thread, so a restart never runs two of them."""
+        if not self.running:
+            return
+        self.running = False
+        self.stopping.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.total = 0
+
+    def _run(self, stopping):
+        own_id = threading.get_ident()
+        while not stopping.is_set():
+            locations = [self._locate(frame) for thread_id, frame in sys._current_frames().items()
+                         if thread_id != own_id]
+            with self.lock:
+                for location in locations:
+                    if location is not None:
+                        self.samples[location] = self.samples.get(location, 0) + 1
+                        self.total += 1
+            stopping.wait(self.interval)
+
+    def _locate(self, frame):
+        if os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+            return None
+        while frame is not None and not frame.f_code.co_filename.startswith(PACKAGE_DIR):
+            frame = frame.f_back
+        if frame is None:
+            return None
+        return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+
+    def top(self, count=20):
+        """Returns the `count` most sampled locations as (location, samples, share) tuples."""
+        with self.lock:
+            samples = list(self.samples.items())
+            total = self.total
+        if not total:
+            return []
+        samples = sorted(samples, key=lambda item: item[1], reverse=True)[:count]
+        return [(location, hits, hits / total) for location, hits in samples]
+
+
+class MetricsServer:
+    """Serves the registry in the Prometheus text format at /metrics, and the profile at /profile."""
+
+    def __init__(self, registry=REGISTRY, port=9108, host="127.0.0.1", profiler=None):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.render_prometheus()
+                elif self.path == "/profile" and profiler:
+                    body = "".join(f"{share:6.1%} {hits:8} {location}\n" for location, hits, share in profiler.top(50))
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would flood the console
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnapshotWriter:
+    """Writes the registry (and the profile, if one runs) to a JSON file every `interval` seconds."""
+
+    def __init__(self, path, registry=REGISTRY, interval=60, profiler=None):
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self.profiler = profiler
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self.thread.start()
+
+    def write(self):
+        snapshot = {"time": time.time(), "metrics": self.registry.snapshot()}
+        if self.profiler and self.profiler.total:
+            snapshot["profile"] = self.profiler.top(50)
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(snapshot, file, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error writing metrics snapshot {self.path}: {e}")
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopping.set()
+        self.write()
@@ -0,0 +1,299 @@
+# mqtt_capture.py
+
+import argparse
+import gzip
+import json
+import os
+import signal
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+MAGIC = b"MQTTCAP1"
+RECORD_HEADER = struct.Struct("<dHI")  # Receive time, topic length, payload length
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of the capture file while recording
+
+
+def _open(path, mode):
+    # Captures ending in .gz are compressed, which suits long recordings of JSON events
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+class CaptureWriter:
+    """Appends raw MQTT messages to a capture file.
+
+    Every record is the receive time, the topic and the payload exactly as
+    the broker sent them, so a replay goes through the same decoding as live
+    traffic.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = _open(path, "wb")
+        self.file.write(MAGIC)
+        self.count = 0
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(self, topic, payload, timestamp=None):
+        topic = topic.encode('utf-8')
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(RECORD_HEADER.pack(time.time() if timestamp is None else timestamp, len(topic),
+                                               len(payload)))
+            self.file.write(topic)
+            self.file.write(payload)
+            self.count += 1
+            if time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.flushed_at = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_capture(path):
+    """Yields (timestamp, topic, payload) of every message in a capture; a truncated last record is skipped."""
+    with _open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an MQTT capture")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, topic_length, payload_length = RECORD_HEADER.unpack(header)
+            topic = file.read(topic_length)
+            payload = file.read(payload_length)
+            if len(payload) < payload_length:
+                return
+            yield timestamp, topic.decode('utf-8'), payload
+
+
+class CapturedMessage:
+    """Stands in for paho's MQTTMessage during a replay."""
+
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class StubChirpStackClient:
+    """Offline stand-in for ChirpStackClient during a replay.
+
+    The status cache is the real one; downlinks are only counted, each takes
+    `latency` seconds and fails with probability `error_rate`, like a slow or
+    flaky server would.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        # Imported here, recording needs neither the cache nor the random generator
+        import random
+        from device_status_cache import DeviceStatusCache
+
+        self.server = "replay"
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(3)
+        self.status_cache = DeviceStatusCache()
+        self.downlink_tracker = None
+        self.downlinks = 0
+        self.failed_downlinks = 0
+        self.lock = threading.Lock()
+
+    def enqueue_downlink(self, dev_eui, data, confirmed=True, f_port=10, timeout=None):
+        success, message, _ = self.enqueue_downlink_item(dev_eui, data, confirmed, f_port, timeout)
+        return success, message
+
+    def enqueue_downlink_item(self, dev_eui, data, confirmed=True, f_port=10, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            failed = self.error_rate and self.random.random() < self.error_rate
+            if failed:
+                self.failed_downlinks += 1
+            else:
+                self.downlinks += 1
+        if failed:
+            return False, "Failed to enqueue command: Injected error", None
+        queue_item_id = uuid.uuid4().hex
+        if self.downlink_tracker:
+            self.downlink_tracker.track(dev_eui, queue_item_id, data, confirmed)
+        return True, "Command enqueued successfully.", queue_item_id
+
+
+class ReplayListener:
+    def __init__(self):
+        self.alerts = 0
+
+    def on_alert(self, alert_info):
+        self.alerts += 1
+
+
+def record(config, path, duration=None):
+    """Writes every event of the configured applications to `path` until Ctrl+C or `duration` seconds."""
+    from event_engine import load_applications
+    from mqtt_connection import MqttConnection
+
+    writer = CaptureWriter(path)
+    # A session and share group of its own, the recorder must not take events away from a running engine
+    connection = MqttConnection({**config.get('mqtt', {}), "client_id": "", "persistent_session": False},
+                                on_message=lambda client, userdata, msg: writer.write(msg.topic, msg.payload),
+                                on_state=lambda connected, reason: print(
+                                    f"MQTT {'connected' if connected else 'disconnected'} ({reason})"))
+    app_ids = [settings['app_id'] for settings in load_applications(config)]
+    connection.start(connection.subscriptions(app_ids, ["+"], shared=False))
+    print(f"Recording to {path}")
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    stopping.wait(duration)
+    connection.stop()
+    writer.close()
+    print(f"Recorded {writer.count} messages to {path}")
+
+
+def replay(path, config=None, speed=1.0, snapshot=None, downlink_latency=0.0, downlink_error_rate=0.0):
+    """Feeds a capture through EventEngine.on_message and returns the throughput and handler latency.
+
+    `speed` scales the recorded gaps between messages (1 is real time, 100 is
+    100x faster, 0 replays as fast as the ingestion queue takes them). Without
+    a config, the applications are taken from the captured topics; nodes come
+    from a device snapshot so alert responders exist.
+    """
+    from device_snapshot import DeviceSnapshot
+    from event_engine import EventEngine, load_applications
+    from metrics import summarize
+
+    records = list(read_capture(path))
+    if not records:
+        raise ValueError(f"{path} holds no messages")
+    config = dict(config or {})
+    workdir = tempfile.TemporaryDirectory(prefix="chirpstack-replay-")
+    config.update({
+        "event_log": {"path": os.path.join(workdir.name, "events_log.txt")},
+        "event_store": os.path.join(workdir.name, "events.db"),
+        "broadcast": {"path": os.path.join(workdir.name, "broadcast_jobs.json")},
+    })
+    if 'app_id' in config or 'applications' in config:
+        applications = load_applications(config)
+    else:
+        app_ids = dict.fromkeys(topic.split('/')[1] for _, topic, _ in records if topic.count('/') == 5)
+        applications = [{"app_id": app_id, "tenant_id": None, "alert": config.get('alert', {}),
+                         "rules": config.get('rules')} for app_id in app_ids]
+
+    client = StubChirpStackClient(downlink_latency, downlink_error_rate)
+    engine = EventEngine(client, config)
+    try:
+        # Offline, the snapshot of any server will do
+        device_snapshot = DeviceSnapshot(snapshot) if snapshot else None
+        for settings in applications:
+            application = engine.add_application(settings['app_id'], settings['tenant_id'], settings.get('name'),
+                                                 settings['alert'], settings['rules'])
+            if device_snapshot:
+                application.node_manager.load_nodes_from_chirpstack(device_snapshot.devices(settings['app_id']))
+
+        # Time every handler call, per event type
+        latencies = {}
+        listener = ReplayListener()
+        engine.subscribe(listener)
+        process_message = engine.process_message
+
+        def timed(application, event_type, payload):
+            started = time.perf_counter()
+            try:
+                process_message(application, event_type, payload)
+            finally:
+                latencies.setdefault(event_type, []).append(time.perf_counter() - started)
+
+        engine.ingestion.handler = timed
+
+        first_timestamp = records[0][0]
+        started = time.perf_counter()
+        behind = 0.0
+        for timestamp, topic, payload in records:
+            if speed:
+                due = started + (timestamp - first_timestamp) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    behind = max(behind, -delay)
+            engine.on_message(None, None, CapturedMessage(topic, payload))
+        # Wait for the workers to finish what is queued
+        while True:
+            stats = engine.ingestion.stats()
+            if stats["handled"] + stats["errors"] + stats["dropped"] >= stats["received"]:
+                break
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        engine.alert_dispatcher.shutdown(wait=True)  # Downlinks of the last alerts are still being sent
+    finally:
+        engine.stop()
+        workdir.cleanup()  # The engine's log, store and jobs only live for the replay
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    report = summarize(all_latencies, elapsed, stats["errors"], operations=stats["handled"])
+    report.update({
+        "messages": len(records),
+        "received": stats["received"],
+        "dropped": stats["dropped"],
+        "recorded_seconds": records[-1][0] - first_timestamp,
+        "replay_seconds": elapsed,
+        "max_behind_ms": behind * 1000,
+        "alerts": listener.alerts,
+        "downlinks": client.downlinks,
+        "failed_downlinks": client.failed_downlinks,
+        "events": {event_type: summarize(values, elapsed) for event_type, values in latencies.items()},
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record MQTT events to a capture file, or replay one offline "
+                                                 "through the event handlers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="Record the events of the configured applications")
+    record_parser.add_argument("capture", help="Capture file to write (.gz to compress)")
+    record_parser.add_argument("--config", default="config.json", help="Broker and applications (default: config.json)")
+    record_parser.add_argument("--duration", type=float, help="Seconds to record (default: until Ctrl+C)")
+    replay_parser = subparsers.add_parser("replay", help="Replay a capture with a stubbed ChirpStack client")
+    replay_parser.add_argument("capture", help="Capture file to replay")
+    replay_parser.add_argument("--config", help="Applications, alert rules and ingestion settings to replay with")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="Speed-up of the recorded timing, 0 for as fast as possible (default: 1)")
+    replay_parser.add_argument("--snapshot", help="Device snapshot to load the nodes and alert responders from")
+    replay_parser.add_argument("--downlink-latency", type=float, default=0.0,
+                               help="Seconds every stubbed downlink takes (default: 0)")
+    replay_parser.add_argument("--downlink-error-rate", type=float, default=0.0,
+                               help="Fraction of stubbed downlinks that fail (default: 0)")
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        with open(args.config, 'r') as file:
+            config = json.load(file)
+    if args.command == "record":
+        record(config or {}, args.capture, args.duration)
+        return
+
+    report = replay(args.capture, config, args.speed, args.snapshot, args.downlink_latency, args.downlink_error_rate)
+    print(f"{report['messages']} messages, {report['recorded_seconds']:.1f}s recorded, "
+          f"replayed in {report['replay_seconds']:.2f}s ({report['throughput']:.0f} handled/s)")
+    print(f"dropped {report['dropped']}, handler errors {report['errors']}, alerts {report['alerts']}, "
+          f"downlinks {report['downlinks']} ({report['failed_downlinks']} failed), "
+          f"max {report['max_behind_ms']:.1f} ms behind schedule")
+    print(f"{'event':<8} {'count':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for event_type, result in sorted(report['events'].items()):
+        print(f"{event_type:<8} {result['count']:>7} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# mqtt_connection.py
+
+import socket
+
+import metrics
+
+DEFAULT_HOST = "192.168.1.131"
+
+# Events that drive alerts and downlink tracking are delivered at least once, the informational ones at most once
+DEFAULT_QOS = {"up": 1, "join": 1, "ack": 1, "txack": 1, "status": 0, "log": 0}
+
+
+class MqttConnection:
+    """The broker connection, configured from the `mqtt` section of config.json.
+
+    All topics are subscribed with a single SUBSCRIBE on every (re)connect,
+    each with the QoS of its event type. Lost connections are retried by
+    paho's network thread, waiting `reconnect_min_delay` seconds and doubling
+    up to `reconnect_max_delay`. With `persistent_session` the broker keeps the
+    subscriptions and queues QoS 1 events while the connection is down; this
+    needs a fixed `client_id`, one per instance. With `shared_group`, topics are
+    subscribed as `$share/<group>/...`, so instances in the same group split the
+    events between them instead of each getting all of them.
+    """
+
+    def __init__(self, config=None, on_message=None, on_state=None):
+        self.config = config or {}
+        self.on_message = on_message  # on_message(client, userdata, msg), called on paho's network thread
+        self.on_state = on_state  # on_state(connected, reason)
+        self.host = self.config.get('host', DEFAULT_HOST)
+        self.port = self.config.get('port', 1883)
+        self.client = None
+        self.topics = []  # (topic filter, qos), subscribed on every connect
+        self.stopping = False
+        self.reported = None  # Last state passed to on_state, retries only report a change
+        self.connects = metrics.counter("mqtt_connects_total", "Successful connections to the broker")
+        self.disconnects = metrics.counter("mqtt_disconnects_total", "Lost or refused broker connections")
+        self.connected = metrics.gauge("mqtt_connected", "1 while connected to the broker")
+
+    def qos(self, event_type):
+        qos = self.config.get('qos', DEFAULT_QOS)
+        if isinstance(qos, int):
+            return qos
+        return qos.get(event_type, DEFAULT_QOS.get(event_type, 1))
+
+    def subscriptions(self, app_ids, event_types, shared=True):
+        """Returns the (topic filter, qos) of every event type of every application."""
+        group = self.config.get('shared_group') if shared else None
+        prefix = f"$share/{group}/" if group else ""
+        return [(f"{prefix}application/{app_id}/device/+/event/{event_type}", self.qos(event_type))
+                for app_id in app_ids for event_type in event_types]
+
+    def start(self, topics):
+        """Connects in the background and keeps reconnecting until `stop`; never blocks on the broker."""
+        # Imported here, so that loading the engine does not wait for the MQTT library
+        import paho.mqtt.client as mqtt
+        from paho.mqtt.packettypes import PacketTypes
+        from paho.mqtt.properties import Properties
+
+        self.topics = topics
+        persistent = self.config.get('persistent_session', False)
+        client_id = self.config.get('client_id', "")
+        if persistent and not client_id:
+            client_id = f"chirpstack-node-manager-{socket.gethostname()}"
+            print(f"MQTT persistent session without a client_id, using {client_id}")
+        version5 = str(self.config.get('protocol', "3.1.1")) == "5"
+
+        if version5:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id,
+                                      clean_session=not persistent, protocol=mqtt.MQTTv311)
+        if self.config.get('username'):
+            self.client.username_pw_set(self.config['username'], self.config.get('password'))
+        self.client.reconnect_delay_set(self.config.get('reconnect_min_delay', 1),
+                                        self.config.get('reconnect_max_delay', 120))
+        self.client.on_connect = self._on_connect
+        self.client.on_connect_fail = self._on_connect_fail
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_message = self.on_message
+
+        connect_options = {}
+        if version5:
+            connect_options['clean_start'] = not persistent
+            if persistent:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.SessionExpiryInterval = self.config.get('session_expiry', 3600)
+                connect_options['properties'] = properties
+        self.client.connect_async(self.host, self.port, self.config.get('keepalive', 60), **connect_options)
+        self.client.loop_start()
+
+    def stop(self):
+        if self.client is None:
+            return
+        self.stopping = True
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.connected.set(0)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self.disconnects.inc()
+            self._state(False, f"refused: {reason_code}")
+            return
+        self.connects.inc()
+        self.connected.set(1)
+        # Subscribed again even if the session survived, so changed topics or QoS take effect
+        if self.topics:
+            client.subscribe(self.topics)
+        self._state(True, "session resumed" if flags.session_present else "new session")
+
+    def _on_connect_fail(self, client, userdata):
+        self.disconnects.inc()
+        self._state(False, "broker unreachable")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected.set(0)
+        if self.stopping:
+            return
+        self.disconnects.inc()
+        self._state(False, str(reason_code))
+
+    def _on_subscribe(self, client, userdata, mid, reason_code_list, properties):
+        for (topic, _), reason_code in zip(self.topics, reason_code_list):
+            if reason_code.is_failure:
+                print(f"MQTT subscription to {topic} refused: {reason_code}")
+
+    def _state(self, connected, reason):
+        if connected == self.reported and not connected:
+            return
+        self.reported = connected
+        if self.on_state:
+            try:
+                self.on_state(connected, reason)
+            except Exception as e:
+                print(f"Error reporting the MQTT state: {e}")
@@ -1,28 +1,100 @@
 # node_manager.py
 
+import threading
 from end_node import EndNode
 
 class NodeManager:
+    """Keeps the known nodes indexed by dev_eui, by name and by device type."""
+
     def __init__(self):
-        self.nodes = []
+        self.nodes = {}  # dev_eui -> EndNode, in insertion order
+        self.nodes_by_name = {}  # name -> {dev_eui: EndNode}, names are not unique in ChirpStack
+        self.nodes_by_type = {}  # device_type -> {dev_eui: EndNode}
+        self.lock = threading.Lock()
 
     def load_nodes_from_chirpstack(self, devices):
-        self.nodes = []  # Ensure nodes is a list
+        self.clear()
+        self.add_devices(devices)
+
+    def add_devices(self, devices):
+        """Adds ChirpStack devices as nodes and returns the new nodes."""
+        nodes = []
         for device in devices:
             device_type = self.get_device_type(device)  # Fetch the device type
-            node = EndNode(dev_eui=device.dev_eui, name=device.name, device_type=device_type)
-            self.nodes.append(node)
+            node = EndNode(dev_eui=device.dev_eui, name=device.name, device_type=device_type,
+                           tags=dict(getattr(device, 'tags', {})))
+            self.add_node(node)
+            nodes.append(node)
+        return nodes
 
     def get_device_type(self, device):
         # Fetch the device type from the device description or other metadata
         # Here we assume that the description field contains the device type
         return getattr(device, 'description', 'Blank Unit')  # Default to 'Blank Unit' if description is missing
 
+    def clear(self):
+        with self.lock:
+            self.nodes = {}
+            self.nodes_by_name = {}
+            self.nodes_by_type = {}
+
     def get_all_nodes(self):
-        return self.nodes
+        with self.lock:
+            return list(self.nodes.values())
+
+    def get_node(self, dev_eui):
+        return self.nodes.get(dev_eui)
+
+    def get_node_by_name(self, name):
+        """Returns the first node named `name`; use get_nodes_by_name when names may repeat."""
+        with self.lock:
+            return next(iter(self.nodes_by_name.get(name, {}).values()), None)
+
+    def get_nodes_by_name(self, name):
+        with self.lock:
+            return list(self.nodes_by_name.get(name, {}).values())
+
+    def get_nodes_by_type(self, *device_types):
+        with self.lock:
+            return [node for device_type in device_types
+                    for node in self.nodes_by_type.get(device_type, {}).values()]
+
+    def get_nodes_by_tag(self, key, value=None):
+        """Returns the nodes that have the tag `key`, and if given, with the value `value`."""
+        return [node for node in self.get_all_nodes()
+                if key in node.tags and (value is None or node.tags[key] == value)]
 
     def add_node(self, node):
-        self.nodes.append(node)
+        with self.lock:
+            self._remove(node.dev_eui)
+            self.nodes[node.dev_eui] = node
+            self.nodes_by_name.setdefault(node.name, {})[node.dev_eui] = node
+            self.nodes_by_type.setdefault(node.device_type, {})[node.dev_eui] = node
+
+    def apply_changes(self, added, removed, modified):
+        """Applies a sync diff: new and modified nodes are (re)indexed, removed dev_euis dropped."""
+        with self.lock:
+            for dev_eui in removed:
+                self._remove(dev_eui)
+        for node in added + modified:
+            self.add_node(node)
 
     def remove_node(self, dev_eui):
-        self.nodes = [node for node in self.nodes if node.dev_eui != dev_eui]
\ No newline at end of file
+        with self.lock:
+            return self._remove(dev_eui)
+
+    def _remove(self, dev_eui):
+        node = self.nodes.pop(dev_eui, None)
+        if node is None:
+            return None
+        same_name = self.nodes_by_name.get(node.name)
+        if same_name is not None:
+            same_name.pop(dev_eui, None)
+            if not same_name:
+                del self.nodes_by_name[node.name]
+        same_type = self.nodes_by_type.get(node.device_type)
+        if same_type is not None:
+            same_type.pop(dev_eui, None)
+            if not same_type:
+                del self.nodes_by_type[node.device_type]
+        return node
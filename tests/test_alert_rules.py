@@ -0,0 +1,53 @@
+import pytest
+
+from alert_rules import RuleSet, default_rules
+
+
+def uplink(message="Status OK", fport=10, **fields):
+    return {"fPort": fport, "object": {"message": message, **fields}, "rxInfo": [{"rssi": -80}]}
+
+
+def test_default_rules_match_keywords():
+    rules = RuleSet(default_rules(["Sound Unit"], "FF"))
+    [rule] = rules.match(uplink("Alert: button"), "dev1", "Wearable Alert Unit")
+    assert rule.name == "Alert Response"
+    assert rule.downlink_payload == bytes([0xFF])
+    alert = rule.format_alert(uplink("Alert: button"), "node", "dev1")
+    assert alert == "Alert triggered by device node - Alert: button"
+    assert rules.match(uplink("hello"), "dev1", None) == []
+
+
+def test_conditions_filters_and_paths():
+    rules = RuleSet([{"name": "Hot", "fport": 10, "device_types": ["Sensor"],
+                      "conditions": [["object.temperature", ">", 30], ["rxInfo.0.rssi", "<", -70]]}])
+    assert rules.match(uplink(temperature=35), "dev1", "Sensor")
+    assert not rules.match(uplink(temperature=25), "dev1", "Sensor")
+    assert not rules.match(uplink(temperature=35, fport=11), "dev1", "Sensor")
+    assert not rules.match(uplink(temperature=35), "dev1", "Blank Unit")
+    assert not rules.match(uplink(temperature="hot"), "dev1", "Sensor")  # Not comparable, no match
+
+
+def test_suppression_per_device():
+    rules = RuleSet([{"name": "Any", "conditions": [["object.message", "exists"]], "suppress_seconds": 60}])
+    assert rules.match(uplink(), "dev1", None)
+    assert not rules.match(uplink(), "dev1", None)
+    assert rules.match(uplink(), "dev2", None)
+
+
+@pytest.mark.parametrize("template", ["{", "{} x", "{0}", 5])
+def test_invalid_templates_fail_to_compile(template):
+    with pytest.raises(ValueError):
+        RuleSet([{"alert": template}])
+
+
+@pytest.mark.parametrize("condition", [["object.x", "~", 1], ["object.x", ">"]])
+def test_invalid_conditions_fail_to_compile(condition):
+    with pytest.raises(ValueError):
+        RuleSet([{"conditions": [condition]}])
+
+
+def test_format_error_falls_back_to_template():
+    [rule] = RuleSet([{"name": "Temp", "alert": "{temperature:.1f} C on {device_name}"}]).rules
+    assert rule.format_alert(uplink(temperature=21.46), "node", "dev1") == "21.5 C on node"
+    assert rule.format_alert(uplink(), "node", "dev1") == "{temperature:.1f} C on {device_name}"
+    assert rule.format_alert(uplink(temperature="warm"), "node", "dev1") == "{temperature:.1f} C on {device_name}"
@@ -0,0 +1,88 @@
+import json
+import threading
+
+import pytest
+
+from broadcast_scheduler import ACKED, ENQUEUED, PENDING, TXACK, BroadcastJob, BroadcastScheduler
+from end_node import EndNode
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+        self.enqueued = threading.Event()
+
+    def enqueue_downlink_item(self, dev_eui, data, confirmed=True, f_port=10, timeout=None):
+        self.sent.append(dev_eui)
+        self.enqueued.set()
+        return True, "Command enqueued successfully.", f"q-{dev_eui}-{len(self.sent)}"
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    client = FakeClient()
+    scheduler = BroadcastScheduler(client, path=str(tmp_path / "jobs.json"), interval=0.01)
+    yield scheduler
+    scheduler.stop()
+
+
+def wait_enqueued(scheduler, job, dev_eui):
+    for _ in range(500):
+        if job.states[dev_eui] != PENDING:
+            return
+        scheduler.chirpstack_client.enqueued.wait(0.01)
+    raise AssertionError("target was never enqueued")
+
+
+def test_ack_advances_only_matching_queue_item(scheduler):
+    job = scheduler.submit("STATUS_REQUEST", [EndNode("dev1", "one", "Sound Unit")])
+    wait_enqueued(scheduler, job, "dev1")
+    assert job.states["dev1"] == ENQUEUED
+    queue_item_id = job.queue_item_ids["dev1"]
+
+    scheduler.on_txack("dev1", "alert-response")  # Another downlink to the same node
+    scheduler.on_ack("dev1", "alert-response", True)
+    scheduler.on_ack("dev1", None, True)
+    assert job.states["dev1"] == ENQUEUED
+
+    scheduler.on_txack("dev1", queue_item_id)
+    assert job.states["dev1"] == TXACK
+    scheduler.on_ack("dev1", queue_item_id, True)
+    assert job.states["dev1"] == ACKED
+    assert job not in scheduler.get_jobs()
+
+
+def test_job_round_trip_keeps_queue_item_ids():
+    job = BroadcastJob("STATUS_REQUEST", [("dev1", "one")], states={"dev1": ENQUEUED}, queue_item_ids={"dev1": "q1"})
+    restored = BroadcastJob.from_dict(job.to_dict())
+    assert restored.queue_item_ids == {"dev1": "q1"}
+
+
+def test_events_only_mark_the_jobs_dirty(tmp_path):
+    path = tmp_path / "jobs.json"
+    scheduler = BroadcastScheduler(FakeClient(), path=str(path), interval=60)
+    scheduler.stop()  # Saved by hand below, not by the scheduler thread
+    job = BroadcastJob("STATUS_REQUEST", [("dev1", "one"), ("dev2", "two")],
+                       states={"dev1": ENQUEUED, "dev2": ENQUEUED}, queue_item_ids={"dev1": "q1", "dev2": "q2"})
+    scheduler.jobs.append(job)
+    scheduler.on_txack("dev1", "q1")
+    assert scheduler.dirty and not path.exists()
+
+    scheduler.save()
+    assert not scheduler.dirty
+    saved = BroadcastJob.from_dict(json.loads(path.read_text())[0])
+    assert saved.states == {"dev1": TXACK, "dev2": ENQUEUED}
+
+    scheduler.on_ack("dev1", "q1", True)
+    scheduler.on_ack("dev2", "q2", True)
+    scheduler.save()
+    assert json.loads(path.read_text()) == []
+
+
+def test_stop_saves_pending_changes(tmp_path):
+    path = tmp_path / "jobs.json"
+    scheduler = BroadcastScheduler(FakeClient(), path=str(path), interval=0.01)
+    scheduler.submit("STATUS_REQUEST", [EndNode("dev1", "one", "Sound Unit")])
+    scheduler.stop()
+    assert not scheduler.dirty
+    assert len(json.loads(path.read_text())) == 1
@@ -0,0 +1,96 @@
+import grpc
+import pytest
+
+from bulk_provisioner import BulkProvisioner, validate_manifest
+from chirpstack_client import ChirpStackClient
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._code.name
+
+
+class FakeDeviceService:
+    """Create commits even when it then fails with one of `create_errors`, like a call that times out late."""
+
+    def __init__(self, create_errors=(), keys_errors=()):
+        self.devices = set()
+        self.keys = set()
+        self.create_errors = list(create_errors)
+        self.keys_errors = list(keys_errors)
+        self.deleted = []
+
+    def Create(self, request, metadata=None, timeout=None):
+        dev_eui = request.device.dev_eui
+        if dev_eui in self.devices:
+            raise FakeRpcError(grpc.StatusCode.ALREADY_EXISTS)
+        self.devices.add(dev_eui)
+        if self.create_errors:
+            raise FakeRpcError(self.create_errors.pop(0))
+
+    def CreateKeys(self, request, metadata=None, timeout=None):
+        if self.keys_errors:
+            raise FakeRpcError(self.keys_errors.pop(0))
+        self.keys.add(request.device_keys.dev_eui)
+
+    def Delete(self, request, metadata=None, timeout=None):
+        self.deleted.append(request.dev_eui)
+        self.devices.discard(request.dev_eui)
+
+
+ROW = {"dev_eui": "0102030405060708", "name": "node", "device_profile_id": "p1", "nwk_key": "00" * 16,
+       "device_type": "Sound Unit"}
+
+
+@pytest.fixture
+def client():
+    return ChirpStackClient("127.0.0.1:1", "token")
+
+
+def provision(client, service):
+    client.device_service = service
+    return BulkProvisioner(client, "app", max_workers=1, retries=2, backoff=0).provision([dict(ROW)])
+
+
+def test_retry_after_committed_timeout_creates_keys(client):
+    service = FakeDeviceService(create_errors=[grpc.StatusCode.DEADLINE_EXCEEDED])
+    report = provision(client, service)
+    assert report.results[0] == (True, "Provisioned")
+    assert service.keys == {ROW["dev_eui"]}
+    assert not service.deleted
+
+
+def test_existing_device_fails_without_earlier_timeout(client):
+    service = FakeDeviceService()
+    service.devices.add(ROW["dev_eui"])
+    report = provision(client, service)
+    assert report.results[0][0] is False
+    assert not service.keys
+
+
+def test_keys_failure_rolls_back(client):
+    service = FakeDeviceService(keys_errors=[grpc.StatusCode.INVALID_ARGUMENT])
+    report = provision(client, service)
+    assert report.results[0][0] is False
+    assert service.deleted == [ROW["dev_eui"]]
+    assert not service.devices
+
+
+def manifest_row(dev_eui, name):
+    return {"dev_eui": dev_eui, "name": name, "device_type": "Sound Unit", "nwk_key": "00" * 16,
+            "device_profile": "Default"}
+
+
+def test_manifest_allows_repeated_names_but_not_dev_euis():
+    rows = [manifest_row("0102030405060708", "pump"), manifest_row("0102030405060709", "pump")]
+    assert validate_manifest(rows, [("p1", "Default")]) == []
+    assert [row["device_profile_id"] for row in rows] == ["p1", "p1"]
+
+    rows.append(manifest_row("0102030405060708", "valve"))
+    assert validate_manifest(rows, [("p1", "Default")]) == [(3, "Duplicate dev_eui 0102030405060708")]
@@ -0,0 +1,23 @@
+from channel_manager import SERVICE_CONFIG
+
+
+def method_config(service, method):
+    """Picks the config gRPC applies to a method: an exact method name wins over a whole service."""
+    for name in ({"service": service, "method": method}, {"service": service}):
+        for config in SERVICE_CONFIG["methodConfig"]:
+            if name in config["name"]:
+                return config
+    return None
+
+
+def test_reads_are_retried():
+    for service, method in [("api.DeviceService", "List"), ("api.DeviceService", "Get"),
+                            ("api.DeviceProfileService", "List"), ("api.ApplicationService", "Get")]:
+        assert "retryPolicy" in method_config(service, method), (service, method)
+
+
+def test_mutating_calls_only_get_a_deadline():
+    for method in ["Create", "CreateKeys", "Enqueue", "Delete", "Update", "FlushQueue"]:
+        config = method_config("api.DeviceService", method)
+        assert config["timeout"] == "10s"
+        assert "retryPolicy" not in config, method
@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+
+import grpc
+import pytest
+
+import metrics
+from chirpstack_client import ChirpStackClient
+
+
+class Page:
+    def __init__(self, result, total_count):
+        self.result = result
+        self.total_count = total_count
+
+
+class FakeList:
+    """Answers offset/limit requests over `total` items, the later pages faster than the earlier ones."""
+
+    def __init__(self, total):
+        self.total = total
+        self.offsets = []
+        self.lock = threading.Lock()
+
+    def __call__(self, request, metadata=None, timeout=None):
+        offset, limit = request
+        with self.lock:
+            self.offsets.append(offset)
+        time.sleep(random.uniform(0, 0.005) + (0.01 if offset == 10 else 0))
+        return Page(list(range(offset, min(offset + limit, self.total))), self.total)
+
+
+@pytest.fixture
+def client():
+    return ChirpStackClient("127.0.0.1:1", "token")
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_iter_pages_yields_pages_in_order(client, max_workers):
+    list_call = FakeList(55)
+    pages = list(client._iter_pages(list_call, lambda offset, limit: (offset, limit), 10, max_workers))
+    assert [len(page) for page in pages] == [10, 10, 10, 10, 10, 5]
+    assert [item for page in pages for item in page] == list(range(55))
+    assert sorted(list_call.offsets) == [0, 10, 20, 30, 40, 50]
+
+
+def test_iter_pages_of_a_single_page(client):
+    list_call = FakeList(3)
+    assert list(client._iter_pages(list_call, lambda offset, limit: (offset, limit), 10, 4)) == [[0, 1, 2]]
+    assert list_call.offsets == [0]
+
+
+def test_iter_pages_yields_the_first_page_before_the_rest(client):
+    list_call = FakeList(30)
+    pages = client._iter_pages(list_call, lambda offset, limit: (offset, limit), 10, 4)
+    assert next(pages) == list(range(10))
+    assert list_call.offsets == [0]
+    assert len(list(pages)) == 2
+
+
+class FakeEnqueueService:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def Enqueue(self, request, metadata=None, timeout=None):
+        if self.fail:
+            raise FakeRpcError()
+        return type("Response", (), {"id": "q1"})()
+
+
+class FakeRpcError(grpc.RpcError):
+    def details(self):
+        return "unavailable"
+
+
+def test_enqueue_counts_results_without_registry_lookups(client, monkeypatch):
+    def lookup(*args, **kwargs):
+        raise AssertionError("metric looked up on the enqueue path")
+
+    ok = client.enqueued_metric.get()
+    failed = client.enqueue_failed_metric.get()
+    monkeypatch.setattr(metrics, "counter", lookup)
+    monkeypatch.setattr(metrics.REGISTRY, "counter", lookup)
+    client.device_service = FakeEnqueueService()
+    assert client.enqueue_downlink_item("01", b"\x01") == (True, "Command enqueued successfully.", "q1")
+    client.device_service = FakeEnqueueService(fail=True)
+    assert client.enqueue_downlink_item("01", b"\x01")[0] is False
+    assert (client.enqueued_metric.get(), client.enqueue_failed_metric.get()) == (ok + 1, failed + 1)
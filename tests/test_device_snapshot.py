@@ -0,0 +1,38 @@
+from device_snapshot import DeviceSnapshot
+
+
+class Node:
+    def __init__(self, dev_eui, name):
+        self.dev_eui = dev_eui
+        self.name = name
+        self.device_type = "sensor"
+        self.tags = {}
+
+
+def test_entries_are_kept_per_server_and_application(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    first = DeviceSnapshot(path, "server-a:8080")
+    first.set_devices("app", [Node("01", "node-a")])
+    first.save()
+    second = DeviceSnapshot(path, "server-b:8080")
+    assert not second.has_devices("app")
+    second.set_devices("app", [Node("02", "node-b")])
+    second.save()
+
+    assert [device.name for device in DeviceSnapshot(path, "server-a:8080").devices("app")] == ["node-a"]
+    assert [device.name for device in DeviceSnapshot(path, "server-b:8080").devices("app")] == ["node-b"]
+    assert not DeviceSnapshot(path, "server-a:8080").has_devices("other-app")
+
+
+def test_loaded_devices_are_stale_until_listed(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    snapshot = DeviceSnapshot(path, "server:8080")
+    assert not snapshot.is_stale("app")  # Nothing cached, nothing stale
+    snapshot.set_devices("app", [Node("01", "node-a")])
+    snapshot.save()
+
+    reloaded = DeviceSnapshot(path, "server:8080")
+    assert reloaded.is_stale("app")
+    reloaded.set_devices("app", [Node("01", "node-a")])
+    assert not reloaded.is_stale("app")
+
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import metrics
+from chirpstack_client import ChirpStackClient
+from device_status_cache import DeviceStatusCache
+
+
+class Device:
+    def __init__(self, dev_eui):
+        self.dev_eui = dev_eui
+
+    def HasField(self, name):
+        return False
+
+
+def test_added_device_is_answered_while_its_application_is_fresh():
+    cache = DeviceStatusCache()
+    cache.update([Device("01")], "app")
+    cache.set_last_seen("02", None, "app")  # Added after the listing
+    assert cache.get("02") == {"last_seen": "Unknown", "is_online": False}
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_device_of_an_unlisted_application_is_a_miss():
+    cache = DeviceStatusCache()
+    cache.set_last_seen("01", datetime.now(), "app")
+    assert cache.get("01") is None
+    assert cache.misses == 1
+
+
+def test_hits_and_misses_are_exposed_as_metrics():
+    client = ChirpStackClient("127.0.0.1:1", "token")
+    client.status_cache.update([Device("01")], "app")
+    client.status_cache.get("01")
+    client.status_cache.get("unknown")
+    snapshot = metrics.REGISTRY.snapshot()
+    assert snapshot["device_status_cache_hits_total"] == 1
+    assert snapshot["device_status_cache_misses_total"] == 1
+    assert snapshot["device_status_cache_devices"] == 1
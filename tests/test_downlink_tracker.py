@@ -0,0 +1,107 @@
+import pytest
+
+import metrics
+
+from downlink_tracker import ACKED, ENQUEUED, TXACK, DownlinkTracker
+
+
+@pytest.fixture
+def tracker():
+    tracker = DownlinkTracker(timeout=60, tick=60)
+    yield tracker
+    tracker.stop()
+
+
+def test_ack_matches_queue_item_id(tracker):
+    tracker.track("dev1", "q1", b"\x01")
+    tracker.track("dev1", "q2", b"\x02")
+    tracker.on_ack("dev1", "q2")
+    assert set(tracker.pending) == {"q1"}
+    assert tracker.get_delivery("dev1")[0] == ACKED
+
+
+def test_unknown_queue_item_id_matches_nothing(tracker):
+    tracker.track("dev1", "q1", b"\x01")
+    tracker.on_txack("dev1", "other")
+    tracker.on_ack("dev1", "other")
+    assert set(tracker.pending) == {"q1"}
+    assert tracker.stats()["counts"][ACKED] == 0
+    assert tracker.get_delivery("dev1")[0] == ENQUEUED
+
+
+def test_duplicate_ack_is_ignored(tracker):
+    tracker.track("dev1", "q1", b"\x01")
+    tracker.track("dev1", "q2", b"\x02")
+    tracker.on_ack("dev1", "q1")
+    tracker.on_ack("dev1", "q1")
+    assert set(tracker.pending) == {"q2"}
+    assert tracker.stats()["counts"][ACKED] == 1
+
+
+def test_event_without_id_completes_oldest(tracker):
+    tracker.track("dev1", "q1", b"\x01")
+    tracker.track("dev1", "q2", b"\x02")
+    tracker.on_txack("dev1")
+    assert tracker.pending["q1"].txack_at is not None
+    assert tracker.get_delivery("dev1")[0] == TXACK
+    tracker.on_ack("dev1")
+    assert set(tracker.pending) == {"q2"}
+
+
+def test_unconfirmed_downlink_completes_on_txack(tracker):
+    tracker.track("dev1", "q1", b"\x01", confirmed=False)
+    tracker.on_txack("dev1", "q1")
+    assert not tracker.pending
+    assert tracker.get_delivery("dev1")[0] == ACKED
+
+
+def test_timeout_after_wheel_rounds():
+    tracker = DownlinkTracker(timeout=180, tick=60, wheel_size=2)
+    tracker.stop()
+    tracker.track("dev1", "q1", b"\x01")
+    for _ in range(2):
+        tracker.advance()
+    assert "q1" in tracker.pending
+    tracker.advance()
+    assert not tracker.pending
+    assert tracker.stats()["counts"]["timeout"] == 1
+
+
+def test_downlinks_without_id_use_the_device_fifo(tracker):
+    tracker.track("dev1", None, b"\x01")
+    tracker.track("dev1", "", b"\x02")
+    assert len(tracker.pending) == 2
+    tracker.on_ack("dev1")
+    tracker.on_ack("dev1")
+    assert not tracker.pending
+    assert tracker.stats()["counts"][ACKED] == 2
+
+
+def test_tracking_a_pending_id_again_replaces_it():
+    tracker = DownlinkTracker(timeout=120, tick=60, wheel_size=4)
+    tracker.stop()
+    tracker.track("dev1", "q1", b"\x01")
+    tracker.advance()
+    tracker.track("dev1", "q1", b"\x02")
+    assert list(tracker.pending_by_device["dev1"]) == ["q1"]
+    assert sum("q1" in slot for slot in tracker.wheel) == 1
+    for _ in range(len(tracker.wheel)):
+        tracker.advance()  # Passes the slot of the replaced downlink without failing
+    assert tracker.stats()["counts"]["timeout"] == 1
+
+
+def test_stale_wheel_entries_are_skipped():
+    tracker = DownlinkTracker(timeout=60, tick=60, wheel_size=2)
+    tracker.stop()
+    tracker.wheel[1].add("gone")
+    tracker.advance()
+    assert not tracker.wheel[1]
+
+
+def test_latencies_go_to_the_metrics_registry(tracker):
+    before = tracker.enqueue_to_ack.get()["count"]
+    tracker.track("dev1", "q1", b"\x01")
+    tracker.on_txack("dev1", "q1")
+    tracker.on_ack("dev1", "q1")
+    snapshot = metrics.REGISTRY.snapshot()
+    assert snapshot['downlink_latency_seconds{stage="enqueue_to_ack"}']["count"] == before + 1
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from event_store import EventStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store
+    store.close()
+
+
+def fill(store):
+    store.add("up", "0011223344556677", "node-a", "app", "Uplink from node-a: Alert: button", ts=100)
+    store.add("join", "0011223344556677", "node-a", "app", "node-a joined", ts=200)
+    store.add("up", "8899aabbccddeeff", "node-b", "app", "Uplink from node-b: temperature 21", {"rssi": -80}, ts=300)
+    store.add("ack", "8899aabbccddeeff", "node-b", "app", "Ack from node-b", ts=400)
+    assert store.flush()
+
+
+def summaries(events):
+    return [event["summary"] for event in events]
+
+
+def test_query_returns_newest_first_with_fields(store):
+    fill(store)
+    events = store.query()
+    assert [event["ts"] for event in events] == [400, 300, 200, 100]
+    assert events[1]["fields"] == {"rssi": -80}
+    assert events[0]["fields"] == {}
+
+
+def test_query_filters_combine(store):
+    fill(store)
+    assert summaries(store.query(dev_eui="0011223344556677", event_type="up")) == [
+        "Uplink from node-a: Alert: button"]
+    assert summaries(store.query(device_name="node-b", since=300, until=400)) == [
+        "Uplink from node-b: temperature 21"]
+    assert len(store.query(limit=2)) == 2
+
+
+def test_query_text_matches_substrings(store):
+    fill(store)
+    assert store.full_text
+    assert summaries(store.query(text="ALERT: but")) == ["Uplink from node-a: Alert: button"]
+    assert summaries(store.query(text="perat")) == ["Uplink from node-b: temperature 21"]
+    assert summaries(store.query(text="21")) == ["Uplink from node-b: temperature 21"]  # Shorter than a trigram
+    assert store.query(text='"quoted"') == []
+
+
+def test_existing_events_are_indexed_for_text_search(tmp_path):
+    path = str(tmp_path / "events.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, ts REAL NOT NULL, event_type TEXT NOT NULL, "
+                       "dev_eui TEXT, device_name TEXT, application_id TEXT, summary TEXT, fields TEXT)")
+    connection.execute("INSERT INTO events (ts, event_type, summary) VALUES (1, 'up', 'stored before the index')")
+    connection.commit()
+    connection.close()
+
+    store = EventStore(path)
+    try:
+        assert summaries(store.query(text="before the")) == ["stored before the index"]
+    finally:
+        store.close()
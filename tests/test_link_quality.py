@@ -0,0 +1,12 @@
+from link_quality import LinkQualityStore
+
+
+def test_samples_keep_their_gateway_past_65535_gateways():
+    store = LinkQualityStore(capacity=4)
+    for index in range(70000):
+        store.gateways.append(f"gw-{index}")
+        store.gateway_index[f"gw-{index}"] = index
+    store.add("01", 1000.0, -80, 7.5, "gw-69999")
+    store.add("01", 1001.0, -81, 7.0, "new-gateway")
+    assert [sample["gateway_id"] for sample in store.samples("01")] == ["gw-69999", "new-gateway"]
+    assert store.latest("01")["gateway_id"] == "new-gateway"
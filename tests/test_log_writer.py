@@ -0,0 +1,55 @@
+import gzip
+import os
+import time
+
+from log_writer import LogWriter
+
+
+def test_without_fsync_interval_the_writer_blocks_and_syncs_every_batch(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+    writer = LogWriter(str(tmp_path / "log.txt"), fsync_interval=0)
+    try:
+        time.sleep(0.05)
+        assert writer.thread.is_alive()
+        assert not synced  # Nothing written, nothing to wake up for
+        writer.write("line")
+        assert writer.flush()
+        assert (tmp_path / "log.txt").read_text() == "line\n"
+        assert synced
+    finally:
+        writer.close()
+
+
+def test_rotates_by_size(tmp_path):
+    path = tmp_path / "log.txt"
+    writer = LogWriter(str(path), fsync_interval=0, max_bytes=10)
+    try:
+        writer.write("first line")
+        writer.flush()
+        writer.write("second")
+        writer.flush()
+    finally:
+        writer.close()
+    rotated = sorted(name for name in os.listdir(tmp_path) if name != "log.txt")
+    assert [(tmp_path / name).read_text() for name in rotated] == ["first line\n"]
+    assert path.read_text() == "second\n"  # Still under max_bytes
+
+
+def test_compresses_rotated_files(tmp_path):
+    path = tmp_path / "log.txt"
+    writer = LogWriter(str(path), fsync_interval=0, max_bytes=1, compress=True)
+    try:
+        writer.write("line")
+        writer.flush()
+    finally:
+        writer.close()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        compressed = [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+        if compressed and len(os.listdir(tmp_path)) == 2:
+            break
+        time.sleep(0.01)
+    with gzip.open(tmp_path / compressed[0], "rt") as file:
+        assert file.read() == "line\n"
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import grpc
+
+import metrics
+from channel_manager import RpcMetricsInterceptor
+
+
+def busy(stopping):
+    while not stopping.is_set():
+        sum(range(100))
+
+
+def test_profiler_samples_and_stops():
+    profiler = metrics.SamplingProfiler(interval=0.001)
+    assert profiler.top() == []
+    stopping = threading.Event()
+    worker = threading.Thread(target=busy, args=(stopping,))
+    worker.start()
+    try:
+        profiler.start()
+        deadline = time.monotonic() + 5
+        while not any("busy" in location for location in profiler.samples) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        profiler.stop()
+    finally:
+        stopping.set()
+        worker.join()
+    assert not profiler.thread.is_alive()
+    location, hits, share = next(item for item in profiler.top(100) if "busy" in item[0])
+    assert hits > 0 and 0 < share <= 1
+
+
+def test_profiler_restart_runs_one_thread():
+    profiler = metrics.SamplingProfiler(interval=0.001)
+    profiler.start()
+    first = profiler.thread
+    profiler.stop()
+    assert not first.is_alive()
+    profiler.start()
+    assert profiler.thread is not first
+    profiler.stop()
+
+
+def test_profiler_top_after_reset():
+    profiler = metrics.SamplingProfiler()
+    profiler.samples = {"a.py:1 f": 3}
+    profiler.total = 3
+    assert profiler.top() == [("a.py:1 f", 3, 1.0)]
+    profiler.reset()
+    assert profiler.top() == []
+
+
+class Details:
+    method = "/api.DeviceService/Get"
+
+
+class Outcome:
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+def test_interceptor_records_per_method():
+    registry = metrics.MetricsRegistry()
+    interceptor = RpcMetricsInterceptor(registry)
+    for code in (grpc.StatusCode.OK, grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.UNAVAILABLE):
+        interceptor.intercept_unary_unary(lambda details, request, code=code: Outcome(code), Details(), None)
+    assert registry.histogram("chirpstack_rpc_seconds", method=Details.method).count == 3
+    assert registry.counter("chirpstack_rpc_errors_total", method=Details.method, code="UNAVAILABLE").get() == 2
+
+
+def test_interceptor_does_nothing_when_disabled():
+    registry = metrics.MetricsRegistry()
+    registry.enabled = False
+    interceptor = RpcMetricsInterceptor(registry)
+    outcome = Outcome(grpc.StatusCode.OK)
+    assert interceptor.intercept_unary_unary(lambda details, request: outcome, Details(), None) is outcome
+    assert registry.metrics == {}
+
+
+def test_summarize():
+    result = metrics.summarize([0.003, 0.001, 0.002], elapsed=2.0, errors=1)
+    assert result == {"count": 3, "errors": 1, "throughput": 1.5, "p50_ms": 2.0, "p99_ms": 3.0}
+    assert metrics.summarize([], elapsed=0)["p50_ms"] is None
@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+import mqtt_capture
+from mqtt_capture import MAGIC, CaptureWriter, read_capture
+
+
+def write_capture(path, count=3):
+    writer = CaptureWriter(str(path))
+    for index in range(count):
+        writer.write(f"application/app/device/{index:016x}/event/up", f'{{"n": {index}}}'.encode(), 1000.0 + index)
+    writer.close()
+
+
+@pytest.mark.parametrize("name", ["capture.cap", "capture.cap.gz"])
+def test_read_capture_round_trip(tmp_path, name):
+    write_capture(tmp_path / name)
+    records = list(read_capture(str(tmp_path / name)))
+    assert [timestamp for timestamp, _, _ in records] == [1000.0, 1001.0, 1002.0]
+    assert records[1][1] == "application/app/device/0000000000000001/event/up"
+    assert records[1][2] == b'{"n": 1}'
+
+
+@pytest.mark.parametrize("cut", [1, 5, 20])
+def test_read_capture_skips_a_truncated_last_record(tmp_path, cut):
+    path = tmp_path / "capture.cap"
+    write_capture(path)
+    data = path.read_bytes()
+    path.write_bytes(data[:-cut])
+    assert [json.loads(payload)["n"] for _, _, payload in read_capture(str(path))] == [0, 1]
+
+
+def test_read_capture_of_only_a_header(tmp_path):
+    path = tmp_path / "capture.cap"
+    path.write_bytes(MAGIC)
+    assert list(read_capture(str(path))) == []
+
+
+def test_read_capture_rejects_other_files(tmp_path):
+    path = tmp_path / "capture.cap"
+    path.write_bytes(b"not a capture")
+    with pytest.raises(ValueError):
+        list(read_capture(str(path)))
+
+
+def test_replay_removes_its_working_files(tmp_path, monkeypatch):
+    workdirs = []
+    temporary_directory = mqtt_capture.tempfile.TemporaryDirectory
+
+    def tracked(*args, **kwargs):
+        workdir = temporary_directory(*args, **kwargs)
+        workdirs.append(workdir.name)
+        return workdir
+
+    monkeypatch.setattr(mqtt_capture.tempfile, "TemporaryDirectory", tracked)
+    write_capture(tmp_path / "capture.cap")
+    report = mqtt_capture.replay(str(tmp_path / "capture.cap"), speed=0)
+    assert report["messages"] == report["received"] == 3
+    assert workdirs and not any(os.path.exists(workdir) for workdir in workdirs)
+
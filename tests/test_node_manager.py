@@ -0,0 +1,28 @@
+from end_node import EndNode
+from node_manager import NodeManager
+
+
+def test_nodes_with_the_same_name_are_all_kept():
+    manager = NodeManager()
+    first = EndNode(dev_eui="01", name="pump", device_type="sensor")
+    second = EndNode(dev_eui="02", name="pump", device_type="sensor")
+    manager.add_node(first)
+    manager.add_node(second)
+    assert manager.get_nodes_by_name("pump") == [first, second]
+    assert manager.get_node_by_name("pump") is first
+
+    manager.remove_node("01")
+    assert manager.get_nodes_by_name("pump") == [second]
+    assert manager.get_node_by_name("pump") is second
+    manager.remove_node("02")
+    assert manager.get_node_by_name("pump") is None
+    assert manager.nodes_by_name == {}
+
+
+def test_renamed_node_moves_to_its_new_name():
+    manager = NodeManager()
+    manager.add_node(EndNode(dev_eui="01", name="old", device_type="sensor"))
+    renamed = EndNode(dev_eui="01", name="new", device_type="sensor")
+    manager.apply_changes([], [], [renamed])
+    assert manager.get_nodes_by_name("old") == []
+    assert manager.get_node_by_name("new") is renamed
@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+
+from log_writer import LogWriter
+from virtual_list import FileHistory, RingBuffer
+
+
+def test_ring_buffer_overwrites_the_oldest():
+    buffer = RingBuffer(3)
+    for item in range(5):
+        buffer.append(item)
+    assert len(buffer) == 3
+    assert [buffer[index] for index in range(3)] == [2, 3, 4]
+    with pytest.raises(IndexError):
+        buffer[3]
+    buffer.clear()
+    assert len(buffer) == 0
+
+
+def test_file_history_pages_backwards(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_text("".join(f"{index}\n" for index in range(10)))
+    history = FileHistory(str(path))
+    assert history.read_before(0, 3) == ["7", "8", "9"]
+    assert history.read_before(3, 3) == ["4", "5", "6"]
+    assert history.read_before(9, 3) == ["0"]
+    assert history.read_before(10, 3) == []
+
+
+def test_file_history_pages_across_rotation(tmp_path):
+    path = str(tmp_path / "log.txt")
+    writer = LogWriter(path, fsync_interval=0, max_bytes=20, compress=False)
+    history = FileHistory(path, line_filter=lambda line: line.startswith("line"), before_read=writer.flush)
+    try:
+        for index in range(6):
+            writer.write(f"line {index}")
+        assert history.read_before(0, 2) == ["line 4", "line 5"]
+        # More lines and rotations after the first page; offsets still count back from the newest line
+        for index in range(6, 12):
+            writer.write(f"line {index}")
+            writer.write("skipped by the filter")
+            writer.flush()  # One batch each, so the file rotates several times
+        assert len(history.rotated_paths()) > 1
+        assert history.read_before(2, 4) == ["line 6", "line 7", "line 8", "line 9"]
+        assert history.read_before(10, 10) == ["line 0", "line 1"]
+    finally:
+        writer.close()
+
+
+def test_file_history_reads_compressed_rotations(tmp_path):
+    path = tmp_path / "log.txt"
+    with gzip.open(f"{path}.20240101-000000.gz", "wb") as file:
+        file.write(b"a\nb\n")
+    (tmp_path / "log.txt.20240102-000000").write_text("c\n")
+    path.write_text("d\n")
+    assert FileHistory(str(path)).read_before(0, 10) == ["a", "b", "c", "d"]
+
+
+def test_alert_history_follows_the_marker(tmp_path):
+    from event_engine import ALERT_MARKER
+
+    path = tmp_path / "log.txt"
+    path.write_text("".join(line + "\n" for line in [
+        "2024-01-01, 10:00:00 - Uplink from node",
+        ALERT_MARKER + "Custom rule fired on node",
+        ALERT_MARKER + "42 people in zone 3",
+        "2024-01-01, 10:00:05 - Join - Device: node",
+    ]))
+    alerts = FileHistory(str(path), lambda line: line.startswith(ALERT_MARKER), None,
+                         lambda line: line[len(ALERT_MARKER):])
+    events = FileHistory(str(path), lambda line: line[:1].isdigit())
+    assert alerts.read_before(0, 10) == ["Custom rule fired on node", "42 people in zone 3"]
+    assert events.read_before(0, 10) == ["2024-01-01, 10:00:00 - Uplink from node",
+                                         "2024-01-01, 10:00:05 - Join - Device: node"]
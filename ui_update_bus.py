@@ -0,0 +1,68 @@
+# ui_update_bus.py
+
+import time
+from collections import deque
+
+import metrics
+
+
+class UIUpdateBus:
+    """Collects UI updates from any thread and applies them in one batch per frame.
+
+    Channels buffer every item (e.g. listbox rows) in a deque; appends and pops
+    on a deque are atomic, so producers never take a lock. Latest-value updates
+    (e.g. redrawing the selected node's labels) keep only the newest per key.
+    A single `after` timer flushes everything every `flush_ms` milliseconds.
+    """
+
+    def __init__(self, master, flush_ms=75):
+        self.master = master
+        self.flush_ms = flush_ms
+        self.channels = {}  # name -> (deque, on_flush(items))
+        self.latest = {}  # key -> (callback, args)
+        # How long a flush blocks the Tk thread, and how late the timer fires (time the Tk thread was busy)
+        self.flush_metric = metrics.histogram("ui_flush_seconds", "Time to apply one batch of UI updates")
+        self.lag_metric = metrics.histogram("ui_tick_lag_seconds", "Delay of the UI flush timer past its interval")
+        self.scheduled_at = time.perf_counter()
+        self.timer = self.master.after(self.flush_ms, self.tick)
+
+    def add_channel(self, name, on_flush):
+        self.channels[name] = (deque(), on_flush)
+
+    def post(self, name, item):
+        self.channels[name][0].append(item)
+
+    def set_latest(self, key, callback, *args):
+        self.latest[key] = (callback, args)
+
+    def flush(self):
+        for buffer, on_flush in self.channels.values():
+            items = []
+            while buffer:
+                items.append(buffer.popleft())
+            if items:
+                try:
+                    on_flush(items)
+                except Exception as e:
+                    print(f"Error flushing UI updates: {e}")
+        while self.latest:
+            try:
+                _, (callback, args) = self.latest.popitem()
+            except KeyError:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error applying UI update: {e}")
+
+    def tick(self):
+        started = time.perf_counter()
+        self.lag_metric.observe(max(0.0, started - self.scheduled_at - self.flush_ms / 1000))
+        self.flush()
+        self.scheduled_at = time.perf_counter()
+        self.flush_metric.observe(self.scheduled_at - started)
+        self.timer = self.master.after(self.flush_ms, self.tick)
+
+    def stop(self):
+        self.master.after_cancel(self.timer)
+        self.timer = None
@@ -0,0 +1,238 @@
+# virtual_list.py
+
+import glob
+import gzip
+import os
+import tkinter as tk
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class RingBuffer:
+    """Fixed-capacity list that overwrites its oldest item, with O(1) append and indexing."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return self.items[(self.start + index) % self.capacity]
+
+    def append(self, item):
+        if self.size < self.capacity:
+            self.items[(self.start + self.size) % self.capacity] = item
+            self.size += 1
+        else:
+            self.items[self.start] = item
+            self.start = (self.start + 1) % self.capacity
+
+    def clear(self):
+        self.items = [None] * self.capacity
+        self.start = 0
+        self.size = 0
+
+
+class FileHistory:
+    """Reads older lines of an append-only log file, newest first, without loading the whole file.
+
+    Once the file itself is exhausted, reading goes on in the files LogWriter
+    rotated it to (`<path>.<timestamp>`, possibly gzipped), newest first. The
+    `skip` offsets therefore count through the whole log and stay valid when
+    the file is rotated between two reads.
+    """
+
+    def __init__(self, path, line_filter=None, before_read=None, line_format=None):
+        self.path = path
+        self.line_filter = line_filter
+        self.before_read = before_read  # e.g. flushes a buffered writer so the file is complete
+        self.line_format = line_format  # Turns a matching line into its list entry, e.g. drops a marker
+
+    def read_before(self, skip, count):
+        """Returns up to `count` matching lines, oldest first, that come before the last `skip` matching lines."""
+        if self.before_read:
+            self.before_read()
+        lines = []
+        for line in self._reverse_lines():
+            if self.line_filter and not self.line_filter(line):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            lines.append(self.line_format(line) if self.line_format else line)
+            if len(lines) == count:
+                break
+        lines.reverse()
+        return lines
+
+    def rotated_paths(self):
+        """Returns the rotated files of the log, newest first; one being compressed is read uncompressed."""
+        rotated = {}
+        for path in glob.glob(glob.escape(self.path) + ".[0-9]*"):
+            name = path[:-3] if path.endswith(".gz") else path
+            if name not in rotated or path == name:
+                rotated[name] = path
+        return [rotated[name] for name in sorted(rotated, key=self._rotation_order, reverse=True)]
+
+    def _rotation_order(self, name):
+        # <path>.<date>-<time>, with -<n> appended when several rotations fall in the same second
+        parts = name[len(self.path) + 1:].split("-")
+        return parts[:2], int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+
+    def _reverse_lines(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            f = None
+        # Listed after opening, so a rotation in between repeats lines rather than losing them
+        rotated_paths = self.rotated_paths()
+        if f is not None:
+            with f:
+                yield from self._reverse_file_lines(f)
+        for path in rotated_paths:
+            try:
+                with (gzip.open if path.endswith(".gz") else open)(path, 'rb') as f:
+                    yield from self._reverse_file_lines(f)
+            except FileNotFoundError:
+                continue  # Compressed or removed since it was listed
+
+    def _reverse_file_lines(self, f):
+        if isinstance(f, gzip.GzipFile):
+            # Seeking backwards in a gzip stream decompresses it again, rotated files are small enough to read at once
+            for part in reversed(f.read().split(b"\n")):
+                if part:
+                    yield part.decode('utf-8', errors='replace')
+            return
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            size = min(READ_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size) + remainder
+            parts = block.split(b"\n")
+            remainder = parts[0]
+            for part in reversed(parts[1:]):
+                if part:
+                    yield part.decode('utf-8', errors='replace')
+        if remainder:
+            yield remainder.decode('utf-8', errors='replace')
+
+
+class VirtualList(tk.Frame):
+    """Scrollable list that only keeps the visible rows in the Tk widget.
+
+    The newest `capacity` entries are held in a ring buffer. Scrolling above the
+    oldest of them pages older entries in from `history` (a FileHistory), up to
+    another `capacity` entries, which are released again once the view goes back
+    to the newest entry.
+    """
+
+    def __init__(self, master, width=30, height=10, capacity=5000, history=None, page_size=200):
+        super().__init__(master)
+        self.height = height
+        self.capacity = capacity
+        self.history = history
+        self.page_size = page_size
+        self.entries = RingBuffer(capacity)
+        self.older = []  # Entries paged in from history, oldest first
+        self.history_exhausted = False
+        self.top = 0  # Index of the first visible row
+        self.follow = True  # Stick to the newest entry while new ones arrive
+
+        self.listbox = tk.Listbox(self, width=width, height=height)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.listbox.pack(side=tk.LEFT, fill="both", expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill="y")
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.listbox.bind(sequence, self.on_mouse_wheel)
+
+    def __len__(self):
+        return len(self.older) + len(self.entries)
+
+    def get(self, index):
+        if index < len(self.older):
+            return self.older[index]
+        return self.entries[index - len(self.older)]
+
+    def append(self, items):
+        for item in items:
+            if len(self.entries) == self.capacity:
+                evicted = self.entries[0]
+                if self.older:
+                    # Keep paged-in history contiguous with the ring buffer
+                    self.older.append(evicted)
+                else:
+                    self.top -= 1
+            self.entries.append(item)
+        if len(self.older) > self.capacity:
+            trimmed = len(self.older) - self.capacity
+            del self.older[:trimmed]
+            self.top -= trimmed
+        if self.follow:
+            self.release_history()
+            self.top = max(0, len(self) - self.height)
+        else:
+            # Keep the rows the user is reading in place
+            self.top = max(0, min(self.top, len(self) - self.height))
+        self.render()
+
+    def release_history(self):
+        self.older = []
+        self.history_exhausted = False
+
+    def page_in_history(self):
+        """Loads one page of older entries in front of the list and returns how many were loaded."""
+        if not self.history or self.history_exhausted or len(self.older) >= self.capacity:
+            return 0
+        page = self.history.read_before(len(self), self.page_size)
+        if len(page) < self.page_size:
+            self.history_exhausted = True
+        self.older = page + self.older
+        return len(page)
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, len(self) - self.height))
+        self.follow = self.top >= len(self) - self.height
+        if self.follow:
+            self.release_history()
+            self.top = max(0, len(self) - self.height)
+        self.render()
+
+    def scroll_by(self, rows):
+        top = self.top + rows
+        if top < 0:
+            top += self.page_in_history()
+        self.scroll_to(top)
+
+    def yview(self, *args):
+        if args[0] == tk.MOVETO:
+            top = int(float(args[1]) * len(self))
+            # Dragging to the very top asks for the previous page of history
+            self.scroll_by(top - self.top if top > 0 else -self.top - 1)
+        elif args[0] == tk.SCROLL:
+            amount = int(args[1])
+            self.scroll_by(amount * self.height if args[2] == tk.PAGES else amount)
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll_by(-3)
+        else:
+            self.scroll_by(3)
+        return "break"
+
+    def render(self):
+        end = min(len(self), self.top + self.height)
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *[self.get(index) for index in range(self.top, end)])
+        if len(self):
+            self.scrollbar.set(self.top / len(self), end / len(self))
+        else:
+            self.scrollbar.set(0.0, 1.0)